@@ -0,0 +1,74 @@
+import { NextRequest } from "next/server";
+import { auth } from "@/app/(auth)/auth";
+import { getResearchTaskRecord } from "@/lib/db/queries";
+
+export async function POST(
+  _request: NextRequest,
+  context: { params: Promise<{ taskId: string }> }
+) {
+  const session = await auth();
+
+  if (!session?.user) {
+    return new Response(
+      JSON.stringify({
+        error: "Unauthorized: Please sign in to cancel research tasks",
+      }),
+      { status: 401, headers: { "Content-Type": "application/json" } }
+    );
+  }
+
+  const { taskId } = await context.params;
+
+  if (!taskId) {
+    return new Response(
+      JSON.stringify({ error: "Task id is required" }),
+      { status: 400, headers: { "Content-Type": "application/json" } }
+    );
+  }
+
+  const record = await getResearchTaskRecord({
+    taskId,
+    userId: session.user.id,
+  });
+
+  if (!record) {
+    return new Response(
+      JSON.stringify({ error: "Research task not found" }),
+      { status: 404, headers: { "Content-Type": "application/json" } }
+    );
+  }
+
+  const researchApiUrl =
+    process.env.RESEARCH_API_URL || "http://localhost:8000";
+  const backendUrl = `${researchApiUrl}/api/research/tasks/${encodeURIComponent(
+    taskId
+  )}/cancel`;
+
+  try {
+    const backendResponse = await fetch(backendUrl, { method: "POST" });
+    const payload = await backendResponse.json().catch(() => ({}));
+
+    if (!backendResponse.ok) {
+      const detail =
+        typeof payload.error === "string"
+          ? payload.error
+          : backendResponse.statusText;
+      throw new Error(detail);
+    }
+
+    return new Response(JSON.stringify(payload), {
+      status: 200,
+      headers: { "Content-Type": "application/json" },
+    });
+  } catch (error) {
+    const errorMessage =
+      error instanceof Error ? error.message : "Unknown error";
+    return new Response(
+      JSON.stringify({
+        error: "Failed to cancel research task",
+        message: errorMessage,
+      }),
+      { status: 502, headers: { "Content-Type": "application/json" } }
+    );
+  }
+}
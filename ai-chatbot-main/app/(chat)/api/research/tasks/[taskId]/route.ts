@@ -1,9 +1,12 @@
 import { NextRequest } from "next/server";
 import { auth } from "@/app/(auth)/auth";
-import { getResearchTaskRecord } from "@/lib/db/queries";
+import {
+  getResearchTaskEvents,
+  getResearchTaskRecord,
+} from "@/lib/db/queries";
 
 export async function GET(
-  _request: NextRequest,
+  request: NextRequest,
   context: { params: Promise<{ taskId: string }> }
 ) {
   const session = await auth();
@@ -38,12 +41,21 @@ export async function GET(
     );
   }
 
+  // Queued tasks store events in research_task_events; `after` is the
+  // seq cursor (progress.lastEventSeq from the previous poll).
+  const after = Number(request.nextUrl.searchParams.get("after") ?? 0) || 0;
+  const events = await getResearchTaskEvents({ taskId, afterSeq: after });
+  const progress =
+    events.length > 0 || after > 0
+      ? { ...(record.progress ?? {}), events }
+      : record.progress;
+
   return new Response(
     JSON.stringify({
       taskId: record.taskId,
       status: record.status,
       topic: record.topic,
-      progress: record.progress,
+      progress,
       report: record.report,
       userId: record.userId,
       chatId: record.chatId,
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS "research_task_events" (
+	"id" bigserial PRIMARY KEY NOT NULL,
+	"task_id" varchar NOT NULL,
+	"seq" integer NOT NULL,
+	"type" varchar NOT NULL,
+	"message" text,
+	"data" jsonb,
+	"created_at" timestamp DEFAULT now() NOT NULL,
+	CONSTRAINT "uq_research_task_events_task_seq" UNIQUE("task_id","seq")
+);
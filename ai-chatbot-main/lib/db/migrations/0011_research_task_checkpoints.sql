@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS "research_task_checkpoints" (
+	"id" serial PRIMARY KEY NOT NULL,
+	"task_id" varchar NOT NULL,
+	"step_index" integer NOT NULL,
+	"step_title" text NOT NULL,
+	"step_desc" text,
+	"output" text,
+	"created_at" timestamp DEFAULT now() NOT NULL,
+	CONSTRAINT "uq_research_task_checkpoints_task_step" UNIQUE("task_id","step_index")
+);
@@ -32,6 +32,7 @@ import {
   user,
   vote,
   researchTask,
+  researchTaskEvent,
 } from "./schema";
 import { generateHashedPassword } from "./utils";
 
@@ -398,6 +399,40 @@ export async function getResearchTaskRecord({
   }
 }
 
+export async function getResearchTaskEvents({
+  taskId,
+  afterSeq = 0,
+}: {
+  taskId: string;
+  afterSeq?: number;
+}): Promise<Array<ResearchTaskProgressEvent & { seq: number }>> {
+  try {
+    const rows = await db
+      .select()
+      .from(researchTaskEvent)
+      .where(
+        and(
+          eq(researchTaskEvent.taskId, taskId),
+          gt(researchTaskEvent.seq, afterSeq)
+        )
+      )
+      .orderBy(asc(researchTaskEvent.seq));
+
+    return rows.map((row) => ({
+      ...(row.data ?? {}),
+      type: row.type,
+      message: row.message ?? "",
+      timestamp: row.createdAt.toISOString(),
+      seq: row.seq,
+    }));
+  } catch (_error) {
+    throw new ChatSDKError(
+      "bad_request:database",
+      "Failed to fetch research task events"
+    );
+  }
+}
+
 export async function updateResearchTaskRecord({
   taskId,
   status,
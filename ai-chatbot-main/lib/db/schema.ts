@@ -1,13 +1,17 @@
 import type { InferSelectModel } from "drizzle-orm";
 import {
+  bigserial,
   boolean,
   foreignKey,
+  integer,
   json,
   jsonb,
   pgTable,
   primaryKey,
+  serial,
   text,
   timestamp,
+  unique,
   uuid,
   varchar,
 } from "drizzle-orm/pg-core";
@@ -189,8 +193,12 @@ export const researchTask = pgTable("research_tasks", {
   }).notNull().default("queued"),
   progress: jsonb("progress").$type<{
     currentStep?: string;
+    currentSteps?: string[];
     totalSteps?: number;
     completedSteps?: number;
+    lastEventSeq?: number;
+    plan?: string[];
+    planDependencies?: number[][];
     events?: Array<{
       type: string;
       message: string;
@@ -214,3 +222,51 @@ export const researchTask = pgTable("research_tasks", {
 });
 
 export type ResearchTask = InferSelectModel<typeof researchTask>;
+
+// Research task events - one row per event, written by the Python worker.
+// progress.lastEventSeq holds the latest seq; readers fetch by seq cursor.
+export const researchTaskEvent = pgTable(
+  "research_task_events",
+  {
+    id: bigserial("id", { mode: "number" }).primaryKey(),
+    taskId: varchar("task_id").notNull(),
+    seq: integer("seq").notNull(),
+    type: varchar("type").notNull(),
+    message: text("message"),
+    data: jsonb("data").$type<Record<string, unknown> | null>(),
+    createdAt: timestamp("created_at").notNull().defaultNow(),
+  },
+  (table) => ({
+    taskSeqUnique: unique("uq_research_task_events_task_seq").on(
+      table.taskId,
+      table.seq
+    ),
+  })
+);
+
+export type ResearchTaskEvent = InferSelectModel<typeof researchTaskEvent>;
+
+// Research task checkpoints - one row per completed step, written by the Python worker.
+// Resumed tasks reuse progress.plan and skip the steps that already have a checkpoint.
+export const researchTaskCheckpoint = pgTable(
+  "research_task_checkpoints",
+  {
+    id: serial("id").primaryKey(),
+    taskId: varchar("task_id").notNull(),
+    stepIndex: integer("step_index").notNull(),
+    stepTitle: text("step_title").notNull(),
+    stepDesc: text("step_desc"),
+    output: text("output"),
+    createdAt: timestamp("created_at").notNull().defaultNow(),
+  },
+  (table) => ({
+    taskStepUnique: unique("uq_research_task_checkpoints_task_step").on(
+      table.taskId,
+      table.stepIndex
+    ),
+  })
+);
+
+export type ResearchTaskCheckpoint = InferSelectModel<
+  typeof researchTaskCheckpoint
+>;
@@ -12,13 +12,14 @@ from __future__ import annotations
 
 import os
 import uuid
+import asyncio
+import contextvars
 import json
 import threading
 import logging
 import traceback
 from datetime import datetime
-from queue import Queue
-from typing import Optional, Literal, Dict, Any
+from typing import Optional, Literal, Dict, Any, List
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
@@ -26,11 +27,43 @@ from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, ValidationError
 from sqlalchemy import create_engine, Column, Text, DateTime, String
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import sessionmaker, declarative_base, object_session
 from sqlalchemy.dialects.postgresql import UUID as PGUUID, JSONB
 from dotenv import load_dotenv
 
-from src.planning_agent import planner_agent, executor_agent_step
+from src.planning_agent import REQUIRED_FIRST_STEP, planner_agent, executor_agent_step
+from src.task_queue import LEASE_LOST, create_task_queue, holds_lease
+from src.cancellation import (
+    CancellationToken,
+    TaskCancelledError,
+    cancel_task,
+    cancellation_scope,
+    register_task,
+    unregister_task,
+    wait_future,
+)
+from src.task_events import EventBase, append_event, clear_events, fetch_events
+from src.task_checkpoints import (
+    CheckpointBase,
+    clear_checkpoints,
+    load_checkpoint_map,
+    save_checkpoint,
+)
+from src.plan_dag import (
+    PlanDagExecutor,
+    PlanStepError,
+    linear_dependencies,
+    normalize_dependencies,
+    reusable_steps,
+)
+from src.progress_writer import PendingUpdate, ProgressWriter
+from src.worker_pool import ResearchWorkerPool
+from src.agent_executor import (
+    get_agent_executor,
+    run_in_agent_executor,
+    shutdown_agent_executor,
+)
+from src.pdf_extractor import shutdown_pdf_extractor
 from src.api_models import ApiResponse, ResearchRequest, HealthResponse, ModelInfo
 from src.sse import (
     format_sse_event,
@@ -40,7 +73,8 @@ from src.sse import (
     create_plan_event,
     create_progress_event,
     create_done_event,
-    create_error_event
+    create_error_event,
+    create_sse_heartbeat
 )
 from fastapi.responses import StreamingResponse
 
@@ -71,68 +105,66 @@ Base = declarative_base()
 engine = create_engine(DATABASE_URL, echo=False, future=True)
 SessionLocal = sessionmaker(bind=engine)
 
-research_task_queue: Queue = Queue()
-worker_thread: Optional[threading.Thread] = None
-worker_stop_event = threading.Event()
+# 研究任务队列（默认基于 research_tasks 表，所有进程共享同一个积压队列）
+task_queue = create_task_queue(engine)
+worker_pool: Optional[ResearchWorkerPool] = None
 
 
 def default_progress() -> Dict[str, Any]:
+    # 事件保存在 research_task_events 表中，progress 只保留计数器
     return {
         "currentStep": None,
         "totalSteps": None,
         "completedSteps": 0,
-        "events": [],
+        "lastEventSeq": 0,
     }
 
 
 def ensure_progress(task: ResearchTask) -> Dict[str, Any]:
-    progress = task.progress or {}
-    if not isinstance(progress, dict):
-        progress = {}
-    events = progress.get("events", [])
-    if not isinstance(events, list):
-        events = list(events) if events else []
-    progress["events"] = events
+    # 复制一份再赋值：原地修改同一个 dict 不会被 SQLAlchemy 识别为变更
+    progress = dict(task.progress or {}) if isinstance(task.progress, dict) else {}
+    # 旧版本把事件整体保存在 progress["events"] 中，写入时不再保留
+    progress.pop("events", None)
     progress.setdefault("currentStep", None)
     progress.setdefault("totalSteps", None)
     progress.setdefault("completedSteps", 0)
+    progress.setdefault("lastEventSeq", 0)
     task.progress = progress
     return progress
 
 
 def ensure_queue_info(task: "ResearchTask") -> Dict[str, Any]:
-    queue_info = task.queue_info or {}
-    if not isinstance(queue_info, dict):
-        queue_info = {}
+    queue_info = dict(task.queue_info or {}) if isinstance(task.queue_info, dict) else {}
     task.queue_info = queue_info
     return queue_info
 
 
 def add_event(task: ResearchTask, event_type: str, message: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     progress = ensure_progress(task)
-    event = {
-        "type": event_type,
-        "message": message,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-    }
-    if extra:
-        event.update(extra)
-    progress["events"].append(event)
+    event = append_event(
+        object_session(task), task.task_id, progress, event_type, message, extra
+    )
     task.progress = progress
     task.updated_at = datetime.utcnow()
     return event
 
 
-def serialize_progress(progress: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+def serialize_progress(
+    progress: Optional[Dict[str, Any]],
+    events: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
     if not progress or not isinstance(progress, dict):
-        return default_progress()
-    events = progress.get("events", [])
-    if not isinstance(events, list):
-        events = list(events)
+        progress = default_progress()
+    if events is None:
+        # 兼容旧数据：事件仍保存在 progress["events"] 中的任务
+        legacy_events = progress.get("events", [])
+        events = list(legacy_events) if isinstance(legacy_events, list) else []
     return {
         "currentStep": progress.get("currentStep"),
+        "currentSteps": progress.get("currentSteps") or [],
         "totalSteps": progress.get("totalSteps"),
         "completedSteps": progress.get("completedSteps", 0),
+        "lastEventSeq": progress.get("lastEventSeq", len(events)),
         "events": events,
     }
 
@@ -152,20 +184,159 @@ def serialize_queue_info(queue_info: Optional[Dict[str, Any]]) -> Dict[str, Any]
     return sanitized
 
 
+def flush_task_update(task_id: str, update: PendingUpdate) -> None:
+    """在一个事务中写入某个任务合并后的进度更新（ProgressWriter 的写入函数）"""
+    session = SessionLocal()
+    try:
+        task: Optional[ResearchTask] = (
+            session.query(ResearchTask)
+            .filter(ResearchTask.task_id == task_id)
+            .with_for_update()
+            .one_or_none()
+        )
+        if not task:
+            logger.warning(f"ResearchTask {task_id} not found, dropping progress update.")
+            return
+
+        owner = task_owners.get(task_id)
+        if owner is not None and not holds_lease(task.status, task.queue_info, owner):
+            # 租约已丢失（任务被重新排队或由其他 worker 认领）：丢弃更新并停止本地执行，
+            # 不能覆盖新执行者的状态
+            logger.warning(
+                f"⚠️ 任务 {task_id} 已不属于 {owner}（status={task.status}），丢弃本地进度更新"
+            )
+            cancel_task(task_id, LEASE_LOST)
+            return
+
+        if task.status == "cancelled":
+            # 任务已被取消（可能由其他进程处理取消请求）：通知本进程内的执行并保留取消状态
+            cancel_task(task_id, "cancelled")
+            if update.fields.get("status") != "cancelled":
+                update.fields.pop("status", None)
+
+        progress = ensure_progress(task)
+        for event_type, message, extra, created_at in update.events:
+            append_event(session, task_id, progress, event_type, message, extra, created_at)
+        progress.update(update.progress)
+        task.progress = progress
+
+        if update.queue_info:
+            queue_info = ensure_queue_info(task)
+            queue_info.update(update.queue_info)
+            task.queue_info = queue_info
+
+        for field, value in update.fields.items():
+            setattr(task, field, value)
+        task.updated_at = datetime.utcnow()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# 进度更新批量写入：步骤进度按间隔合并写入，状态转换同步写入
+progress_writer = ProgressWriter(flush_task_update)
+
+# 本进程内执行中任务的 worker ID：flush_task_update 只在该 worker 仍持有租约时写入
+task_owners: Dict[str, str] = {}
+
+# 规划调用进行时提前执行固定的第一步（Tavily 广泛搜索），规划延迟不再位于关键路径上
+SPECULATIVE_FIRST_STEP = os.getenv("SPECULATIVE_FIRST_STEP", "true").lower() in ("1", "true", "yes")
+
+# 要求规划模型声明步骤依赖，独立的步骤并发执行（关闭时按线性顺序执行）
+PLANNER_DEPENDENCIES = os.getenv("PLANNER_DEPENDENCIES", "false").lower() in ("1", "true", "yes")
+
+
+def generate_plan(prompt: str, model: Optional[str]) -> tuple:
+    """
+    生成计划和步骤依赖
+
+    返回:
+        (steps, dependencies)；未开启 PLANNER_DEPENDENCIES 时为线性依赖
+    """
+    if PLANNER_DEPENDENCIES:
+        return planner_agent(prompt, model=model, with_dependencies=True)
+    steps = planner_agent(prompt, model=model)
+    return steps, linear_dependencies(len(steps))
+
+
+def plan_with_speculative_first_step(
+    task_id: str, prompt: str, model: Optional[str]
+) -> tuple:
+    """
+    在代理线程池中生成计划，同时在当前线程执行固定的第一步
+
+    _ensure_contract 保证计划的第一步总是 REQUIRED_FIRST_STEP，且第一步没有历史记录，
+    因此它的输入与计划无关。第一步完成后再等待计划（第二步开始前汇合）。
+
+    返回:
+        (steps, dependencies, first_result)；first_result 为 executor_agent_step 的返回值，
+        计划第一步不一致时为 None（结果丢弃，按计划重新执行）
+    """
+    # 复制上下文：规划线程与当前任务共享取消令牌
+    ctx = contextvars.copy_context()
+    plan_future = get_agent_executor().submit(ctx.run, generate_plan, prompt, model)
+
+    progress_writer.add_event(
+        task_id, "progress", REQUIRED_FIRST_STEP, {"step": 1, "speculative": True}
+    )
+    progress_writer.update_progress(
+        task_id, currentStep=REQUIRED_FIRST_STEP, currentSteps=[REQUIRED_FIRST_STEP]
+    )
+    first_result = executor_agent_step(REQUIRED_FIRST_STEP, [], prompt)
+
+    steps, dependencies = wait_future(plan_future)
+    if not steps or steps[0] != REQUIRED_FIRST_STEP:
+        logger.warning(f"Task {task_id}: plan does not start with the fixed step, discarding speculative result")
+        return steps, dependencies, None
+    return steps, dependencies, first_result
+
+
+def persist_checkpoint(
+    task_id: str, step_index: int, step_title: str, step_desc: str, output: str
+) -> None:
+    """步骤完成后立即写入检查点（同步提交，进程崩溃后可从下一步恢复）"""
+    session = SessionLocal()
+    try:
+        save_checkpoint(session, task_id, step_index, step_title, step_desc, output)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 def run_research_task(queue_item: Dict[str, Any]) -> None:
     task_id = queue_item.get("task_id")
-    prompt = queue_item.get("prompt")
-    model = queue_item.get("model")
 
     if not task_id:
         logger.error("Queue item missing task_id, skipping execution")
         return
 
+    # 取消令牌：取消接口通过 cancel_task 发出信号，代理、工具循环和 ModelAdapter 在检查点退出
+    token = register_task(task_id)
+    try:
+        with cancellation_scope(token):
+            _execute_research_task(queue_item, token)
+    finally:
+        task_owners.pop(task_id, None)
+        unregister_task(task_id, token)
+
+
+def _execute_research_task(queue_item: Dict[str, Any], token: CancellationToken) -> None:
+    task_id = queue_item.get("task_id")
+    prompt = queue_item.get("prompt")
+    model = queue_item.get("model")
+
     session = SessionLocal()
     try:
         task: Optional[ResearchTask] = (
             session.query(ResearchTask)
             .filter(ResearchTask.task_id == task_id)
+            .with_for_update()
             .one_or_none()
         )
 
@@ -173,6 +344,10 @@ def run_research_task(queue_item: Dict[str, Any]) -> None:
             logger.error(f"ResearchTask with task_id {task_id} not found, skipping execution.")
             return
 
+        if task.status == "cancelled" or token.cancelled:
+            logger.info(f"Task {task_id} was cancelled before it started, skipping execution.")
+            return
+
         if prompt:
             task.topic = prompt
         prompt_to_use = task.topic
@@ -188,7 +363,9 @@ def run_research_task(queue_item: Dict[str, Any]) -> None:
         if "enqueuedAt" not in queue_info:
             queue_info["enqueuedAt"] = datetime.utcnow().isoformat() + "Z"
         queue_info["startedAt"] = datetime.utcnow().isoformat() + "Z"
-        queue_info["workerId"] = threading.current_thread().name
+        queue_info["workerId"] = (
+            queue_item.get("worker_id") or threading.current_thread().name
+        )
         retry_count = queue_info.get("retryCount", 0)
         if not isinstance(retry_count, int):
             try:
@@ -198,126 +375,183 @@ def run_research_task(queue_item: Dict[str, Any]) -> None:
         queue_info["retryCount"] = retry_count
         task.queue_info = queue_info
 
+        # 恢复：已保存的计划和依赖闭包全部完成的步骤检查点可以直接复用
+        progress = ensure_progress(task)
+        saved_plan = progress.get("plan") if isinstance(progress.get("plan"), list) else None
+        saved_dependencies = None
+        completed: Dict[int, list] = {}
+        if saved_plan:
+            saved_dependencies = normalize_dependencies(
+                len(saved_plan), progress.get("planDependencies")
+            )
+            completed = reusable_steps(
+                saved_dependencies, load_checkpoint_map(session, task_id, saved_plan)
+            )
+
+        # 状态转换 running：立即提交
         task.status = "running"
-        ensure_progress(task)
-        add_event(task, "start", "Research started", {"prompt": prompt_to_use})
+        start_extra: Dict[str, Any] = {"prompt": prompt_to_use}
+        if completed:
+            start_extra["resumeFromStep"] = (
+                min(set(range(len(saved_plan))) - set(completed), default=len(saved_plan)) + 1
+            )
+        add_event(task, "start", "Research started", start_extra)
         task.started_at = datetime.utcnow()
         session.commit()
+        task_owners[task_id] = queue_info["workerId"]
+    finally:
+        session.close()
+
+    # 之后的所有写入都经过 progress_writer，避免与 ORM 对象上的旧值互相覆盖
+    try:
+        if saved_plan:
+            steps, dependencies = saved_plan, saved_dependencies
+            logger.info(
+                f"Task {task_id}: resuming with {len(completed)}/{len(steps)} steps completed"
+            )
+            progress_writer.add_event(
+                task_id,
+                "plan",
+                "Research plan restored",
+                {"steps": steps, "completedSteps": len(completed)},
+            )
+        else:
+            first_result = None
+            if SPECULATIVE_FIRST_STEP:
+                steps, dependencies, first_result = plan_with_speculative_first_step(
+                    task_id, prompt_to_use, model
+                )
+            else:
+                steps, dependencies = generate_plan(prompt_to_use, model)
+            progress_writer.add_event(
+                task_id,
+                "plan",
+                "Research plan generated",
+                {"steps": steps, "dependencies": dependencies},
+            )
+            # 计划必须先于第一个检查点持久化，否则检查点无法对应到步骤
+            progress_writer.update_progress(task_id, plan=steps, planDependencies=dependencies)
+            progress_writer.flush(task_id)
+            if first_result is not None:
+                step_desc, agent_name, output = first_result
+                completed[0] = [steps[0], step_desc, output]
+                persist_checkpoint(task_id, 0, steps[0], step_desc, output)
+                logger.info(
+                    f"Task {task_id}: step 1/{len(steps)} completed speculatively using {agent_name}"
+                )
+            token.raise_if_cancelled()
+        progress_writer.update_progress(
+            task_id,
+            totalSteps=len(steps),
+            completedSteps=len(completed),
+            currentStep=None,
+            currentSteps=[],
+        )
 
-        execution_history = []
+        # 按依赖执行剩余步骤：依赖已完成的步骤并发执行，每个步骤只看到其依赖的输出；
+        # 没有声明依赖时按线性顺序执行（与逐步执行相同）
+        done_steps = set(completed)
 
-        steps = planner_agent(prompt_to_use, model=model)
-        add_event(task, "plan", "Research plan generated", {"steps": steps})
-        progress = ensure_progress(task)
-        progress["totalSteps"] = len(steps)
-        progress["completedSteps"] = 0
-        progress["currentStep"] = None
-        task.progress = progress
-        session.commit()
+        def run_step(index: int, history: list) -> tuple:
+            return executor_agent_step(steps[index], history, prompt_to_use)
 
-        for index, step_title in enumerate(steps):
-            step_number = index + 1
-            add_event(
-                task,
+        def on_step_start(index: int, running: List[int]) -> None:
+            progress_writer.add_event(
+                task_id,
                 "progress",
-                step_title,
-                {"step": step_number, "total": len(steps)},
+                steps[index],
+                {"step": index + 1, "total": len(steps), "running": [r + 1 for r in running]},
+            )
+            progress_writer.update_progress(
+                task_id,
+                currentStep=steps[index],
+                currentSteps=[steps[r] for r in running],
             )
-            progress = ensure_progress(task)
-            progress["completedSteps"] = step_number
-            progress["currentStep"] = step_title
-            task.progress = progress
-            session.commit()
 
-            step_desc, agent_name, output = executor_agent_step(
-                step_title, execution_history, prompt_to_use
+        def on_step_complete(index: int, entry: list, agent_name: str, running: List[int]) -> None:
+            # 已完成的步骤都有检查点，取消或崩溃后重新排队时直接复用
+            persist_checkpoint(task_id, index, *entry)
+            done_steps.add(index)
+            progress_writer.update_progress(
+                task_id,
+                completedSteps=len(done_steps),
+                currentStep=steps[running[-1]] if running else None,
+                currentSteps=[steps[r] for r in running],
             )
-            execution_history.append([step_title, step_desc, output])
             logger.info(
-                f"Task {task_id}: step {step_number}/{len(steps)} completed using {agent_name}"
+                f"Task {task_id}: step {index + 1}/{len(steps)} completed using {agent_name}"
             )
 
+        results = PlanDagExecutor(
+            steps,
+            dependencies,
+            run_step,
+            on_start=on_step_start,
+            on_complete=on_step_complete,
+        ).run(completed)
+        execution_history = [results[index] for index in range(len(steps))]
+
         final_report = (
             execution_history[-1][2] if execution_history else "未生成报告。"
         )
 
-        add_event(task, "done", "Research completed", {"report": final_report})
-        progress = ensure_progress(task)
-        progress["completedSteps"] = progress.get("totalSteps") or len(steps)
-        progress["currentStep"] = None
-        task.progress = progress
-        task.status = "completed"
-        task.report = final_report
-        queue_info = ensure_queue_info(task)
-        queue_info["finishedAt"] = datetime.utcnow().isoformat() + "Z"
-        task.queue_info = queue_info
-        task.completed_at = datetime.utcnow()
-        task.updated_at = datetime.utcnow()
-        session.commit()
+        # 状态转换 completed：连同未写入的进度一起同步提交
+        progress_writer.transition(
+            task_id,
+            "completed",
+            event=("done", "Research completed", {"report": final_report}),
+            progress={"completedSteps": len(steps), "currentStep": None, "currentSteps": []},
+            queue_info={"finishedAt": datetime.utcnow().isoformat() + "Z"},
+            report=final_report,
+            completed_at=datetime.utcnow(),
+        )
         logger.info(f"Task {task_id} completed successfully.")
 
+    except TaskCancelledError as exc:
+        logger.info(f"🛑 Task {task_id} cancelled: {exc}")
+        try:
+            progress_writer.transition(
+                task_id,
+                "cancelled",
+                event=("cancelled", "Research cancelled", {"reason": str(exc)}),
+                progress={"currentStep": None, "currentSteps": []},
+                queue_info={"cancelledAt": datetime.utcnow().isoformat() + "Z"},
+            )
+        except Exception as flush_exc:
+            logger.error(f"Task {task_id}: failed to record cancellation: {flush_exc}")
+            progress_writer.discard(task_id)
+
     except Exception as exc:
         logger.error(f"Task {task_id} failed: {exc}")
         logger.error(traceback.format_exc())
-        session.rollback()
-        task = (
-            session.query(ResearchTask)
-            .filter(ResearchTask.task_id == task_id)
-            .one_or_none()
-        )
-        if task:
-            ensure_progress(task)
-            add_event(task, "error", f"Task failed: {exc}")
-            progress = ensure_progress(task)
-            progress["currentStep"] = None
-            task.progress = progress
-            task.status = "failed"
-            queue_info = ensure_queue_info(task)
-            queue_info["failedAt"] = datetime.utcnow().isoformat() + "Z"
-            task.queue_info = queue_info
-            task.failed_at = datetime.utcnow()
-            task.updated_at = datetime.utcnow()
-            session.commit()
-    finally:
-        session.close()
-
-
-def worker_loop() -> None:
-    logger.info("Research worker started.")
-    while not worker_stop_event.is_set():
         try:
-            queue_item = research_task_queue.get()
-            if queue_item is None:
-                research_task_queue.task_done()
-                break
-            run_research_task(queue_item)
-        except Exception as exc:
-            logger.error(f"Unexpected error in worker loop: {exc}")
-            logger.error(traceback.format_exc())
-        finally:
-            research_task_queue.task_done()
-    logger.info("Research worker stopped.")
+            progress_writer.transition(
+                task_id,
+                "failed",
+                event=("error", f"Task failed: {exc}", None),
+                progress={"currentStep": None, "currentSteps": []},
+                queue_info={"failedAt": datetime.utcnow().isoformat() + "Z"},
+                failed_at=datetime.utcnow(),
+            )
+        except Exception as flush_exc:
+            logger.error(f"Task {task_id}: failed to record failure: {flush_exc}")
+            progress_writer.discard(task_id)
 
 
 def start_worker() -> None:
-    global worker_thread
-    if worker_thread and worker_thread.is_alive():
+    global worker_pool
+    if worker_pool and worker_pool.is_running():
         return
-    worker_stop_event.clear()
-    worker_thread = threading.Thread(
-        target=worker_loop, name="ResearchWorker", daemon=True
-    )
-    worker_thread.start()
+    worker_pool = ResearchWorkerPool(task_queue, run_research_task)
+    worker_pool.start()
 
 
 def stop_worker() -> None:
-    global worker_thread
-    if worker_thread and worker_thread.is_alive():
-        worker_stop_event.set()
-        research_task_queue.put(None)
-        worker_thread.join(timeout=5)
-        logger.info("Research worker thread joined.")
-        worker_thread = None
+    global worker_pool
+    if worker_pool and worker_pool.is_running():
+        worker_pool.stop()
+        logger.info("Research worker pool drained.")
+        worker_pool = None
 
 
 
@@ -362,6 +596,8 @@ class ResearchTask(Base):
 # 创建数据库表（如果不存在）
 try:
     Base.metadata.create_all(bind=engine)
+    EventBase.metadata.create_all(bind=engine)
+    CheckpointBase.metadata.create_all(bind=engine)
     logger.info("✅ 数据库表初始化完成")
 except Exception as e:
     logger.error(f"❌ 数据库创建失败: {e}")
@@ -383,6 +619,9 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     stop_worker()
+    progress_writer.stop()
+    shutdown_agent_executor()
+    shutdown_pdf_extractor()
 
 # === Phase 2: 配置 CORS 中间件（更严格的配置）===
 # 从环境变量读取允许的来源，如果未设置则使用默认值
@@ -513,6 +752,15 @@ templates = Jinja2Templates(directory="templates")
 # 内存中的任务进度跟踪字典
 task_progress = {}
 
+# SSE 心跳间隔（秒）：长时间运行的步骤期间保持连接活跃
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+
+# 任务事件 SSE 流轮询 research_task_events 的间隔（秒）
+TASK_EVENTS_POLL_INTERVAL = float(os.getenv("TASK_EVENTS_POLL_INTERVAL", "1"))
+
+# 终态：到达后事件流结束
+TERMINAL_TASK_STATUSES = {"completed", "failed", "cancelled"}
+
 
 class PromptRequest(BaseModel):
     """请求模型 - 用户提交的研究主题"""
@@ -526,6 +774,8 @@ class QueueResearchTaskRequest(BaseModel):
     taskId: str
     prompt: Optional[str] = None
     model: Optional[str] = None
+    # True 时丢弃已保存的计划和步骤检查点，从规划重新开始
+    restart: bool = False
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -575,6 +825,7 @@ async def enqueue_research_task(request: QueueResearchTaskRequest):
         task: Optional[ResearchTask] = (
             session.query(ResearchTask)
             .filter(ResearchTask.task_id == request.taskId)
+            .with_for_update()
             .one_or_none()
         )
         if not task:
@@ -585,10 +836,24 @@ async def enqueue_research_task(request: QueueResearchTaskRequest):
             raise HTTPException(status_code=400, detail="Prompt is required")
 
         previous_status = task.status
+        # 已完成的任务或主题变化时重新开始；否则保留计划和检查点，从第一个未完成的步骤继续
+        restart = request.restart or previous_status == "completed" or prompt != task.topic
+        progress = default_progress()
+        if restart:
+            clear_checkpoints(session, task.task_id)
+        else:
+            saved_progress = ensure_progress(task)
+            saved_plan = saved_progress.get("plan")
+            if isinstance(saved_plan, list) and saved_plan:
+                progress["plan"] = saved_plan
+                if saved_progress.get("planDependencies") is not None:
+                    progress["planDependencies"] = saved_progress["planDependencies"]
+
+        clear_events(session, task.task_id)
         task.topic = prompt
         task.status = "queued"
         task.report = None
-        task.progress = default_progress()
+        task.progress = progress
         task.started_at = None
         task.completed_at = None
         task.failed_at = None
@@ -613,17 +878,65 @@ async def enqueue_research_task(request: QueueResearchTaskRequest):
     finally:
         session.close()
 
-    research_task_queue.put(
-        {"task_id": request.taskId, "prompt": prompt, "model": request.model}
-    )
+    task_queue.enqueue(request.taskId, prompt=prompt, model=request.model)
     logger.info(f"Task {request.taskId} enqueued for execution.")
     return {"taskId": request.taskId, "status": "queued"}
 
 
+@app.post("/api/research/tasks/{task_id}/cancel")
+async def cancel_research_task(task_id: str):
+    """
+    取消研究任务
+
+    - 排队中的任务：移出队列并直接标记为 cancelled
+    - 执行中的任务：标记为 cancelled 并向执行它的 worker 发出取消信号，
+      worker 在下一个检查点（步骤之间、工具调用之间、重试之间）退出并记录 cancelled 事件；
+      在其他进程中执行的任务通过租约心跳或下一次进度写入发现取消
+    - 已结束的任务：不做修改，返回当前状态
+    """
+    session = SessionLocal()
+    try:
+        task: Optional[ResearchTask] = (
+            session.query(ResearchTask)
+            .filter(ResearchTask.task_id == task_id)
+            .with_for_update()
+            .one_or_none()
+        )
+        if not task:
+            raise HTTPException(status_code=404, detail="Research task not found")
+
+        if task.status in TERMINAL_TASK_STATUSES:
+            return {"taskId": task_id, "status": task.status}
+
+        previous_status = task.status
+        task.status = "cancelled"
+        queue_info = ensure_queue_info(task)
+        queue_info.pop("availableAt", None)
+        queue_info["cancelledAt"] = datetime.utcnow().isoformat() + "Z"
+        task.queue_info = queue_info
+        if previous_status != "running":
+            add_event(task, "cancelled", "Task cancelled before execution")
+        session.commit()
+    finally:
+        session.close()
+
+    task_queue.remove(task_id)
+    signalled = cancel_task(task_id, "cancelled by user")
+    logger.info(
+        f"🛑 Task {task_id} cancelled (previous status: {previous_status}, "
+        f"running locally: {signalled})."
+    )
+    return {"taskId": task_id, "status": "cancelled"}
+
+
 @app.get("/api/research/tasks/{task_id}")
-async def get_research_task_status(task_id: str):
+async def get_research_task_status(task_id: str, after: int = 0):
     """
     查询研究任务最新状态
+
+    参数:
+        after: 事件游标，只返回序号大于该值的事件（0 表示返回全部事件）；
+            轮询方传入上次响应中的 progress.lastEventSeq 即可增量获取
     """
     session = SessionLocal()
     try:
@@ -635,7 +948,10 @@ async def get_research_task_status(task_id: str):
         if not task:
             raise HTTPException(status_code=404, detail="Research task not found")
 
-        progress = serialize_progress(task.progress)
+        events = fetch_events(session, task_id, after_seq=after)
+        if not events and after == 0 and isinstance(task.progress, dict) and "events" in task.progress:
+            events = None  # 旧数据：事件仍在 progress 中
+        progress = serialize_progress(task.progress, events)
         queue_info = serialize_queue_info(task.queue_info)
         created_at = (
             task.created_at.isoformat() + "Z" if task.created_at else None
@@ -670,6 +986,64 @@ async def get_research_task_status(task_id: str):
         session.close()
 
 
+def read_task_events(task_id: str, after: int) -> tuple:
+    """读取任务状态和游标之后的事件，返回 (status, events)；任务不存在时 status 为 None"""
+    session = SessionLocal()
+    try:
+        task_status = (
+            session.query(ResearchTask.status)
+            .filter(ResearchTask.task_id == task_id)
+            .scalar()
+        )
+        if task_status is None:
+            return None, []
+        # 先读状态再读事件：终态与最后的事件在同一事务中提交，此时一定能读到
+        return task_status, fetch_events(session, task_id, after_seq=after)
+    finally:
+        session.close()
+
+
+@app.get("/api/research/tasks/{task_id}/events")
+async def stream_research_task_events(task_id: str, after: int = 0):
+    """
+    以 SSE 推送排队任务的事件（从 research_task_events 表按游标读取）
+
+    事件名为事件类型（queued, start, plan, progress, done, error ...），
+    data 中的 seq 可作为断线重连时的 after 参数。任务到达终态后流结束。
+
+    参数:
+        after: 事件游标，只推送序号大于该值的事件
+    """
+    # 短小的数据库查询不经过代理线程池：长时间运行的代理占满线程池时事件流也不会停顿
+    task_status, _ = await asyncio.to_thread(read_task_events, task_id, after)
+    if task_status is None:
+        raise HTTPException(status_code=404, detail="Research task not found")
+
+    async def event_generator():
+        cursor = after
+        idle = 0.0
+        while True:
+            task_status, events = await asyncio.to_thread(read_task_events, task_id, cursor)
+            for event in events:
+                cursor = event["seq"]
+                yield format_sse_event(event["type"], event)
+
+            if task_status is None or task_status in TERMINAL_TASK_STATUSES:
+                break
+
+            idle = 0.0 if events else idle + TASK_EVENTS_POLL_INTERVAL
+            if idle >= SSE_HEARTBEAT_INTERVAL:
+                yield create_sse_heartbeat()
+                idle = 0.0
+            await asyncio.sleep(TASK_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=get_sse_headers()
+    )
+
+
 # === Phase 2: 标准化 API 接口 ===
 
 @app.get("/api/health", response_model=ApiResponse)
@@ -1139,85 +1513,149 @@ async def research_stream(request: ResearchRequest):
         - 不使用数据库（减少延迟，符合 MVP 原则）
         - 不保存历史（客户端负责记录）
         - 使用异步生成器（async generator）
+        - 代理调用在有界线程池中执行，事件通过 asyncio.Queue 推送，
+          单个流不会阻塞事件循环，多个流可以共享同一个 worker 进程
         - 错误时不关闭连接（客户端控制）
     """
     logger.info(f"🚀 SSE 流式研究请求: {request.prompt[:50]}...")
 
-    async def event_generator():
+    async def run_pipeline(channel: asyncio.Queue):
         """
-        异步事件生成器
+        研究流水线（生产者）
 
-        使用 async generator 逐步生成 SSE 事件。
-        这允许：
-        1. 非阻塞执行
-        2. 实时推送事件
-        3. 自动清理资源
+        阻塞的代理调用在代理线程池中执行，事件循环不被占用；
+        生成的 SSE 事件通过 channel 推送给 event_generator。
         """
+        loop = asyncio.get_running_loop()
+        # 客户端断开时通过取消令牌停止线程中仍在执行的步骤
+        token = CancellationToken()
+
+        def with_token(func, *args, **kwargs):
+            with cancellation_scope(token):
+                return func(*args, **kwargs)
+
+        def emit(event: str) -> None:
+            """从代理线程推送事件（按调用顺序进入 channel）"""
+            loop.call_soon_threadsafe(channel.put_nowait, event)
+
+        speculative_first = None
         try:
             # === 1. START 事件 ===
             logger.info("📤 发送 START 事件")
-            yield create_start_event(request.prompt)
+            await channel.put(create_start_event(request.prompt))
 
             # === 2. PLAN 事件 - 调用 planner_agent ===
+            # 规划的同时提前执行固定的第一步（第一步没有历史记录，输入与计划无关）
+            if SPECULATIVE_FIRST_STEP:
+                speculative_first = get_agent_executor().submit(
+                    with_token, executor_agent_step, REQUIRED_FIRST_STEP, [], request.prompt
+                )
             logger.info("🧠 调用 planner_agent 生成执行计划")
             try:
-                steps = planner_agent(
-                    request.prompt,
-                    model=request.model
+                steps, dependencies = await run_in_agent_executor(
+                    with_token, generate_plan, request.prompt, request.model
                 )
                 logger.info(f"✅ 生成了 {len(steps)} 个执行步骤")
             except Exception as e:
                 logger.error(f"❌ planner_agent 失败: {e}")
-                yield create_error_event(f"Failed to generate plan: {str(e)}")
+                await channel.put(create_error_event(f"Failed to generate plan: {str(e)}"))
                 return
 
-            logger.info("📤 发送 PLAN 事件")
-            yield create_plan_event(steps)
-
-            # === 3. 执行步骤循环 ===
-            execution_history = []
+            use_speculative = speculative_first is not None and bool(steps) and steps[0] == REQUIRED_FIRST_STEP
 
-            for i, step_title in enumerate(steps):
-                step_number = i + 1
-                logger.info(f"📤 发送 PROGRESS 事件: {step_number}/{len(steps)}")
-                yield create_progress_event(
-                    step=step_number,
+            logger.info("📤 发送 PLAN 事件")
+            await channel.put(create_plan_event(steps))
+
+            # === 3. 按依赖执行步骤（无依赖声明时为线性顺序）===
+            def run_step(index: int, history: list) -> tuple:
+                if index == 0 and use_speculative:
+                    return wait_future(speculative_first)
+                return executor_agent_step(steps[index], history, request.prompt)
+
+            def on_step_start(index: int, running: List[int]) -> None:
+                logger.info(f"📤 发送 PROGRESS 事件: {index + 1}/{len(steps)}")
+                emit(create_progress_event(
+                    step=index + 1,
                     total=len(steps),
-                    message=step_title
+                    message=steps[index]
+                ))
+
+            def on_step_complete(index: int, entry: list, agent_name: str, running: List[int]) -> None:
+                logger.info(
+                    f"✅ 步骤 {index + 1} 完成，"
+                    f"使用代理: {agent_name}，"
+                    f"输出长度: {len(entry[2])} 字符"
                 )
 
-                logger.info(f"⚙️  执行步骤 {step_number}: {step_title[:50]}...")
-                try:
-                    step_desc, agent_name, output = executor_agent_step(
-                        step_title,
-                        execution_history,
-                        request.prompt
-                    )
-                    execution_history.append([step_title, step_desc, output])
-                    logger.info(
-                        f"✅ 步骤 {step_number} 完成，"
-                        f"使用代理: {agent_name}，"
-                        f"输出长度: {len(output)} 字符"
-                    )
-                except Exception as e:
-                    logger.error(f"❌ 步骤 {step_number} 执行失败: {e}")
-                    yield create_error_event(
-                        message=f"Step {step_number} failed: {str(e)}",
-                        step=step_number
-                    )
-                    return
+            try:
+                results = await run_in_agent_executor(
+                    with_token,
+                    PlanDagExecutor(
+                        steps,
+                        dependencies,
+                        run_step,
+                        on_start=on_step_start,
+                        on_complete=on_step_complete,
+                    ).run,
+                )
+            except PlanStepError as e:
+                step_number = e.step_index + 1
+                logger.error(f"❌ 步骤 {step_number} 执行失败: {e.error}")
+                await channel.put(create_error_event(
+                    message=f"Step {step_number} failed: {str(e.error)}",
+                    step=step_number
+                ))
+                return
+            execution_history = [results[index] for index in range(len(steps))]
 
             if execution_history:
                 final_report = execution_history[-1][2]
                 logger.info(f"📤 发送 DONE 事件，报告长度: {len(final_report)} 字符")
-                yield create_done_event(final_report)
+                await channel.put(create_done_event(final_report))
             else:
                 logger.warning("⚠️ 执行历史为空，无法生成报告")
-                yield create_error_event("No report generated")
+                await channel.put(create_error_event("No report generated"))
 
+        except asyncio.CancelledError:
+            logger.info("🔌 SSE 客户端已断开，停止后续步骤")
+            token.cancel("client disconnected")
+            raise
         except Exception as e:
             logger.error(f"❌ SSE 生成器发生未处理的异常: {e}\n{traceback.format_exc()}")
-            yield create_error_event(f"Internal error: {str(e)}")
+            await channel.put(create_error_event(f"Internal error: {str(e)}"))
+        finally:
+            # 规划失败或客户端断开时不再需要提前执行的第一步
+            if speculative_first is not None:
+                speculative_first.cancel()
+            await channel.put(None)
+
+    async def event_generator():
+        """
+        异步事件生成器（消费者）
+
+        从 channel 读取流水线产生的事件并推送给客户端。
+        这允许：
+        1. 非阻塞执行（代理在线程池中运行）
+        2. 实时推送事件，长时间无事件时发送心跳保持连接
+        3. 客户端断开时取消流水线，不再启动后续步骤
+        """
+        channel: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(run_pipeline(channel))
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        channel.get(), timeout=SSE_HEARTBEAT_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield create_sse_heartbeat()
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            if not producer.done():
+                producer.cancel()
 
     # 返回 StreamingResponse
     return StreamingResponse(
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+分块吞吐量基准测试
+
+用途：
+- 对比原来的整段分块（split + 逐段/逐句 estimate_tokens）与流式分块 iter_chunks 的吞吐量
+- 流式分块分别测试整个字符串输入和按块读取文件两种方式
+- 校验两种实现的分块结果完全一致
+
+运行方法：
+    python scripts/benchmark_chunking.py                 # 1MB、10MB、100MB
+    python scripts/benchmark_chunking.py --sizes 1 10    # 指定大小（MB）
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.chunking import ChunkingProcessor
+from src.model_adapter import ModelAdapter
+
+READ_BLOCK_CHARS = 1 << 20
+
+
+def legacy_chunk_by_semantic(processor: ChunkingProcessor, text: str) -> list:
+    """原来的分块实现（对照组）"""
+    chunks, current_chunk, current_tokens = [], [], 0
+    for para in text.split('\n\n'):
+        para_tokens = ModelAdapter.estimate_tokens(para)
+        if current_tokens + para_tokens > processor.max_chunk_size and current_chunk:
+            chunks.append('\n\n'.join(current_chunk))
+            current_chunk, current_tokens = [], 0
+        if para_tokens > processor.max_chunk_size:
+            chunks.extend(legacy_split_long_paragraph(processor, para))
+        else:
+            current_chunk.append(para)
+            current_tokens += para_tokens
+    if current_chunk:
+        chunks.append('\n\n'.join(current_chunk))
+    return chunks
+
+
+def legacy_split_long_paragraph(processor: ChunkingProcessor, para: str) -> list:
+    """原来的超长段落分割实现（对照组，保留最后一个句末标点之后的内容）"""
+    sentences = re.split(r'([.!?。！？])\s+', para)
+    full_sentences = [sentences[i] + sentences[i + 1] for i in range(0, len(sentences) - 1, 2)]
+    if sentences[-1]:
+        full_sentences.append(sentences[-1])
+    if len(full_sentences) <= 1:
+        chunk_chars = processor.max_chunk_size * 4
+        return [para[i:i + chunk_chars] for i in range(0, len(para), chunk_chars)]
+    chunks, current_chunk, current_tokens = [], [], 0
+    for sent in full_sentences:
+        sent_tokens = ModelAdapter.estimate_tokens(sent)
+        if current_tokens + sent_tokens > processor.max_chunk_size and current_chunk:
+            chunks.append(' '.join(current_chunk))
+            current_chunk, current_tokens = [], 0
+        current_chunk.append(sent)
+        current_tokens += sent_tokens
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+    return chunks
+
+
+def make_corpus(size_bytes: int, seed: int = 42) -> str:
+    """生成中英文混合、含超长段落的测试文本（类似 PDF 导出的文本）"""
+    rng = random.Random(seed)
+    english = "Quantum error correction improves logical qubit fidelity by 12.5% per cycle."
+    chinese = "量子纠错技术在每个周期内提升了逻辑量子比特的保真度。"
+    paragraphs = []
+    # 预先生成一批段落，循环拼接到目标大小
+    for i in range(200):
+        kind = rng.random()
+        if kind < 0.05:
+            # 超长段落（按句子分割）
+            para = " ".join([english] * rng.randint(2000, 4000))
+        elif kind < 0.07:
+            # 没有句子边界的超长段落（按固定长度分割）
+            para = "x" * rng.randint(30000, 60000)
+        elif kind < 0.4:
+            para = chinese * rng.randint(3, 40)
+        else:
+            para = " ".join([english] * rng.randint(3, 30))
+        paragraphs.append(f"Section {i}. {para}")
+    block = '\n\n'.join(paragraphs)
+    repeats = size_bytes // len(block.encode('utf-8')) + 1
+    text = '\n\n'.join([block] * repeats)
+    # 按字节数截断到目标大小附近
+    return text.encode('utf-8')[:size_bytes].decode('utf-8', errors='ignore')
+
+
+def _read_blocks(path: str):
+    with open(path, encoding='utf-8') as f:
+        while True:
+            block = f.read(READ_BLOCK_CHARS)
+            if not block:
+                return
+            yield block
+
+
+def _measure(label: str, size_mb: float, func) -> list:
+    start = time.perf_counter()
+    chunks = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<24} {elapsed:8.2f}s  {size_mb / elapsed:8.1f} MB/s  {len(chunks)} 块")
+    return chunks
+
+
+def run(sizes_mb: list, max_chunk_size: int) -> None:
+    processor = ChunkingProcessor(max_chunk_size=max_chunk_size)
+    for size_mb in sizes_mb:
+        print(f"\n📊 {size_mb}MB（max_chunk_size={max_chunk_size}）")
+        text = make_corpus(int(size_mb * 1024 * 1024))
+
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as f:
+            f.write(text)
+            path = f.name
+        try:
+            legacy = _measure("原实现 (split)", size_mb, lambda: legacy_chunk_by_semantic(processor, text))
+            streamed = _measure("iter_chunks (字符串)", size_mb, lambda: list(processor.iter_chunks(text)))
+            # 文件输入：逐块计数而不保留分块结果，对应有界内存的用法
+            _measure(
+                "iter_chunks (文件)",
+                size_mb,
+                lambda: [None for _ in processor.iter_chunks(_read_blocks(path))],
+            )
+        finally:
+            os.remove(path)
+
+        if streamed != legacy:
+            print("  ❌ 分块结果与原实现不一致")
+            sys.exit(1)
+        print("  ✅ 分块结果与原实现一致")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分块吞吐量基准测试")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 100], help="输入大小（MB）")
+    parser.add_argument("--max-chunk-size", type=int, default=6000, help="单个块的最大 token 数")
+    args = parser.parse_args()
+    run(args.sizes, args.max_chunk_size)
+
+
+if __name__ == "__main__":
+    main()
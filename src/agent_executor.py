@@ -0,0 +1,81 @@
+"""
+代理执行器模块 - 在事件循环之外运行阻塞的代理调用
+
+本模块提供：
+1. get_agent_executor: 获取有界的共享线程池
+2. run_in_agent_executor: 在线程池中运行阻塞函数并异步等待结果
+3. shutdown_agent_executor: 关闭线程池
+
+planner_agent / executor_agent_step 等代理是同步阻塞的（LLM 调用、搜索、PDF 下载），
+直接在 async 端点中调用会冻结整个 uvicorn 事件循环。通过该模块把它们放到
+有界线程池中执行，事件循环可以继续服务其他请求（包括 /api/health）。
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_agent_executor() -> ThreadPoolExecutor:
+    """
+    获取共享的代理线程池（懒加载）
+
+    线程数从 AGENT_EXECUTOR_THREADS 读取（默认: 32），超出的调用会排队等待。
+
+    Returns:
+        ThreadPoolExecutor 实例
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = int(os.getenv("AGENT_EXECUTOR_THREADS", "32"))
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="AgentExecutor"
+                )
+                logger.info(f"🧵 代理线程池已创建 (max_workers={max_workers})")
+    return _executor
+
+
+async def run_in_agent_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在代理线程池中运行阻塞函数
+
+    会复制当前的 contextvars 上下文，保证线程内可以读取调用方设置的上下文变量。
+
+    Args:
+        func: 阻塞函数
+        *args, **kwargs: 传给 func 的参数
+
+    Returns:
+        func 的返回值（异常会原样抛出）
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_agent_executor(), call)
+
+
+def shutdown_agent_executor(wait: bool = False) -> None:
+    """
+    关闭代理线程池
+
+    Args:
+        wait: 是否等待执行中的调用完成
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=True)
+            _executor = None
+            logger.info("🧵 代理线程池已关闭")
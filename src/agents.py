@@ -6,6 +6,7 @@
 3. editor_agent: 负责审阅和改进文稿
 """
 
+import os
 from datetime import datetime
 from urllib import response
 from aisuite import Client
@@ -15,9 +16,13 @@ from src.research_tools import (
     wikipedia_search_tool,
 )
 from src.config import ModelConfig
+from src.context_manager import create_manager_for_agent
 from src.cost_tracker import tracker
 from src.fallback import with_fallback
 from src.model_adapter import ModelAdapter
+from src.patch_editor import PATCH_INSTRUCTIONS, PatchApplyError, apply_edits, parse_edits
+from src.section_writer import parallel_sections_enabled, write_report_by_sections
+from src.tool_runner import run_tool_loop
 
 # 初始化 AI 客户端
 client = Client()
@@ -47,6 +52,11 @@ def research_agent(
     print(f"🔍 研究代理 (使用 {model})")
     print("==================================")
 
+    # 输入超过上下文阈值时先分块并行压缩（map），再执行研究（reduce）
+    prompt = create_manager_for_agent("research_agent", model).prepare_prompt(
+        prompt, agent_name="research_agent"
+    )
+
     # 构建完整的提示词，包含研究方法论和工具使用指南
     full_prompt = f"""
 You are an advanced research assistant with expertise in information retrieval and academic research methodology. Your mission is to gather comprehensive, accurate, and relevant information on any topic requested by the user.
@@ -111,19 +121,19 @@ USER RESEARCH REQUEST:
     tools = [arxiv_search_tool, tavily_search_tool, wikipedia_search_tool]
 
     try:
-        # 调用 AI 模型进行研究（使用 ModelAdapter 确保参数安全）
-        resp = ModelAdapter.safe_api_call(
+        # 调用 AI 模型进行研究（每轮通过 ModelAdapter 确保参数安全，同一轮的工具调用并发执行）
+        resp = run_tool_loop(
             client=client,
             model=model,
             messages=messages,
             tools=tools,
-            tool_choice="auto",  # 自动选择工具
             max_turns=5,  # 最多5轮对话
+            tool_choice="auto",  # 自动选择工具
             temperature=0.0,  # 使用确定性输出
         )
 
         # 追踪成本
-        if hasattr(resp, 'usage') and resp.usage:
+        if hasattr(resp, 'usage') and resp.usage and not getattr(resp, 'cache_hit', False):
             tracker.track(
                 model,
                 resp.usage.prompt_tokens,
@@ -203,6 +213,7 @@ def writer_agent(
     min_words_per_section: int = 400,
     max_tokens: int = None,  # 改为 None，让 ModelAdapter 自动处理
     retries: int = 1,
+    parallel_sections: bool = None,
 ):
     """
     写作代理 - 根据研究材料撰写学术报告
@@ -214,6 +225,8 @@ def writer_agent(
         min_words_per_section: 每个章节最少字数（默认: 400）
         max_tokens: 最大生成令牌数（默认: 15000）
         retries: 重试次数（默认: 1）
+        parallel_sections: 是否先生成大纲再并行撰写各章节
+            （默认: None, 从 WRITER_PARALLEL_SECTIONS 读取）
 
     返回:
         tuple: (报告内容, 消息历史)
@@ -221,11 +234,18 @@ def writer_agent(
     # 如果未指定模型，使用配置的默认模型
     if model is None:
         model = ModelConfig.WRITER_MODEL
+    if parallel_sections is None:
+        parallel_sections = parallel_sections_enabled()
 
     print("==================================")
     print(f"✍️ 写作代理 (使用 {model})")
     print("==================================")
 
+    # 输入超过上下文阈值时先分块并行压缩（map），再撰写报告（reduce）
+    prompt = create_manager_for_agent("writer_agent", model).prepare_prompt(
+        prompt, agent_name="writer_agent"
+    )
+
     # 系统消息：定义写作代理的角色和要求
     system_message = """
 You are an expert academic writer with a PhD-level understanding of scholarly communication. Your task is to synthesize research materials into a comprehensive, well-structured academic report.
@@ -303,7 +323,7 @@ INTERNAL CHECKLIST (DO NOT INCLUDE IN OUTPUT):
             **api_params
         )
         # 追踪成本
-        if hasattr(resp, 'usage') and resp.usage:
+        if hasattr(resp, 'usage') and resp.usage and not getattr(resp, 'cache_hit', False):
             tracker.track(
                 model,
                 resp.usage.prompt_tokens,
@@ -319,18 +339,62 @@ INTERNAL CHECKLIST (DO NOT INCLUDE IN OUTPUT):
         words = re.findall(r"\b\w+\b", md_text)
         return len(words)
 
-    # 生成报告内容
-    content = _call(messages)
+    # 生成报告内容（分章节模式下大纲无法生成时回退为一次性写作）
+    content = None
+    if parallel_sections:
+        content = write_report_by_sections(
+            prompt,
+            model=model,
+            system_message=system_message,
+            min_words_per_section=min_words_per_section,
+            max_tokens=max_tokens,
+        )
+    if content is None:
+        content = _call(messages)
 
     print("✅ Output:\n", content)
     return content, messages
 
 
+# === 编辑代理 ===
+# 编辑要求（整篇重写和补丁模式共用，输出格式分别由 EDITOR_FULL_TEXT_OUTPUT / PATCH_INSTRUCTIONS 指定）
+EDITOR_GUIDELINES = """
+You are a professional academic editor with expertise in improving scholarly writing across disciplines. Your task is to refine and elevate the quality of the academic text provided.
+
+## Your Editing Process:
+1. Analyze the overall structure, argument flow, and coherence of the text
+2. Ensure logical progression of ideas with clear topic sentences and transitions between paragraphs
+3. Improve clarity, precision, and conciseness of language while maintaining academic tone
+4. Verify technical accuracy (to the extent possible based on context)
+5. Enhance readability through appropriate formatting and organization
+
+## Specific Elements to Address:
+- Strengthen thesis statements and main arguments
+- Clarify complex concepts with additional explanations or examples where needed
+- Add relevant equations, diagrams, or illustrations (described in markdown) when they would enhance understanding
+- Ensure proper integration of evidence and maintain academic rigor
+- Standardize terminology and eliminate redundancies
+- Improve sentence variety and paragraph structure
+- Preserve all citations [1], [2], etc., and maintain the integrity of the References section
+
+## Formatting Guidelines:
+- Use markdown formatting consistently for headings, emphasis, lists, etc.
+- Structure content with appropriate section headings and subheadings
+- Format equations, tables, and figures according to academic standards
+""".strip()
+
+EDITOR_FULL_TEXT_OUTPUT = (
+    "Return only the revised, polished text in Markdown format without explanatory comments about your edits."
+)
+
+
 @with_fallback
 def editor_agent(
     prompt: str,
     model: str = None,
     target_min_words: int = 2400,
+    draft: str = None,
+    patch_mode: bool = None,
 ):
     """
     编辑代理 - 审阅和改进学术文稿
@@ -339,6 +403,9 @@ def editor_agent(
         prompt: 需要编辑的文稿内容
         model: 使用的 AI 模型（默认: None, 使用 ModelConfig.EDITOR_MODEL）
         target_min_words: 目标最少字数（默认: 2400）
+        draft: 最新草稿（补丁模式下修改应用到这份草稿）
+        patch_mode: 是否让模型只返回结构化修改
+            （默认: None, 从 EDITOR_PATCH_MODE 读取；没有 draft 时始终整篇重写）
 
     返回:
         tuple: (编辑后的内容, 消息历史)
@@ -346,38 +413,67 @@ def editor_agent(
     # 如果未指定模型，使用配置的默认模型
     if model is None:
         model = ModelConfig.EDITOR_MODEL
+    if patch_mode is None:
+        patch_mode = os.getenv("EDITOR_PATCH_MODE", "false").lower() in ("1", "true", "yes")
 
     print("==================================")
     print(f"📝 编辑代理 (使用 {model})")
     print("==================================")
 
-    # 系统消息：定义编辑代理的角色和编辑流程
-    system_message = """
-You are a professional academic editor with expertise in improving scholarly writing across disciplines. Your task is to refine and elevate the quality of the academic text provided.
-
-## Your Editing Process:
-1. Analyze the overall structure, argument flow, and coherence of the text
-2. Ensure logical progression of ideas with clear topic sentences and transitions between paragraphs
-3. Improve clarity, precision, and conciseness of language while maintaining academic tone
-4. Verify technical accuracy (to the extent possible based on context)
-5. Enhance readability through appropriate formatting and organization
-
-## Specific Elements to Address:
-- Strengthen thesis statements and main arguments
-- Clarify complex concepts with additional explanations or examples where needed
-- Add relevant equations, diagrams, or illustrations (described in markdown) when they would enhance understanding
-- Ensure proper integration of evidence and maintain academic rigor
-- Standardize terminology and eliminate redundancies
-- Improve sentence variety and paragraph structure
-- Preserve all citations [1], [2], etc., and maintain the integrity of the References section
+    # 输入超过上下文阈值时先分块并行压缩（map），再编辑（reduce）
+    manager = create_manager_for_agent("editor_agent", model)
+    if patch_mode and draft and manager.should_chunk(draft):
+        print("⚠️ 草稿本身超过上下文阈值，补丁模式改为整篇重写")
+        patch_mode = False
+    if patch_mode and draft:
+        # 补丁模式：修改要逐字匹配草稿，草稿不参与压缩；其余上下文在扣除草稿后的预算内压缩，
+        # 草稿只在末尾出现一次
+        context = prompt.replace(draft, "[LATEST DRAFT: see below]")
+        context = manager.prepare_prompt(
+            context, agent_name="editor_agent", reserved_text=draft
+        )
+        prompt = f"{context}\n\n📄 LATEST DRAFT (apply your edits to this text):\n{draft}"
+    else:
+        prompt = manager.prepare_prompt(prompt, agent_name="editor_agent")
 
-## Formatting Guidelines:
-- Use markdown formatting consistently for headings, emphasis, lists, etc.
-- Structure content with appropriate section headings and subheadings
-- Format equations, tables, and figures according to academic standards
+    # 系统消息：共用的编辑要求 + 输出格式（整篇重写或补丁）
+    system_message = f"{EDITOR_GUIDELINES}\n\n{EDITOR_FULL_TEXT_OUTPUT}"
 
-Return only the revised, polished text in Markdown format without explanatory comments about your edits.
-""".strip()
+    # 内部函数：调用 AI 模型
+    def _call(messages_):
+        # 使用 ModelAdapter 确保参数安全
+        response = ModelAdapter.safe_api_call(
+            client=client,
+            model=model,
+            messages=messages_,
+            temperature=0  # 确定性输出
+        )
+        # 追踪成本
+        if hasattr(response, 'usage') and response.usage and not getattr(response, 'cache_hit', False):
+            tracker.track(
+                model,
+                response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+                metadata={"agent": "editor_agent"}
+            )
+        return response.choices[0].message.content
+
+    # 补丁模式：模型只返回修改，在本地应用到草稿；无法应用时回退为整篇重写
+    if patch_mode and draft:
+        patch_messages = [
+            {"role": "system", "content": f"{EDITOR_GUIDELINES}\n\n{PATCH_INSTRUCTIONS}"},
+            {"role": "user", "content": prompt},
+        ]
+        raw = _call(patch_messages) or ""
+        edits = parse_edits(raw)
+        try:
+            if edits is None:
+                raise PatchApplyError("无法解析修改列表")
+            content = apply_edits(draft, edits)
+            print(f"✅ 应用了 {len(edits)} 处修改（补丁模式）")
+            return content, patch_messages
+        except PatchApplyError as e:
+            print(f"⚠️ 补丁无法应用，回退为整篇重写: {e}")
 
     # 准备消息列表
     messages = [
@@ -385,23 +481,7 @@ Return only the revised, polished text in Markdown format without explanatory co
         {"role": "user", "content": prompt},
     ]
 
-    # 调用 AI 模型进行编辑（使用 ModelAdapter 确保参数安全）
-    response = ModelAdapter.safe_api_call(
-        client=client,
-        model=model,
-        messages=messages,
-        temperature=0  # 确定性输出
-    )
-
-    # 追踪成本
-    if hasattr(response, 'usage') and response.usage:
-        tracker.track(
-            model,
-            response.usage.prompt_tokens,
-            response.usage.completion_tokens,
-            metadata={"agent": "editor_agent"}
-        )
-
-    content = response.choices[0].message.content
+    # 调用 AI 模型进行编辑
+    content = _call(messages)
     print("✅ 输出:\n", content)
     return content, messages
@@ -0,0 +1,176 @@
+"""
+任务取消模块 - 研究任务的协作式取消
+
+本模块提供：
+1. TaskCancelledError: 任务被取消时抛出的异常
+2. CancellationToken: 取消令牌（可在等待中被唤醒）
+3. cancellation_scope / check_cancelled: 通过上下文变量把令牌传给代理、工具循环和 ModelAdapter
+4. register_task / cancel_task: 按任务 ID 登记令牌，供取消接口发出信号
+
+被用户放弃的任务会继续占用 worker 并消耗 token。取消接口发出信号后，
+执行中的任务在以下位置检查令牌并尽快退出：
+- run_research_task 的步骤之间
+- research_agent 工具循环的每一轮之间（以及等待工具结果时）
+- ModelAdapter.safe_api_call 的重试之间（退避等待可被立即唤醒）
+
+TaskCancelledError 继承自 BaseException（与 asyncio.CancelledError 相同），
+代理中 "except Exception" 形式的兜底处理和模型降级不会吞掉取消。
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCancelledError(BaseException):
+    """任务已被取消"""
+
+
+class CancellationToken:
+    """取消令牌"""
+
+    def __init__(self, task_id: Optional[str] = None):
+        """
+        参数:
+            task_id: 关联的任务 ID（用于日志）
+        """
+        self.task_id = task_id
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """发出取消信号（重复调用只保留第一次的原因）"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        """已取消时抛出 TaskCancelledError"""
+        if self._event.is_set():
+            raise TaskCancelledError(self.reason or "cancelled")
+
+    def sleep(self, seconds: float) -> None:
+        """等待 seconds 秒，期间被取消则立即抛出 TaskCancelledError"""
+        if self._event.wait(max(0.0, seconds)):
+            raise TaskCancelledError(self.reason or "cancelled")
+
+
+_current_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+
+
+def current_token() -> Optional[CancellationToken]:
+    """当前上下文的取消令牌（不在任务中执行时为 None）"""
+    return _current_token.get()
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken):
+    """
+    在 with 块内把 token 设置为当前上下文的取消令牌
+
+    用法:
+        with cancellation_scope(token):
+            executor_agent_step(...)
+    """
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def check_cancelled() -> None:
+    """当前任务已被取消时抛出 TaskCancelledError（没有令牌时不做任何事）"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def cancellable_sleep(seconds: float) -> None:
+    """可被当前任务取消打断的 time.sleep"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def wait_future(future: Future, timeout: Optional[float] = None) -> Any:
+    """
+    等待 future 结果，期间定期检查当前任务是否被取消
+
+    检查间隔从 CANCEL_POLL_INTERVAL 读取（默认 0.5 秒）。
+
+    参数:
+        future: concurrent.futures.Future
+        timeout: 最长等待时间（秒，None 表示不限）
+
+    返回:
+        future 的结果（超时抛出 concurrent.futures.TimeoutError）
+    """
+    token = _current_token.get()
+    if token is None:
+        return future.result(timeout=timeout)
+
+    poll_interval = float(os.getenv("CANCEL_POLL_INTERVAL", "0.5"))
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        token.raise_if_cancelled()
+        wait = poll_interval
+        if deadline is not None:
+            wait = min(wait, max(0.0, deadline - time.monotonic()))
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
+
+
+# ===== 按任务 ID 登记的令牌 =====
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def register_task(task_id: str) -> CancellationToken:
+    """为开始执行的任务创建并登记取消令牌"""
+    token = CancellationToken(task_id)
+    with _tokens_lock:
+        _tokens[task_id] = token
+    return token
+
+
+def unregister_task(task_id: str, token: Optional[CancellationToken] = None) -> None:
+    """任务结束后注销令牌（传入 token 时只注销同一个令牌）"""
+    with _tokens_lock:
+        if token is None or _tokens.get(task_id) is token:
+            _tokens.pop(task_id, None)
+
+
+def cancel_task(task_id: str, reason: str = "cancelled") -> bool:
+    """
+    向本进程内正在执行的任务发出取消信号
+
+    返回:
+        True 表示任务在本进程内执行并已收到信号
+    """
+    with _tokens_lock:
+        token = _tokens.get(task_id)
+    if token is None:
+        return False
+    if not token.cancelled:
+        logger.info(f"🛑 任务 {task_id} 收到取消信号: {reason}")
+    token.cancel(reason)
+    return True
@@ -6,29 +6,98 @@
 2. 保持块间上下文连贯性（重叠区域）
 3. 智能合并处理结果
 4. 支持自定义块大小和重叠
+5. 有并发上限的线程池并行处理各块（结果保持原始顺序）
+6. 多层归约：各块结果合起来仍超出上下文窗口时，按批递归合并直到能放进一次调用
+7. 执行前预测多层归约的调用次数和 token 数
+8. 合并时去除相邻块边界处因重叠产生的重复内容
+9. 流式分块：单遍扫描、逐块产出，大文件分块时内存占用有界
 """
 
+import contextvars
 import logging
+import os
 import re
-from typing import List, Callable, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Callable, Dict, Any, Optional, Union
+from src.cancellation import wait_future
 from src.model_adapter import ModelAdapter
 
 logger = logging.getLogger(__name__)
 
+# 边界去重按"词"比较：忽略大小写、标点和空白差异（中文按单字）
+_WORD_RE = re.compile(r"[\u4e00-\u9fff]|[^\W_]+", re.UNICODE)
+# 与 ModelAdapter.estimate_tokens 统计中文字符的范围一致
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+# 句子结束：英文 . ! ? 或中文 。！？ 后跟空白
+_SENTENCE_END_RE = re.compile(r"([.!?。！？])\s+")
+_PARAGRAPH_SEP = '\n\n'
+
+
+def _span_tokens(length: int, chinese_chars: int) -> int:
+    """长度为 length、含 chinese_chars 个中文字符的文本的估算 token 数（同 estimate_tokens）"""
+    return int(((length - chinese_chars) / 4) + (chinese_chars / 1.5))
+
+
+def _iter_paragraphs(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """
+    逐段产出文本（与 text.split('\\n\\n') 的结果一致）
+
+    source 为可迭代的文本片段时，分隔符可能跨越片段边界；缓冲区只保留尚未结束的段落。
+    """
+    if isinstance(source, str):
+        start = 0
+        while True:
+            end = source.find(_PARAGRAPH_SEP, start)
+            if end == -1:
+                yield source[start:]
+                return
+            yield source[start:end]
+            start = end + len(_PARAGRAPH_SEP)
+
+    buffer = ''
+    for piece in source:
+        if not piece:
+            continue
+        # 从上一片段的最后一个字符开始查找，避免重复扫描缓冲区
+        search_from = max(0, len(buffer) - 1)
+        buffer += piece
+        start = 0
+        end = buffer.find(_PARAGRAPH_SEP, search_from)
+        while end != -1:
+            yield buffer[start:end]
+            start = end + len(_PARAGRAPH_SEP)
+            end = buffer.find(_PARAGRAPH_SEP, start)
+        if start:
+            buffer = buffer[start:]
+    yield buffer
+
 
 class ChunkingProcessor:
     """分块处理器 - 将长文本分块处理后合并"""
 
-    def __init__(self, max_chunk_size: int = 6000, overlap_size: int = 200):
+    def __init__(
+        self,
+        max_chunk_size: int = 6000,
+        overlap_size: int = 200,
+        max_workers: Optional[int] = None
+    ):
         """
         初始化分块处理器
 
         Args:
             max_chunk_size: 单个块的最大 token 数（默认: 6000）
             overlap_size: 块间重叠的 token 数（默认: 200）
+            max_workers: 并行处理的块数上限（None 表示从 CHUNK_MAX_CONCURRENCY 读取，默认: 4）
         """
         self.max_chunk_size = max_chunk_size
         self.overlap_size = overlap_size
+        self.last_removed_tokens = 0
+        self.max_workers = (
+            max_workers
+            if max_workers is not None
+            else int(os.getenv('CHUNK_MAX_CONCURRENCY', '4'))
+        )
 
     def chunk_by_semantic(self, text: str) -> List[str]:
         """
@@ -40,40 +109,47 @@ class ChunkingProcessor:
         Returns:
             分块后的文本列表
         """
-        # 1. 按段落分割（双换行）
-        paragraphs = text.split('\n\n')
+        chunks = list(self.iter_chunks(text))
+        logger.info(f"📦 文本分块完成: {len(chunks)} 块")
+        return chunks
+
+    def iter_chunks(self, source: Union[str, Iterable[str]]) -> Iterator[str]:
+        """
+        流式按语义边界分块（与 chunk_by_semantic 的分块边界完全一致）
 
-        chunks = []
-        current_chunk = []
+        逐段扫描一遍：每段的 token 数由中文字符数直接算出（与 ModelAdapter.estimate_tokens
+        的估算一致），超长段落用中文字符位置的累计偏移计算每个句子的 token 数，
+        不再对段落和句子反复调用 estimate_tokens。块在生成时逐个产出，
+        内存占用只与当前块和最长段落有关。
+
+        Args:
+            source: 文本，或按顺序产出文本片段的可迭代对象（如按块读取的文件）
+
+        Yields:
+            分块后的文本
+        """
+        current_chunk: List[str] = []
         current_tokens = 0
 
-        for para in paragraphs:
-            para_tokens = ModelAdapter.estimate_tokens(para)
+        for para in _iter_paragraphs(source):
+            para_tokens = _span_tokens(len(para), len(_CJK_RE.findall(para)))
 
-            # 如果加上这段会超出限制
-            if current_tokens + para_tokens > self.max_chunk_size:
-                # 保存当前块
-                if current_chunk:
-                    chunks.append('\n\n'.join(current_chunk))
-                    current_chunk = []
-                    current_tokens = 0
+            # 如果加上这段会超出限制，先产出当前块
+            if current_tokens + para_tokens > self.max_chunk_size and current_chunk:
+                yield '\n\n'.join(current_chunk)
+                current_chunk = []
+                current_tokens = 0
 
             # 如果单段就超了，强制分割
             if para_tokens > self.max_chunk_size:
-                sub_chunks = self._split_long_paragraph(para)
-                # 将子块添加到结果
-                for sub_chunk in sub_chunks:
-                    chunks.append(sub_chunk)
+                yield from self._iter_long_paragraph(para)
             else:
                 current_chunk.append(para)
                 current_tokens += para_tokens
 
         # 最后一块
         if current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
-
-        logger.info(f"📦 文本分块完成: {len(chunks)} 块")
-        return chunks
+            yield '\n\n'.join(current_chunk)
 
     def _split_long_paragraph(self, para: str) -> List[str]:
         """
@@ -85,46 +161,61 @@ class ChunkingProcessor:
         Returns:
             分割后的子块列表
         """
-        # 按句子分割（支持中英文）
-        # 英文: . ! ? 后跟空格
-        # 中文: 。！？
-        sentences = re.split(r'([.!?。！？])\s+', para)
-
-        # 重新组合句子和标点
-        full_sentences = []
-        for i in range(0, len(sentences) - 1, 2):
-            if i + 1 < len(sentences):
-                full_sentences.append(sentences[i] + sentences[i + 1])
-            else:
-                full_sentences.append(sentences[i])
+        return list(self._iter_long_paragraph(para))
+
+    def _iter_long_paragraph(self, para: str) -> Iterator[str]:
+        """
+        逐个产出超长段落的子块
+
+        句子边界: 英文 . ! ? 或中文 。！？ 后跟空白。最后一个句末标点之后的内容
+        （没有结束标点的最后一句）作为单独的句子保留。
+
+        Args:
+            para: 超长段落
+
+        Yields:
+            分割后的子块
+        """
+        spans = []
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(para):
+            spans.append((start, match.end(1)))
+            start = match.end()
+        if start < len(para):
+            spans.append((start, len(para)))
 
         # 如果没有成功分割，按固定长度强制分割
-        if len(full_sentences) <= 1:
+        if len(spans) <= 1:
             # 按字符数强制分割（估算 4 字符 = 1 token）
             chunk_chars = self.max_chunk_size * 4
-            return [para[i:i+chunk_chars] for i in range(0, len(para), chunk_chars)]
+            for i in range(0, len(para), chunk_chars):
+                yield para[i:i + chunk_chars]
+            return
+
+        # 中文字符位置：任意区间的中文字符数 = 两端在位置表中的二分位置之差
+        cjk_offsets = [match.start() for match in _CJK_RE.finditer(para)]
 
         # 按句子组合成块
-        chunks = []
-        current_chunk = []
+        current_chunk: List[str] = []
         current_tokens = 0
 
-        for sent in full_sentences:
-            sent_tokens = ModelAdapter.estimate_tokens(sent)
+        for sent_start, sent_end in spans:
+            if cjk_offsets:
+                chinese = bisect_left(cjk_offsets, sent_end) - bisect_left(cjk_offsets, sent_start)
+                sent_tokens = _span_tokens(sent_end - sent_start, chinese)
+            else:
+                sent_tokens = int((sent_end - sent_start) / 4)
 
-            if current_tokens + sent_tokens > self.max_chunk_size:
-                if current_chunk:
-                    chunks.append(' '.join(current_chunk))
-                    current_chunk = []
-                    current_tokens = 0
+            if current_tokens + sent_tokens > self.max_chunk_size and current_chunk:
+                yield ' '.join(current_chunk)
+                current_chunk = []
+                current_tokens = 0
 
-            current_chunk.append(sent)
+            current_chunk.append(para[sent_start:sent_end])
             current_tokens += sent_tokens
 
         if current_chunk:
-            chunks.append(' '.join(current_chunk))
-
-        return chunks
+            yield ' '.join(current_chunk)
 
     def process_with_context(
         self,
@@ -135,20 +226,20 @@ class ChunkingProcessor:
         """
         带上下文处理每个块
 
+        各块的提示互不依赖（前后文取自原始块），因此在线程池中并行处理，
+        同时处理的块数不超过 max_workers，结果按块的原始顺序返回。
+        总耗时约等于最慢的一批块，而不是所有块耗时之和。
+
         Args:
             chunks: 文本块列表
-            processor_func: 处理函数，接收文本返回处理结果
+            processor_func: 处理函数，接收文本返回处理结果（需要线程安全）
             show_progress: 是否显示进度（默认: True）
 
         Returns:
-            处理结果列表
+            处理结果列表（与 chunks 顺序一致）
         """
-        results = []
-
+        prompts = []
         for i, chunk in enumerate(chunks):
-            if show_progress:
-                logger.info(f"📝 处理块 {i+1}/{len(chunks)}...")
-
             # 构建上下文信息
             context_info = {
                 'position': f"{i+1}/{len(chunks)}",
@@ -159,13 +250,39 @@ class ChunkingProcessor:
             }
 
             # 构建带上下文的提示
-            prompt = self._build_chunk_prompt(chunk, context_info)
+            prompts.append(self._build_chunk_prompt(chunk, context_info))
 
-            # 处理
-            result = processor_func(prompt)
-            results.append(result)
+        return self._run_parallel(prompts, processor_func, show_progress, "处理块")
 
-        return results
+    def _run_parallel(
+        self,
+        prompts: List[str],
+        func: Callable[[str], str],
+        show_progress: bool,
+        label: str
+    ) -> List[str]:
+        """在并发上限内并行调用 func，结果按 prompts 的顺序返回"""
+        def _process(index: int, prompt: str) -> str:
+            if show_progress:
+                logger.info(f"📝 {label} {index+1}/{len(prompts)}...")
+            return func(prompt)
+
+        if len(prompts) <= 1 or self.max_workers <= 1:
+            return [_process(i, prompt) for i, prompt in enumerate(prompts)]
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(prompts)),
+            thread_name_prefix="ChunkWorker"
+        )
+        try:
+            futures = [
+                executor.submit(contextvars.copy_context().run, _process, i, prompt)
+                for i, prompt in enumerate(prompts)
+            ]
+            return [wait_future(future) for future in futures]
+        finally:
+            # 某个块失败或任务取消时不再启动排队中的块
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def _get_overlap(self, text: str, is_end: bool) -> str:
         """
@@ -227,10 +344,117 @@ class ChunkingProcessor:
 
         return '\n'.join(parts)
 
+    @staticmethod
+    def _boundary_overlap(
+        prev_words: List[str],
+        next_words: List[str],
+        min_similarity: float = 0.8,
+        min_words: int = 1
+    ) -> int:
+        """
+        prev 的后缀与 next 的前缀近似重合的词数（容许少量替换、插入和删除）
+
+        半全局编辑距离：prev 的起点任意、必须比对到 prev 结尾，next 从开头比对，
+        D[j] 为 next 前 j 个词与 prev 某个后缀的最小编辑距离。
+        满足相似度 1 - D[j] / j >= min_similarity 的 j 中，取 j - 2 * D[j] 最大者
+        （多比对一个不重合的词会让得分下降，重合区不会延伸到后面的新内容）。
+
+        Args:
+            prev_words: 前一块结尾的规范化词序列
+            next_words: 后一块开头的规范化词序列
+            min_similarity: 最低相似度（1.0 表示完全相同）
+            min_words: 最少重合词数
+
+        Returns:
+            next 开头属于重合区的词数（没有满足条件的重合时为 0）
+        """
+        if not prev_words or not next_words:
+            return 0
+
+        n = len(prev_words)
+        # column[i]: next 前 j 个词与 prev[:i] 某个后缀的编辑距离（j=0 时 prev 的起点任意，距离为 0）
+        column = [0] * (n + 1)
+        best, best_score = 0, 0
+        for j, word in enumerate(next_words, start=1):
+            previous = column
+            column = [j] + [0] * n
+            for i in range(1, n + 1):
+                column[i] = min(
+                    previous[i - 1] + (prev_words[i - 1] != word),
+                    previous[i] + 1,
+                    column[i - 1] + 1,
+                )
+            distance = column[n]
+            if j < min_words or 1 - distance / j < min_similarity:
+                continue
+            score = j - 2 * distance
+            if score >= best_score:
+                best, best_score = j, score
+        return best
+
+    def dedupe_boundaries(
+        self,
+        chunks: List[str],
+        min_overlap_words: int = 5,
+        window_words: Optional[int] = None,
+        min_similarity: float = 0.8
+    ) -> tuple:
+        """
+        去除相邻块边界处的重复内容
+
+        处理结果会重复前后块的重叠区域（overlap_size），合并后同样的内容出现两次；
+        模型通常会改写这部分内容，因此按近似重合判断。
+        对每对相邻块，在前一块结尾和后一块开头各 window_words 个词的范围内，
+        找出与前一块后缀近似相同的后一块前缀（_boundary_overlap），并从后一块开头删除。
+        比较的是规范化后的词（忽略大小写、标点和空白），少量词被替换、增删时仍视为重合；
+        重合不足 min_overlap_words 个词或相似度低于 min_similarity 时不删除，避免误删偶然相同的短语。
+        每对块只比较固定窗口，总耗时与块数成线性关系。
+
+        Args:
+            chunks: 处理后的文本块列表
+            min_overlap_words: 最少重合词数（默认: 5）
+            window_words: 比较窗口的词数（默认: overlap_size 的 2 倍，至少 50）
+            min_similarity: 最低相似度（1 - 编辑距离 / 重合词数，默认: 0.8）
+
+        Returns:
+            (去重后的块列表, 删除的估算 token 数)
+        """
+        window = window_words if window_words is not None else max(50, self.overlap_size * 2)
+        result = [chunks[0]] if chunks else []
+        removed_tokens = 0
+
+        for prev, current in zip(chunks, chunks[1:]):
+            prev_words = [m.group(0).lower() for m in _WORD_RE.finditer(prev[-window * 20:])][-window:]
+
+            head_matches = []
+            for match in _WORD_RE.finditer(current):
+                head_matches.append(match)
+                if len(head_matches) >= window:
+                    break
+            next_words = [m.group(0).lower() for m in head_matches]
+
+            overlap = self._boundary_overlap(
+                prev_words, next_words, min_similarity, min_overlap_words
+            )
+            if not overlap:
+                result.append(current)
+                continue
+
+            cut = head_matches[overlap - 1].end()
+            # 同时删除重复内容之后紧跟的标点和空白
+            trimmed = re.sub(r"^[^\w\u4e00-\u9fff\[#*(\-]*", "", current[cut:], count=1)
+            removed_tokens += ModelAdapter.estimate_tokens(current[: len(current) - len(trimmed)])
+            if trimmed.strip():
+                result.append(trimmed)
+
+        return result, removed_tokens
+
     def merge_chunks(self, chunks: List[str], remove_redundancy: bool = True) -> str:
         """
         合并处理后的块
 
+        去重后删除的 token 数记录在 self.last_removed_tokens 中。
+
         Args:
             chunks: 处理后的文本块列表
             remove_redundancy: 是否移除重叠区域的冗余内容（默认: True）
@@ -238,17 +462,23 @@ class ChunkingProcessor:
         Returns:
             合并后的文本
         """
+        self.last_removed_tokens = 0
+
         if not chunks:
             return ""
 
         if len(chunks) == 1:
             return chunks[0]
 
-        # 简单合并（用双换行连接）
-        # TODO: 未来可以实现更智能的合并，检测和移除重复内容
+        if remove_redundancy:
+            chunks, self.last_removed_tokens = self.dedupe_boundaries(chunks)
+
         merged = '\n\n'.join(chunks)
 
-        logger.info(f"✅ 合并完成: {len(chunks)} 块 → 1 个文档")
+        logger.info(
+            f"✅ 合并完成: {len(chunks)} 块 → 1 个文档"
+            f"（去除边界重复 {self.last_removed_tokens} tokens）"
+        )
         return merged
 
     def chunk_and_process(
@@ -281,3 +511,176 @@ class ChunkingProcessor:
 
         logger.info("🎉 分块处理完成")
         return final_result
+
+    @staticmethod
+    def reduce_budget(model: str, fill_ratio: float = 0.8) -> int:
+        """
+        单次归约调用可以容纳的输入 token 数
+
+        上下文窗口的 fill_ratio 减去为输出预留的 max_tokens。
+
+        Args:
+            model: 模型名称
+            fill_ratio: 上下文窗口的使用比例（默认: 0.8，与 CHUNKING_THRESHOLD 一致）
+
+        Returns:
+            输入 token 上限
+        """
+        limits = ModelAdapter.get_model_limits(model)
+        return max(1, int(limits['context_window'] * fill_ratio) - limits['max_tokens'])
+
+    @staticmethod
+    def _group_batches(token_counts: List[int], budget: int) -> List[List[int]]:
+        """按顺序把结果分成总 token 不超过 budget 的批（单个超出预算的结果独占一批）"""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for index, tokens in enumerate(token_counts):
+            if current and current_tokens + tokens > budget:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _build_reduce_prompt(self, parts: List[str], level: int, first: int) -> str:
+        """构建归约提示：按顺序列出要合并的部分"""
+        sections = [
+            f"[🧩 第 {first + i + 1} 部分]:\n{part}"
+            for i, part in enumerate(parts)
+        ]
+        return (
+            f"[📍 第 {level} 层合并: {len(parts)} 个部分]\n\n"
+            + "\n\n".join(sections)
+            + "\n\n请把以上各部分合并为一份连贯的结果，按原有顺序保留全部关键信息。"
+        )
+
+    def plan_hierarchical(
+        self,
+        text: str,
+        model: str,
+        expected_output_tokens: Optional[int] = None,
+        fill_ratio: float = 0.8
+    ) -> Dict[str, Any]:
+        """
+        预测多层归约的调用次数和 token 数（不调用模型）
+
+        假设每次调用输出 expected_output_tokens（不超过该次输入），
+        按 chunk_and_process_hierarchical 相同的分批规则逐层模拟。
+
+        Args:
+            text: 需要处理的文本
+            model: 模型名称
+            expected_output_tokens: 每次调用的预计输出 token 数
+                （默认: min(模型 max_tokens, max_chunk_size // 4)）
+            fill_ratio: 上下文窗口的使用比例
+
+        Returns:
+            {"levels": [{"level", "calls", "input_tokens", "output_tokens"}, ...],
+             "total_calls", "total_input_tokens", "total_output_tokens", "reduce_budget"}
+        """
+        limits = ModelAdapter.get_model_limits(model)
+        expected = (
+            expected_output_tokens
+            if expected_output_tokens is not None
+            else min(limits['max_tokens'], max(1, self.max_chunk_size // 4))
+        )
+        budget = self.reduce_budget(model, fill_ratio)
+
+        # 第 0 层：各块的输入包含前后文重叠
+        chunks = self.chunk_by_semantic(text)
+        inputs = []
+        for i, chunk in enumerate(chunks):
+            neighbours = (i > 0) + (i < len(chunks) - 1)
+            inputs.append(ModelAdapter.estimate_tokens(chunk) + self.overlap_size * neighbours)
+        outputs = [min(expected, tokens) for tokens in inputs]
+        levels = [{
+            'level': 0,
+            'calls': len(chunks),
+            'input_tokens': sum(inputs),
+            'output_tokens': sum(outputs),
+        }]
+
+        level = 1
+        while len(outputs) > 1 and sum(outputs) > budget:
+            batches = self._group_batches(outputs, budget)
+            if len(batches) == len(outputs):
+                # 每批只有一个结果，无法继续合并
+                break
+            inputs = [sum(outputs[i] for i in batch) for batch in batches]
+            outputs = [min(expected, tokens) for tokens in inputs]
+            levels.append({
+                'level': level,
+                'calls': len(batches),
+                'input_tokens': sum(inputs),
+                'output_tokens': sum(outputs),
+            })
+            level += 1
+
+        return {
+            'levels': levels,
+            'total_calls': sum(item['calls'] for item in levels),
+            'total_input_tokens': sum(item['input_tokens'] for item in levels),
+            'total_output_tokens': sum(item['output_tokens'] for item in levels),
+            'reduce_budget': budget,
+        }
+
+    def chunk_and_process_hierarchical(
+        self,
+        text: str,
+        processor_func: Callable[[str], str],
+        model: str,
+        reduce_func: Optional[Callable[[str], str]] = None,
+        show_progress: bool = True,
+        fill_ratio: float = 0.8,
+        max_levels: int = 5
+    ) -> str:
+        """
+        多层归约：分块 → 并行处理 → 按批并行合并（递归）→ 合并
+
+        各块结果合起来超过 reduce_budget 时，按顺序分成能放进一次调用的批，
+        每批用 reduce_func 合并为一个结果；同一层的各批并行处理，直到结果总量在预算内。
+
+        Args:
+            text: 需要处理的文本
+            processor_func: 第 0 层的处理函数
+            model: 模型名称（决定每批的 token 预算）
+            reduce_func: 合并函数（默认: processor_func）
+            show_progress: 是否显示进度
+            fill_ratio: 上下文窗口的使用比例
+            max_levels: 最多合并层数（防止结果无法缩小时无限递归）
+
+        Returns:
+            最终处理结果（各层结果按原始顺序排列）
+        """
+        reduce_func = reduce_func or processor_func
+        budget = self.reduce_budget(model, fill_ratio)
+        logger.info(
+            f"🌲 开始多层归约 (估算: {ModelAdapter.estimate_tokens(text)} tokens, "
+            f"每批预算 {budget} tokens)"
+        )
+
+        results = self.process_with_context(
+            self.chunk_by_semantic(text), processor_func, show_progress
+        )
+
+        for level in range(1, max_levels + 1):
+            token_counts = [ModelAdapter.estimate_tokens(result) for result in results]
+            if len(results) <= 1 or sum(token_counts) <= budget:
+                break
+            batches = self._group_batches(token_counts, budget)
+            if len(batches) == len(results):
+                logger.warning(f"⚠️ 第 {level} 层无法继续合并（单个结果超出预算）")
+                break
+            logger.info(f"🌲 第 {level} 层: {len(results)} 个结果 → {len(batches)} 批")
+            prompts = [
+                self._build_reduce_prompt([results[i] for i in batch], level, batch[0])
+                for batch in batches
+            ]
+            results = self._run_parallel(prompts, reduce_func, show_progress, f"第 {level} 层合并")
+
+        final_result = self.merge_chunks(results)
+        logger.info("🎉 多层归约完成")
+        return final_result
@@ -6,16 +6,62 @@
 2. 决定处理策略（直接/分块）
 3. 管理文本处理流程
 4. 支持配置化的阈值
+5. 超长的代理输入先分块并行压缩（map），再交给代理（reduce）
 """
 
 import logging
 import os
 from typing import Callable, Optional
+from aisuite import Client
 from src.model_adapter import ModelAdapter
 from src.chunking import ChunkingProcessor
+from src.cost_tracker import tracker
 
 logger = logging.getLogger(__name__)
 
+# 初始化 AI 客户端（用于压缩超长输入的分块）
+client = Client()
+
+# 压缩单个分块的指令：保留事实、数字、引用和链接，删掉冗余的叙述
+CONDENSE_INSTRUCTIONS = """
+The text below is one part of an input that is too long for a single model call.
+Condense it into dense notes for the next agent:
+- Keep every fact, number, date, name, inline citation [n], source title, URL and DOI verbatim.
+- Keep task instructions, headings and any draft text the next agent must edit as close to verbatim as possible.
+- Remove repetition, filler and tool-call noise.
+Output only the condensed notes.
+""".strip()
+
+
+def make_condenser(model: str, agent_name: str) -> Callable[[str], str]:
+    """
+    创建压缩单个分块的处理函数（供 ContextManager.prepare_prompt 使用）
+
+    Args:
+        model: 模型名称
+        agent_name: 代理名称（用于成本追踪）
+
+    Returns:
+        处理函数：接收分块提示，返回压缩后的笔记
+    """
+    def _condense(chunk_prompt: str) -> str:
+        resp = ModelAdapter.safe_api_call(
+            client=client,
+            model=model,
+            messages=[{"role": "user", "content": f"{CONDENSE_INSTRUCTIONS}\n\n{chunk_prompt}"}],
+            temperature=0,
+        )
+        if hasattr(resp, 'usage') and resp.usage and not getattr(resp, 'cache_hit', False):
+            tracker.track(
+                model,
+                resp.usage.prompt_tokens,
+                resp.usage.completion_tokens,
+                metadata={"agent": agent_name, "stage": "condense"}
+            )
+        return resp.choices[0].message.content or ""
+
+    return _condense
+
 
 class ContextManager:
     """上下文管理器 - 智能选择文本处理策略"""
@@ -26,7 +72,8 @@ class ContextManager:
         enable_chunking: bool = None,
         chunking_threshold: float = None,
         max_chunk_size: int = None,
-        chunk_overlap: int = None
+        chunk_overlap: int = None,
+        hierarchical: bool = None
     ):
         """
         初始化上下文管理器
@@ -37,6 +84,7 @@ class ContextManager:
             chunking_threshold: 分块阈值（上下文窗口的百分比，None 表示从环境变量读取）
             max_chunk_size: 最大块大小（None 表示从环境变量读取）
             chunk_overlap: 块重叠大小（None 表示从环境变量读取）
+            hierarchical: 分块结果超出上下文窗口时是否多层归约（None 表示从环境变量读取）
         """
         self.model = model
         self.limits = ModelAdapter.get_model_limits(model)
@@ -54,6 +102,12 @@ class ContextManager:
             else float(os.getenv('CHUNKING_THRESHOLD', '0.8'))
         )
 
+        self.hierarchical = (
+            hierarchical
+            if hierarchical is not None
+            else os.getenv('HIERARCHICAL_REDUCE', 'true').lower() == 'true'
+        )
+
         max_chunk_size = (
             max_chunk_size
             if max_chunk_size is not None
@@ -127,7 +181,8 @@ class ContextManager:
         text: str,
         processor_func: Callable[[str], str],
         force_chunking: bool = False,
-        show_progress: bool = True
+        show_progress: bool = True,
+        fill_ratio: Optional[float] = None
     ) -> str:
         """
         智能处理文本（自动选择策略）
@@ -137,6 +192,7 @@ class ContextManager:
             processor_func: 处理函数，接收文本返回处理结果
             force_chunking: 强制使用分块（默认: False）
             show_progress: 是否显示进度（默认: True）
+            fill_ratio: 多层归约结果可占用的上下文比例（默认: chunking_threshold）
 
         Returns:
             处理后的文本
@@ -150,14 +206,82 @@ class ContextManager:
             logger.info("📝 直接处理模式")
             return processor_func(text)
         else:
-            # 分块处理
+            # 分块处理（多层归约保证合并后的结果能放进一次调用）
             logger.info("📦 分块处理模式")
+            if self.hierarchical:
+                return self.chunking_processor.chunk_and_process_hierarchical(
+                    text=text,
+                    processor_func=processor_func,
+                    model=self.model,
+                    show_progress=show_progress,
+                    fill_ratio=self.chunking_threshold if fill_ratio is None else fill_ratio
+                )
             return self.chunking_processor.chunk_and_process(
                 text=text,
                 processor_func=processor_func,
                 show_progress=show_progress
             )
 
+    def prepare_prompt(
+        self,
+        text: str,
+        processor_func: Optional[Callable[[str], str]] = None,
+        agent_name: str = "context_manager",
+        reserved_text: Optional[str] = None
+    ) -> str:
+        """
+        准备代理输入：在阈值内原样返回，超过阈值时分块并行压缩后返回
+
+        代理本身只调用一次（reduce），分块压缩（map）由 process_text 并行完成，
+        避免超长输入直接超出模型限制、再依赖 safe_api_call 的 400 错误重试。
+
+        Args:
+            text: 代理的完整输入
+            processor_func: 分块处理函数（默认: make_condenser 创建的压缩函数）
+            agent_name: 代理名称（用于成本追踪）
+            reserved_text: 调用方原样附加、不参与压缩的文本（如补丁模式下的草稿），
+                其 token 数计入阈值，只压缩 text
+
+        Returns:
+            可以直接交给代理的输入（不含 reserved_text）
+        """
+        if not self.should_chunk(f"{text}\n\n{reserved_text}" if reserved_text else text):
+            return text
+
+        fill_ratio = self.chunking_threshold
+        if reserved_text:
+            reserved_ratio = (
+                ModelAdapter.estimate_tokens(reserved_text) / self.limits['context_window']
+            )
+            fill_ratio = max(fill_ratio - reserved_ratio, 0.0)
+        processor_func = processor_func or make_condenser(self.model, agent_name)
+        condensed = self.process_text(
+            text, processor_func, force_chunking=True, fill_ratio=fill_ratio
+        )
+        logger.info(
+            f"🗜️ {agent_name} 输入已压缩: {ModelAdapter.estimate_tokens(text)} → "
+            f"{ModelAdapter.estimate_tokens(condensed)} tokens"
+        )
+        return condensed
+
+    def plan_processing(self, text: str, expected_output_tokens: Optional[int] = None) -> dict:
+        """
+        预测分块处理（含多层归约）的调用次数和 token 数，不调用模型
+
+        Args:
+            text: 需要处理的文本
+            expected_output_tokens: 每次调用的预计输出 token 数
+
+        Returns:
+            ChunkingProcessor.plan_hierarchical 的结果
+        """
+        return self.chunking_processor.plan_hierarchical(
+            text,
+            model=self.model,
+            expected_output_tokens=expected_output_tokens,
+            fill_ratio=self.chunking_threshold
+        )
+
     def estimate_cost(self, text: str, cost_per_1k_tokens: float = 0.14) -> dict:
         """
         估算处理成本
@@ -0,0 +1,131 @@
+"""
+上下文策略模块 - 按代理选择每个步骤能看到的历史记录
+
+本模块提供：
+1. entry_kind: 历史记录条目的类型（research / ranked / draft / feedback / other）
+2. CONTEXT_POLICIES: 每个代理对每种条目的选择规则（声明式配置）
+3. select_history: 按策略筛选历史记录（保留原始步骤位置）
+
+原来每个代理都收到完整的历史（全部研究结果、草稿和反馈）。
+编辑代理只需要最新的草稿和针对它的反馈；写作代理只需要排序后的证据和最新草稿，
+不需要每一份原始的工具输出。按策略筛选后写作和编辑步骤的输入 token 和首 token 延迟都会下降。
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from src.history_compaction import latest_draft_index
+
+# 选择规则：
+#   all        - 该类型的全部条目
+#   latest     - 该类型的最后一个条目
+#   since_draft - 最新草稿之后的条目（针对最新草稿的反馈）
+#   none       - 不包含
+# ranked_replaces_research: 存在排序后的证据时不再包含排序步骤之前的原始研究结果
+CONTEXT_POLICIES: Dict[str, Dict[str, object]] = {
+    "research_agent": {
+        "research": "all",
+        "ranked": "all",
+        "draft": "none",
+        "feedback": "none",
+        "other": "all",
+    },
+    "writer_agent": {
+        "research": "all",
+        "ranked": "latest",
+        "draft": "latest",
+        "feedback": "since_draft",
+        "other": "all",
+        "ranked_replaces_research": True,
+    },
+    "editor_agent": {
+        "research": "none",
+        "ranked": "none",
+        "draft": "latest",
+        "feedback": "since_draft",
+        "other": "none",
+    },
+}
+
+
+def context_routing_enabled() -> bool:
+    """是否按代理筛选历史（CONTEXT_ROUTING，默认 true）"""
+    return os.getenv("CONTEXT_ROUTING", "true").lower() in ("1", "true", "yes")
+
+
+def entry_kind(step_title: str) -> str:
+    """
+    历史记录条目的类型（与 executor_agent_step 选择代理的规则一致）
+
+    返回:
+        research: 原始研究结果
+        ranked: 汇总/排序后的证据（标题含 rank 或 synthesize 的研究步骤）
+        draft: 写作步骤的草稿
+        feedback: 编辑步骤的反馈或修订稿
+        other: 其他
+    """
+    title = step_title.lower()
+    if "research" in title:
+        if "rank" in title or "synthesiz" in title:
+            return "ranked"
+        return "research"
+    if "draft" in title or "write" in title:
+        return "draft"
+    if "revise" in title or "edit" in title or "feedback" in title:
+        return "feedback"
+    return "other"
+
+
+def select_history(
+    agent_name: str, history: list, policies: Optional[Dict[str, Dict[str, object]]] = None
+) -> List[Tuple[int, list]]:
+    """
+    按代理的策略筛选历史记录
+
+    没有配置策略的代理、或策略筛掉全部条目时看到完整历史。编辑步骤输出修订后的完整文稿，
+    因此"最新草稿"取写作和编辑步骤中最新的一个（与 latest_draft_index 一致）。
+
+    参数:
+        agent_name: 代理名称（research_agent / writer_agent / editor_agent）
+        history: [step_title, step_desc, output] 列表
+        policies: 策略表（默认: CONTEXT_POLICIES）
+
+    返回:
+        [(原始步骤位置, 条目), ...]，按步骤顺序
+    """
+    policy = (policies or CONTEXT_POLICIES).get(agent_name)
+    if policy is None:
+        return list(enumerate(history))
+
+    kinds = [entry_kind(entry[0]) for entry in history]
+    draft_index = latest_draft_index(history)
+    latest: Dict[str, int] = {}
+    for index, kind in enumerate(kinds):
+        latest[kind] = index
+    # 只替代最新排序步骤之前的研究结果；之后的研究（如编辑要求补充的资料）没有被排序过，仍需保留
+    replaced_before = (
+        latest["ranked"] if policy.get("ranked_replaces_research") and "ranked" in latest else -1
+    )
+
+    selected = []
+    for index, (entry, kind) in enumerate(zip(history, kinds)):
+        rule = policy.get(kind, "all")
+        if index == draft_index:
+            keep = policy.get("draft", "all") != "none"
+        elif kind == "research" and index < replaced_before:
+            keep = False
+        elif rule == "all":
+            keep = True
+        elif rule == "latest":
+            # 草稿的 latest 即 draft_index（已在上面处理）
+            keep = kind != "draft" and index == latest[kind]
+        elif rule == "since_draft":
+            keep = draft_index is None or index > draft_index
+        else:
+            keep = False
+        if keep:
+            selected.append((index, entry))
+    # 策略筛掉了全部条目（如计划中没有草稿就进入编辑步骤）时退回完整历史
+    if history and not selected:
+        return list(enumerate(history))
+    return selected
@@ -66,6 +66,13 @@ class CostTracker:
         # 调用历史记录
         self.history: list = []
 
+        # 按模型统计的响应缓存命中次数和节省的成本
+        self.cache_hits: Dict[str, int] = {}
+        self.saved_costs: Dict[str, float] = {}
+
+        # 按代理统计的上下文筛选/压缩节省的提示 token
+        self.saved_prompt_tokens: Dict[str, int] = {}
+
         logger.info("💰 成本追踪器已初始化")
 
     def track(
@@ -135,6 +142,73 @@ class CostTracker:
 
         return total_cost
 
+    def track_cache_hit(
+        self,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> float:
+        """
+        记录一次命中响应缓存的调用（本次成本为 0）
+
+        参数:
+            model: 模型名称
+            input_tokens: 原始响应的输入 token 数量（用于计算节省的成本）
+            output_tokens: 原始响应的输出 token 数量
+            metadata: 可选的元数据
+
+        返回:
+            float: 节省的成本（美元）
+        """
+        prices = self.PRICES.get(model, {"input": 0.0, "output": 0.0})
+        saved = (
+            (input_tokens / 1_000_000) * prices["input"]
+            + (output_tokens / 1_000_000) * prices["output"]
+        )
+
+        self.cache_hits[model] = self.cache_hits.get(model, 0) + 1
+        self.saved_costs[model] = self.saved_costs.get(model, 0.0) + saved
+
+        self.history.append({
+            "timestamp": datetime.now().isoformat(),
+            "model": model,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost": 0.0,
+            "cache_hit": True,
+            "saved_cost": saved,
+            "metadata": metadata or {},
+        })
+
+        logger.info(f"💾 {model}: 命中响应缓存，节省 ${saved:.6f}")
+        return saved
+
+    def track_context_savings(
+        self,
+        agent: str,
+        full_tokens: int,
+        sent_tokens: int
+    ) -> int:
+        """
+        记录一个步骤的上下文筛选/压缩节省的提示 token（不计入调用历史）
+
+        参数:
+            agent: 代理名称
+            full_tokens: 完整历史上下文的估算 token 数
+            sent_tokens: 实际发送的上下文的估算 token 数
+
+        返回:
+            int: 节省的 token 数
+        """
+        saved = max(0, full_tokens - sent_tokens)
+        self.saved_prompt_tokens[agent] = self.saved_prompt_tokens.get(agent, 0) + saved
+
+        logger.info(
+            f"✂️ {agent}: 上下文 {full_tokens} → {sent_tokens} tokens（节省 {saved}）"
+        )
+        return saved
+
     def summary(self) -> Dict[str, Any]:
         """
         生成成本摘要报告
@@ -168,6 +242,9 @@ class CostTracker:
             "total_calls": total_calls,
             "by_model": by_model,
             "history_count": len(self.history),
+            "cache_hits": sum(self.cache_hits.values()),
+            "saved_cost": sum(self.saved_costs.values()),
+            "saved_prompt_tokens": dict(self.saved_prompt_tokens),
         }
 
     def compare(self, baseline: Dict[str, float]) -> Dict[str, Any]:
@@ -239,6 +316,9 @@ class CostTracker:
         self.calls.clear()
         self.tokens.clear()
         self.history.clear()
+        self.cache_hits.clear()
+        self.saved_costs.clear()
+        self.saved_prompt_tokens.clear()
         logger.info("♻️  成本追踪器已重置")
 
 
@@ -0,0 +1,162 @@
+"""
+执行历史压缩模块 - 在 token 预算内用摘要替换较早步骤的完整输出
+
+本模块提供：
+1. latest_draft_index: 历史记录中最新草稿（写作/编辑步骤输出）的位置
+2. digest_output: 提取步骤输出的摘要（事实句、来源和 URL），按输出内容缓存
+3. compact_history: 历史超过 token 预算时，从最早的步骤开始替换为摘要
+
+executor_agent_step 每一步都把之前全部步骤的完整输出拼进提示词，
+7 个步骤下提示 token 总量近似平方增长，后面的步骤会接近 deepseek-chat 32k 的上下文窗口。
+压缩后最新的草稿始终保持原文；摘要是确定性的抽取（不额外调用模型），
+每个步骤的输出只计算一次摘要，之后的步骤直接复用缓存。
+"""
+
+import hashlib
+import logging
+import os
+import re
+from typing import List, Optional
+
+from src.model_adapter import ModelAdapter
+from src.search_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 摘要缓存：键为步骤输出的哈希，同一任务后续步骤和检查点恢复后的步骤都能命中
+_digest_cache = TTLCache(max_entries=512)
+_DIGEST_TTL = 6 * 3600
+
+_URL_RE = re.compile(r"https?://[^\s<>\"')\]]+")
+# 事实句：包含数字、引用编号或 URL 的句子
+_FACT_RE = re.compile(r"\d|\[\d+\]|https?://")
+_DRAFT_KEYWORDS = ("draft", "write", "revise", "edit")
+
+
+def history_token_budget() -> int:
+    """历史记录的 token 预算（HISTORY_TOKEN_BUDGET，默认 16000，0 表示不压缩）"""
+    return int(os.getenv("HISTORY_TOKEN_BUDGET", "16000"))
+
+
+def is_draft_step(step_title: str) -> bool:
+    """写作或编辑步骤（输出是完整的草稿）"""
+    title = step_title.lower()
+    return "research" not in title and any(k in title for k in _DRAFT_KEYWORDS)
+
+
+def latest_draft_index(history: list) -> Optional[int]:
+    """最新草稿在历史记录中的位置（没有草稿时返回 None）"""
+    for index in range(len(history) - 1, -1, -1):
+        title, _, output = history[index]
+        if is_draft_step(title) and not output.startswith("[Model Error"):
+            return index
+    return None
+
+
+def _extract_digest(output: str, max_tokens: int) -> str:
+    """抽取标题、事实句和来源 URL，总长度不超过 max_tokens"""
+    urls: List[str] = []
+    for url in _URL_RE.findall(output):
+        url = url.rstrip(".,;:")
+        if url not in urls:
+            urls.append(url)
+    sources = "\n".join(f"- {url}" for url in urls)
+    budget = max_tokens - ModelAdapter.estimate_tokens(sources)
+
+    lines: List[str] = []
+    seen = set()
+    used = 0
+    for raw_line in output.splitlines():
+        line = raw_line.strip()
+        # 跳过空行和 HTML（工具调用列表）
+        if not line or line.startswith("<"):
+            continue
+        if line.startswith("#"):
+            candidates = [line]
+        else:
+            sentences = re.split(r"(?<=[.!?。！？])\s+", line)
+            candidates = [s for s in sentences if _FACT_RE.search(s)]
+        for candidate in candidates:
+            candidate = candidate[:300]
+            key = " ".join(candidate.lower().split())
+            if key in seen:
+                continue
+            cost = ModelAdapter.estimate_tokens(candidate) + 1
+            if used + cost > budget:
+                break
+            seen.add(key)
+            lines.append(candidate)
+            used += cost
+
+    digest = "\n".join(lines)
+    if sources:
+        digest += "\n\nSources:\n" + sources
+    return digest.strip()
+
+
+def digest_output(output: str, max_tokens: Optional[int] = None) -> str:
+    """
+    步骤输出的摘要（缓存）
+
+    参数:
+        output: 步骤的完整输出
+        max_tokens: 摘要的 token 上限（None 表示从 DIGEST_MAX_TOKENS 读取，默认 800）
+
+    返回:
+        str: 以 "[Digest]" 开头的摘要
+    """
+    max_tokens = (
+        max_tokens
+        if max_tokens is not None
+        else int(os.getenv("DIGEST_MAX_TOKENS", "800"))
+    )
+    key = hashlib.sha256(f"{max_tokens}\n{output}".encode("utf-8")).hexdigest()
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = "[Digest] " + _extract_digest(output, max_tokens)
+        _digest_cache.set(key, digest, ttl=_DIGEST_TTL)
+    return digest
+
+
+def history_tokens(history: list) -> int:
+    """历史记录输出部分的估算 token 数"""
+    return sum(ModelAdapter.estimate_tokens(output) for _, _, output in history)
+
+
+def compact_history(history: list, budget_tokens: Optional[int] = None) -> list:
+    """
+    压缩执行历史
+
+    超过预算时从最早的步骤开始把输出替换为摘要，直到总量在预算内；
+    最新的草稿始终保留原文。原列表不会被修改。
+
+    参数:
+        history: [step_title, step_desc, output] 列表
+        budget_tokens: token 预算（None 表示从 HISTORY_TOKEN_BUDGET 读取，0 表示不压缩）
+
+    返回:
+        list: 压缩后的历史（条目数和顺序不变）
+    """
+    budget = budget_tokens if budget_tokens is not None else history_token_budget()
+    total = history_tokens(history)
+    if budget <= 0 or total <= budget:
+        return history
+
+    protected = latest_draft_index(history)
+    compacted = [list(entry) for entry in history]
+    for index, (_, _, output) in enumerate(history):
+        if total <= budget:
+            break
+        if index == protected or output.startswith("[Digest]"):
+            continue
+        digest = digest_output(output)
+        saved = ModelAdapter.estimate_tokens(output) - ModelAdapter.estimate_tokens(digest)
+        if saved <= 0:
+            continue
+        total -= saved
+        compacted[index][2] = digest
+
+    logger.info(
+        f"🗜️ 执行历史压缩: {history_tokens(history)} → {total} tokens（预算 {budget}）"
+    )
+    return compacted
@@ -0,0 +1,149 @@
+"""
+LLM 响应缓存模块 - 确定性调用的精确匹配缓存
+
+本模块提供：
+1. is_cacheable: 判断一次调用是否可以缓存（仅 temperature=0 的非流式调用）
+2. make_request_key: 由模型、消息、工具和采样参数生成缓存键
+3. LLMResponseCache: 有容量上限和 TTL 的响应缓存
+4. get_llm_cache: 获取全局缓存（需通过 LLM_CACHE_ENABLED 显式开启）
+
+任务重试或重复提交相同主题时，写作/编辑等 temperature=0 的调用输入完全相同，
+命中缓存后直接返回之前的响应，不再消耗 token 和等待时间。
+命中的响应 usage 为 0 并标记 cache_hit=True；命中由 tracker.track_cache_hit 记录，
+各代理对 cache_hit 的响应不再调用 tracker.track，避免同一次调用被记两次。
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from src.search_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def is_cacheable(params: Dict[str, Any]) -> bool:
+    """
+    判断调用是否可以缓存
+
+    只缓存确定性调用：必须显式设置 temperature=0，且不是流式调用、不要求多个候选。
+
+    Args:
+        params: API 调用参数（不含 model / messages）
+
+    Returns:
+        是否可以缓存
+    """
+    temperature = params.get("temperature")
+    if temperature is None or temperature != 0:
+        return False
+    if params.get("stream"):
+        return False
+    return params.get("n") in (None, 1)
+
+
+def _to_jsonable(obj: Any) -> Any:
+    """把消息对象（如 ChatCompletionMessage）转换为可序列化的结构"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "__dict__"):
+        return {k: v for k, v in vars(obj).items() if not k.startswith("_")}
+    return str(obj)
+
+
+def make_request_key(model: str, messages: list, **params) -> str:
+    """
+    生成请求的缓存键
+
+    Args:
+        model: 模型名称
+        messages: 消息列表
+        **params: 工具定义和采样参数
+
+    Returns:
+        SHA-256 十六进制字符串
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=_to_jsonable,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """LLM 响应缓存（内存 LRU + TTL）"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: 最大条目数（None 表示从 LLM_CACHE_MAX_ENTRIES 读取，默认 256）
+            ttl: 缓存时间（秒，None 表示从 LLM_CACHE_TTL 读取，默认 86400）
+        """
+        self.max_entries = (
+            max_entries
+            if max_entries is not None
+            else int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256"))
+        )
+        self.ttl = ttl if ttl is not None else float(os.getenv("LLM_CACHE_TTL", "86400"))
+        self._store = TTLCache(self.max_entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        读取缓存的响应
+
+        Returns:
+            响应的副本（usage 置零、原始 usage 保存在 cached_usage，并标记 cache_hit=True）；
+            未命中返回 None
+        """
+        cached = self._store.get(key)
+        if cached is None:
+            return None
+        response = copy.deepcopy(cached)
+        response.cached_usage = getattr(response, "usage", None)
+        response.usage = SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        response.cache_hit = True
+        return response
+
+    def set(self, key: str, response: Any) -> None:
+        """缓存响应（保存副本，调用方后续修改不影响缓存）"""
+        try:
+            self._store.set(key, copy.deepcopy(response), ttl=self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM 响应无法缓存: {e}")
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._store.clear()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    获取全局 LLM 响应缓存（懒加载）
+
+    默认关闭，LLM_CACHE_ENABLED=true 时返回缓存实例。
+    """
+    global _cache
+    if os.getenv("LLM_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+                logger.info(
+                    f"💾 LLM 响应缓存已开启 (max_entries={_cache.max_entries}, ttl={_cache.ttl}s)"
+                )
+    return _cache
@@ -4,14 +4,24 @@
 功能:
 1. 管理不同模型的参数限制（max_tokens, context_window）
 2. 自动验证和调整参数
-3. 提供安全的 API 调用方法
+3. 提供安全的 API 调用方法（同步和异步）
 4. 处理参数错误并自动重试
+5. 按提供商限制异步调用的并发数
+6. 确定性调用（temperature=0）的响应缓存（LLM_CACHE_ENABLED 开启）
+7. 重试之间检查任务是否已被取消
 """
 
+import asyncio
 import logging
+import os
+import weakref
 from typing import Optional, Dict, Any
 import aisuite as ai
 
+from src.cancellation import cancellable_sleep, check_cancelled
+from src.cost_tracker import tracker
+from src.llm_cache import get_llm_cache, is_cacheable, make_request_key
+
 logger = logging.getLogger(__name__)
 
 
@@ -104,6 +114,134 @@ class ModelAdapter:
 
         return adjusted
 
+    # 重试配置
+    MAX_RETRIES = 3  # 最多 3 次尝试
+    BASE_WAIT_TIME = 2  # 基础等待时间（秒）
+
+    # 各提供商的异步并发上限（可通过 LLM_CONCURRENCY_<PROVIDER> 环境变量覆盖）
+    PROVIDER_CONCURRENCY = {
+        "deepseek": 16,
+        "openai": 16,
+    }
+    DEFAULT_PROVIDER_CONCURRENCY = 8
+
+    # 每个事件循环一组信号量（asyncio.Semaphore 不能跨事件循环使用）
+    _async_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def _retry_wait(
+        cls,
+        error: Exception,
+        model: str,
+        attempt: int,
+        adjusted_params: Optional[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+    ) -> Optional[float]:
+        """
+        根据错误类型决定重试策略（同步与异步调用共用）
+
+        Args:
+            error: 本次尝试抛出的异常
+            model: 模型名称
+            attempt: 当前尝试序号（从 0 开始）
+            adjusted_params: 本次尝试使用的参数（参数错误时会被调整）
+            kwargs: 调用方传入的参数（参数错误时会同步更新 max_tokens）
+
+        Returns:
+            重试前需要等待的秒数；None 表示不再重试，调用方应抛出原始异常
+        """
+        max_retries = cls.MAX_RETRIES
+        base_wait_time = cls.BASE_WAIT_TIME
+        is_last_attempt = attempt >= max_retries - 1
+
+        if isinstance(error, (BrokenPipeError, ConnectionError, OSError)):
+            # 连接错误 - 使用指数退避重试
+            error_name = type(error).__name__
+            logger.warning(
+                f"⚠️ 连接错误 ({error_name}): {str(error)[:100]} "
+                f"(尝试 {attempt + 1}/{max_retries})"
+            )
+            if is_last_attempt:
+                logger.error(f"❌ 连接错误，所有重试已用尽")
+                return None
+            # 指数退避：2s, 4s, 8s
+            wait_time = base_wait_time * (2 ** attempt)
+            logger.info(f"🔄 等待 {wait_time}s 后重试...")
+            return wait_time
+
+        error_str = str(error)
+        error_type = type(error).__name__
+        logger.warning(
+            f"⚠️ API 调用失败 ({error_type}): {error_str[:200]} "
+            f"(尝试 {attempt + 1}/{max_retries})"
+        )
+
+        # 如果是最后一次尝试，则抛出异常
+        if is_last_attempt:
+            logger.error(f"❌ {model} API 调用失败，所有重试已用尽")
+            return None
+
+        # 参数错误处理
+        if "max_tokens" in error_str or "400" in error_str:
+            # 参数错误，进一步降低 max_tokens
+            if adjusted_params and 'max_tokens' in adjusted_params:
+                # 减半重试
+                old_value = adjusted_params['max_tokens']
+                adjusted_params['max_tokens'] = old_value // 2
+                kwargs['max_tokens'] = adjusted_params['max_tokens']
+                logger.info(
+                    f"🔧 参数错误，降低 max_tokens: {old_value} → "
+                    f"{adjusted_params['max_tokens']}，重试中..."
+                )
+                return 0
+
+        # 速率限制处理
+        if "429" in error_str or "rate_limit" in error_str.lower():
+            wait_time = base_wait_time * (2 ** attempt) * 2  # 速率限制等待更久
+            logger.info(f"⏳ 速率限制，等待 {wait_time}s 后重试...")
+            return wait_time
+
+        # 其他可重试错误
+        retriable_errors = ["broken pipe", "connection reset", "connection refused"]
+        if any(err in error_str.lower() for err in retriable_errors):
+            wait_time = base_wait_time * (2 ** attempt)
+            logger.info(f"🔄 网络错误，等待 {wait_time}s 后重试...")
+            return wait_time
+
+        # 未识别的错误：立即重试
+        return 0
+
+    @classmethod
+    def _lookup_cache(cls, model: str, messages: list, kwargs: Dict[str, Any]):
+        """
+        查询响应缓存
+
+        Returns:
+            (缓存键, 命中的响应)；不可缓存时缓存键为 None，未命中时响应为 None
+        """
+        cache = get_llm_cache()
+        if cache is None or not is_cacheable(kwargs):
+            return None, None
+
+        key = make_request_key(model, messages, **kwargs)
+        response = cache.get(key)
+        if response is not None:
+            usage = response.cached_usage
+            tracker.track_cache_hit(
+                model,
+                getattr(usage, "prompt_tokens", 0) or 0,
+                getattr(usage, "completion_tokens", 0) or 0,
+            )
+            logger.info(f"💾 {model} 命中响应缓存，跳过 API 调用")
+        return key, response
+
+    @classmethod
+    def _store_cache(cls, key: Optional[str], response) -> None:
+        """缓存成功的响应（key 为 None 表示不可缓存）"""
+        cache = get_llm_cache()
+        if key is not None and cache is not None:
+            cache.set(key, response)
+
     @classmethod
     def safe_api_call(cls, client: ai.Client, model: str, messages: list, **kwargs):
         """
@@ -116,16 +254,21 @@ class ModelAdapter:
             **kwargs: 其他 API 参数
 
         Returns:
-            API 响应对象
+            API 响应对象（命中缓存时 usage 为 0，cache_hit=True）
 
         Raises:
             Exception: 所有重试失败后抛出原始异常
+            TaskCancelledError: 所在任务已被取消（每次尝试前和退避等待中检查）
         """
-        import time
-        max_retries = 3  # 增加到 3 次重试
-        base_wait_time = 2  # 基础等待时间（秒）
+        max_retries = cls.MAX_RETRIES
+
+        cache_key, cached = cls._lookup_cache(model, messages, kwargs)
+        if cached is not None:
+            return cached
 
         for attempt in range(max_retries):
+            check_cancelled()
+            adjusted_params = None
             try:
                 # 1. 验证和调整参数
                 adjusted_params = cls.validate_and_adjust_params(model, **kwargs)
@@ -144,89 +287,118 @@ class ModelAdapter:
 
                 # 3. 成功返回
                 logger.info(f"✅ {model} API 调用成功")
+                cls._store_cache(cache_key, response)
                 return response
 
-            except (BrokenPipeError, ConnectionError, OSError) as e:
-                # 连接错误 - 使用指数退避重试
-                error_name = type(e).__name__
-                logger.warning(
-                    f"⚠️ 连接错误 ({error_name}): {str(e)[:100]} "
-                    f"(尝试 {attempt + 1}/{max_retries})"
-                )
-
-                if attempt < max_retries - 1:
-                    # 指数退避：2s, 4s, 8s
-                    wait_time = base_wait_time * (2 ** attempt)
-                    logger.info(f"🔄 等待 {wait_time}s 后重试...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logger.error(f"❌ 连接错误，所有重试已用尽")
+            except Exception as e:
+                # 4. 错误处理和重试
+                wait_time = cls._retry_wait(e, model, attempt, adjusted_params, kwargs)
+                if wait_time is None:
                     raise
+                if wait_time > 0:
+                    cancellable_sleep(wait_time)
 
-            except TimeoutError as e:
-                # 超时错误 - 重试
-                logger.warning(
-                    f"⚠️ 请求超时: {str(e)[:100]} "
-                    f"(尝试 {attempt + 1}/{max_retries})"
-                )
+        # 理论上不会到这里
+        raise RuntimeError("Unexpected error in safe_api_call")
 
-                if attempt < max_retries - 1:
-                    wait_time = base_wait_time * (2 ** attempt)
-                    logger.info(f"🔄 等待 {wait_time}s 后重试...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logger.error(f"❌ 超时错误，所有重试已用尽")
-                    raise
+    @classmethod
+    def get_provider_concurrency(cls, provider: str) -> int:
+        """
+        获取提供商的异步并发上限
 
-            except Exception as e:
-                error_str = str(e)
-                error_type = type(e).__name__
-                logger.warning(
-                    f"⚠️ API 调用失败 ({error_type}): {error_str[:200]} "
-                    f"(尝试 {attempt + 1}/{max_retries})"
+        Args:
+            provider: 提供商前缀，如 "deepseek"、"openai"
+
+        Returns:
+            并发上限（环境变量 LLM_CONCURRENCY_<PROVIDER> 优先）
+        """
+        default = cls.PROVIDER_CONCURRENCY.get(provider, cls.DEFAULT_PROVIDER_CONCURRENCY)
+        return int(os.getenv(f"LLM_CONCURRENCY_{provider.upper()}", str(default)))
+
+    @classmethod
+    def _get_provider_semaphore(cls, model: str) -> asyncio.Semaphore:
+        """获取当前事件循环中该模型提供商的信号量"""
+        provider = model.split(":", 1)[0] if ":" in model else model
+        loop = asyncio.get_running_loop()
+        semaphores = cls._async_semaphores.setdefault(loop, {})
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(cls.get_provider_concurrency(provider))
+        return semaphores[provider]
+
+    @classmethod
+    async def async_safe_api_call(cls, client: ai.Client, model: str, messages: list, **kwargs):
+        """
+        异步的安全 API 调用（safe_api_call 的 asyncio 版本）
+
+        与 safe_api_call 使用相同的参数验证和重试策略，区别在于：
+        - 退避等待使用 asyncio.sleep，不占用线程
+        - 按提供商前缀（deepseek:, openai: ...）限制并发请求数
+        - 客户端支持 acreate 时直接 await，否则在线程中调用同步接口
+
+        Args:
+            client: aisuite 客户端实例
+            model: 模型名称
+            messages: 消息列表
+            **kwargs: 其他 API 参数
+
+        Returns:
+            API 响应对象
+
+        Raises:
+            Exception: 所有重试失败后抛出原始异常
+            TaskCancelledError: 所在任务已被取消（每次尝试前检查）
+        """
+        max_retries = cls.MAX_RETRIES
+
+        cache_key, cached = cls._lookup_cache(model, messages, kwargs)
+        if cached is not None:
+            return cached
+
+        semaphore = cls._get_provider_semaphore(model)
+        completions = client.chat.completions
+        acreate = getattr(completions, "acreate", None)
+
+        for attempt in range(max_retries):
+            check_cancelled()
+            adjusted_params = None
+            try:
+                # 1. 验证和调整参数
+                adjusted_params = cls.validate_and_adjust_params(model, **kwargs)
+
+                logger.info(
+                    f"📡 调用 {model} API (异步，尝试 {attempt + 1}/{max_retries}), "
+                    f"max_tokens={adjusted_params.get('max_tokens')}"
                 )
 
-                # 4. 参数错误处理
-                if "max_tokens" in error_str or "400" in error_str:
-                    # 参数错误，进一步降低 max_tokens
-                    if attempt < max_retries - 1:
-                        if 'max_tokens' in adjusted_params:
-                            # 减半重试
-                            old_value = adjusted_params['max_tokens']
-                            adjusted_params['max_tokens'] = old_value // 2
-                            kwargs['max_tokens'] = adjusted_params['max_tokens']
-                            logger.info(
-                                f"🔧 参数错误，降低 max_tokens: {old_value} → "
-                                f"{adjusted_params['max_tokens']}，重试中..."
-                            )
-                            continue
-
-                # 5. 速率限制处理
-                if "429" in error_str or "rate_limit" in error_str.lower():
-                    if attempt < max_retries - 1:
-                        wait_time = base_wait_time * (2 ** attempt) * 2  # 速率限制等待更久
-                        logger.info(f"⏳ 速率限制，等待 {wait_time}s 后重试...")
-                        time.sleep(wait_time)
-                        continue
-
-                # 6. 其他可重试错误
-                retriable_errors = ["broken pipe", "connection reset", "connection refused"]
-                if any(err in error_str.lower() for err in retriable_errors):
-                    if attempt < max_retries - 1:
-                        wait_time = base_wait_time * (2 ** attempt)
-                        logger.info(f"🔄 网络错误，等待 {wait_time}s 后重试...")
-                        time.sleep(wait_time)
-                        continue
-
-                # 7. 如果是最后一次尝试，则抛出异常
-                if attempt == max_retries - 1:
-                    logger.error(f"❌ {model} API 调用失败，所有重试已用尽")
+                # 2. 在提供商并发限制内调用 API
+                async with semaphore:
+                    if acreate is not None:
+                        response = await acreate(
+                            model=model, messages=messages, **adjusted_params
+                        )
+                    else:
+                        response = await asyncio.to_thread(
+                            completions.create,
+                            model=model,
+                            messages=messages,
+                            **adjusted_params
+                        )
+
+                # 3. 成功返回
+                logger.info(f"✅ {model} API 调用成功")
+                cls._store_cache(cache_key, response)
+                return response
+
+            except Exception as e:
+                # 4. 错误处理和重试（非阻塞退避）
+                wait_time = cls._retry_wait(e, model, attempt, adjusted_params, kwargs)
+                if wait_time is None:
                     raise
+                if wait_time > 0:
+                    await asyncio.sleep(wait_time)
 
         # 理论上不会到这里
-        raise RuntimeError("Unexpected error in safe_api_call")
+        raise RuntimeError("Unexpected error in async_safe_api_call")
 
     @classmethod
     def estimate_tokens(cls, text: str) -> int:
@@ -0,0 +1,134 @@
+"""
+补丁式编辑模块 - 编辑代理返回结构化修改，在本地应用到草稿
+
+本模块提供：
+1. PATCH_INSTRUCTIONS: 要求模型返回结构化修改的提示词
+2. PatchApplyError: 修改无法应用（由调用方回退为整篇重写）
+3. parse_edits: 解析模型返回的修改列表
+4. apply_edits: 把修改应用到草稿
+
+整篇重写的输出 token 与草稿一样多，而输出 token 是调用中最慢、最贵的部分。
+补丁模式下模型只输出需要修改的片段（按章节替换或精确查找替换），
+长报告的编辑耗时和成本可以降低数倍。
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+PATCH_INSTRUCTIONS = """
+## Output Format (PATCH MODE):
+Do NOT return the whole document. Return ONLY a JSON object listing your edits to the LATEST DRAFT:
+
+{"edits": [
+  {"op": "replace_section", "heading": "<exact heading line from the draft, e.g. ## Discussion>",
+   "content": "<the complete revised section, starting with the same heading>"},
+  {"op": "replace", "find": "<exact text copied verbatim from the draft, unique in the draft>",
+   "replace": "<revised text>"}
+]}
+
+- Use "replace" for local fixes (sentences, paragraphs) and "replace_section" only for sections you rewrite substantially.
+- "find" must match the draft character for character and occur exactly once.
+- Return {"edits": []} if the draft needs no changes.
+""".strip()
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+class PatchApplyError(ValueError):
+    """修改无法应用到草稿"""
+
+
+def parse_edits(raw: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    解析模型返回的修改列表
+
+    参数:
+        raw: 模型输出（JSON 对象，允许代码围栏）
+
+    返回:
+        修改列表；不是合法的修改格式时返回 None
+    """
+    start, end = raw.find("{"), raw.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        obj = json.loads(raw[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    edits = obj.get("edits") if isinstance(obj, dict) else None
+    if not isinstance(edits, list):
+        return None
+    for edit in edits:
+        if not isinstance(edit, dict):
+            return None
+        if edit.get("op") == "replace_section":
+            if not isinstance(edit.get("heading"), str) or not isinstance(edit.get("content"), str):
+                return None
+        elif edit.get("op") == "replace":
+            if not isinstance(edit.get("find"), str) or not isinstance(edit.get("replace"), str):
+                return None
+        else:
+            return None
+    return edits
+
+
+def _normalize_heading(text: str) -> str:
+    """比较章节标题时忽略 # 号、大小写和空白"""
+    match = _HEADING_RE.match(text.strip())
+    title = match.group(2) if match else text
+    return " ".join(title.strip("*_ ").lower().split())
+
+
+def _replace_section(draft: str, heading: str, content: str) -> str:
+    """替换从标题行到下一个同级或更高级标题之前的内容"""
+    lines = draft.split("\n")
+    target = _normalize_heading(heading)
+    matches = [
+        (i, len(m.group(1)))
+        for i, line in enumerate(lines)
+        if (m := _HEADING_RE.match(line)) and _normalize_heading(line) == target
+    ]
+    if len(matches) != 1:
+        raise PatchApplyError(f"章节标题匹配到 {len(matches)} 处: {heading}")
+
+    start, level = matches[0]
+    end = len(lines)
+    for i in range(start + 1, len(lines)):
+        m = _HEADING_RE.match(lines[i])
+        if m and len(m.group(1)) <= level:
+            end = i
+            break
+
+    replacement = content.strip("\n").split("\n")
+    # 保留章节之间原有的空行
+    if end < len(lines):
+        replacement.append("")
+    return "\n".join(lines[:start] + replacement + lines[end:])
+
+
+def apply_edits(draft: str, edits: List[Dict[str, Any]]) -> str:
+    """
+    按顺序把修改应用到草稿
+
+    参数:
+        draft: 草稿（Markdown）
+        edits: parse_edits 的结果
+
+    返回:
+        修改后的文稿
+
+    抛出:
+        PatchApplyError: 查找文本不唯一/不存在，或章节标题无法唯一匹配
+    """
+    document = draft
+    for edit in edits:
+        if edit["op"] == "replace_section":
+            document = _replace_section(document, edit["heading"], edit["content"])
+        else:
+            find = edit["find"]
+            count = document.count(find) if find else 0
+            if count != 1:
+                raise PatchApplyError(f"查找文本匹配到 {count} 处: {find[:80]!r}")
+            document = document.replace(find, edit["replace"], 1)
+    return document
@@ -0,0 +1,213 @@
+"""
+PDF 缓存模块 - 按内容寻址的 arXiv PDF / 文本磁盘缓存
+
+本模块提供：
+1. cache_key: 由 URL 生成缓存键（arXiv ID + 版本号，否则为 URL 的哈希）
+2. PdfCache: 保存原始 PDF 字节和按页数限制提取的清洗后文本
+3. get_pdf_cache: 获取全局缓存实例（懒加载，可通过环境变量关闭）
+
+热门论文会在多个研究任务中被反复下载和解析。缓存命中时既不访问网络，
+也不再运行 PyMuPDF。写入使用"临时文件 + os.replace"保证原子性；
+总大小超过上限时按最近访问时间（mtime）淘汰最旧的文件（LRU）。
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 匹配 arXiv 摘要/PDF 链接中的 ID 和版本号，例如:
+#   https://arxiv.org/abs/2401.01234v2   -> 2401.01234v2
+#   https://arxiv.org/pdf/2401.01234v2.pdf
+#   http://arxiv.org/abs/cs/0112017v1    -> cs_0112017v1
+_ARXIV_ID_RE = re.compile(
+    r"arxiv\.org/(?:abs|pdf)/(?P<id>\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?P<version>v\d+)(?:\.pdf)?/?$",
+    re.IGNORECASE,
+)
+
+
+def cache_key(url: str) -> str:
+    """
+    由 PDF / 摘要页 URL 生成缓存键
+
+    带版本号的 arXiv 链接内容不可变，直接使用 "ID + 版本号" 作为键，
+    同一论文的 abs / pdf 链接共享缓存；其他 URL 使用 SHA-256 哈希。
+
+    参数:
+        url: PDF 或摘要页 URL
+
+    返回:
+        可安全用作文件名的缓存键
+    """
+    match = _ARXIV_ID_RE.search(url.strip())
+    if match:
+        return f"arxiv_{match.group('id').replace('/', '_')}{match.group('version')}"
+    return "url_" + hashlib.sha256(url.strip().encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """
+    arXiv PDF 和提取文本的磁盘缓存
+
+    目录结构:
+        <cache_dir>/pdf/<key>.pdf
+        <cache_dir>/text/<key>.p<页数|all>.txt
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        参数:
+            cache_dir: 缓存目录（None 表示从 PDF_CACHE_DIR 读取，默认 .cache/pdf）
+            max_bytes: 缓存总大小上限（None 表示从 PDF_CACHE_MAX_MB 读取，默认 512MB）
+        """
+        self.cache_dir = cache_dir or os.getenv("PDF_CACHE_DIR", ".cache/pdf")
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(float(os.getenv("PDF_CACHE_MAX_MB", "512")) * 1024 * 1024)
+        )
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+
+    # ----- 路径 -----
+    def _pdf_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, "pdf", f"{cache_key(url)}.pdf")
+
+    def _text_path(self, url: str, max_pages: Optional[int]) -> str:
+        pages = "all" if max_pages is None else str(max_pages)
+        return os.path.join(self.cache_dir, "text", f"{cache_key(url)}.p{pages}.txt")
+
+    # ----- 读写 -----
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"⚠️ 读取 PDF 缓存失败 {path}: {e}")
+            return None
+        try:
+            os.utime(path)  # 更新访问时间，用于 LRU 淘汰
+        except OSError:
+            pass
+        return data
+
+    def _write(self, path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e:
+            logger.warning(f"⚠️ 写入 PDF 缓存失败 {path}: {e}")
+            return
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - previous
+        self._evict_if_needed()
+
+    def get_pdf(self, url: str) -> Optional[bytes]:
+        """读取缓存的 PDF 字节（未命中返回 None）"""
+        return self._read(self._pdf_path(url))
+
+    def put_pdf(self, url: str, pdf_bytes: bytes) -> None:
+        """缓存 PDF 字节"""
+        self._write(self._pdf_path(url), pdf_bytes)
+
+    def get_text(self, url: str, max_pages: Optional[int] = None) -> Optional[str]:
+        """读取缓存的清洗后文本（未命中返回 None）"""
+        data = self._read(self._text_path(url, max_pages))
+        return None if data is None else data.decode("utf-8")
+
+    def put_text(self, url: str, text: str, max_pages: Optional[int] = None) -> None:
+        """缓存清洗后的文本（按页数限制区分）"""
+        self._write(self._text_path(url, max_pages), text.encode("utf-8"))
+
+    # ----- 淘汰 -----
+    def _entries(self):
+        """列出所有缓存文件 [(mtime, size, path)]"""
+        entries = []
+        for sub in ("pdf", "text"):
+            directory = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """缓存当前总大小（字节）"""
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_if_needed(self) -> None:
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self.size()
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._total_bytes = total
+            if removed:
+                logger.info(f"🧹 PDF 缓存淘汰 {removed} 个文件，当前 {total / 1024 / 1024:.1f}MB")
+
+
+_cache: Optional[PdfCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> Optional[PdfCache]:
+    """
+    获取全局 PDF 缓存（懒加载）
+
+    PDF_CACHE_ENABLED=false 时返回 None。
+
+    返回:
+        PdfCache 实例或 None
+    """
+    global _cache
+    if os.getenv("PDF_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PdfCache()
+                logger.info(
+                    f"💾 PDF 缓存: {_cache.cache_dir} (上限 {_cache.max_bytes / 1024 / 1024:.0f}MB)"
+                )
+    return _cache
@@ -0,0 +1,318 @@
+"""
+PDF 提取进程池模块 - 在独立进程中解析 PDF
+
+本模块提供：
+1. PdfExtractionPool: 带超时、内存上限和进程回收的提取进程池
+2. extract_pdf_text: 使用全局进程池提取 PDF 文本
+3. shutdown_pdf_extractor: 关闭全局进程池
+
+PyMuPDF / pdfminer 解析是 CPU 密集型操作，在 worker 线程中执行会持有 GIL，
+拖慢同进程的 FastAPI 事件循环；异常 PDF 还可能让线程永远卡住。
+在独立进程中执行后：
+- 每个文档有墙钟超时（从子进程开始执行时计时），超时后只强制结束执行该文档的子进程
+- 每个子进程有地址空间上限（RLIMIT_AS），超出时解析失败而不会拖垮主进程
+- 子进程处理 N 个文档后自动回收，避免内存碎片累积
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 子进程收到该消息后退出
+_STOP = None
+
+
+def _limit_memory(max_mb: int) -> None:
+    """子进程初始化：设置地址空间上限（仅 Unix 有效）"""
+    if max_mb <= 0:
+        return
+    try:
+        import resource
+
+        limit = max_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _extract_in_worker(pdf_bytes: bytes, max_pages: Optional[int]) -> str:
+    """子进程中执行的文本提取"""
+    from src.research_tools import pdf_bytes_to_text
+
+    return pdf_bytes_to_text(pdf_bytes, max_pages=max_pages)
+
+
+def _worker_main(conn, memory_limit_mb: int) -> None:
+    """子进程主循环：逐个执行收到的 (func, args)，返回 ("ok", 结果) 或 ("error", 异常)"""
+    _limit_memory(memory_limit_mb)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is _STOP:
+            return
+        func, args = job
+        try:
+            reply = ("ok", func(*args))
+        except BaseException as e:  # noqa: BLE001 - 异常原样交给主进程处理
+            reply = ("error", e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # 结果或异常无法 pickle
+            conn.send(("error", RuntimeError(f"无法返回提取结果: {e!r}")))
+
+
+class _Worker:
+    """一个提取子进程及其通信管道"""
+
+    def __init__(self, context, memory_limit_mb: int, generation: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.generation = generation
+
+    def call(self, func: Callable[..., Any], args: tuple, timeout: float) -> tuple:
+        """
+        执行一个任务
+
+        抛出:
+            TimeoutError: 超时（子进程开始执行后计时）
+            EOFError / OSError: 子进程已退出
+        """
+        self.conn.send((func, args))
+        if not self.conn.poll(timeout):
+            raise TimeoutError
+        self.tasks += 1
+        return self.conn.recv()
+
+    def stop(self, wait: bool = False) -> None:
+        """正常结束子进程"""
+        try:
+            self.conn.send(_STOP)
+        except (OSError, ValueError):
+            pass
+        if wait:
+            self.process.join(timeout=5)
+        self.conn.close()
+
+    def kill(self) -> None:
+        """强制结束子进程（卡住的子进程不会响应 _STOP）"""
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class PdfExtractionPool:
+    """
+    PDF 提取进程池
+
+    每个子进程一次只执行一个文档：超时从子进程开始执行该文档时计时（排队等待的时间不计入），
+    超时后只结束执行该文档的子进程，不影响其他正在提取的文档。
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_tasks_per_child: Optional[int] = None,
+        memory_limit_mb: Optional[int] = None,
+        start_method: Optional[str] = None,
+    ):
+        """
+        参数:
+            workers: 子进程数（None 表示从 PDF_EXTRACT_WORKERS 读取，默认 2）
+            timeout: 单个文档的超时（秒，None 表示从 PDF_EXTRACT_TIMEOUT 读取，默认 60）
+            max_tasks_per_child: 子进程处理多少个文档后回收
+                （None 表示从 PDF_WORKER_MAX_TASKS 读取，默认 50，0 表示不回收）
+            memory_limit_mb: 子进程地址空间上限
+                （MB，None 表示从 PDF_WORKER_MEMORY_MB 读取，默认 1024，0 表示不限制）
+            start_method: 进程启动方式（None 表示从 PDF_EXTRACT_START_METHOD 读取，默认 forkserver）
+        """
+        self.workers = (
+            workers if workers is not None else int(os.getenv("PDF_EXTRACT_WORKERS", "2"))
+        )
+        if self.workers < 1:
+            raise ValueError(f"PDF 提取进程数必须大于 0: {self.workers}")
+        self.timeout = (
+            timeout if timeout is not None else float(os.getenv("PDF_EXTRACT_TIMEOUT", "60"))
+        )
+        self.max_tasks_per_child = (
+            max_tasks_per_child
+            if max_tasks_per_child is not None
+            else int(os.getenv("PDF_WORKER_MAX_TASKS", "50"))
+        )
+        self.memory_limit_mb = (
+            memory_limit_mb
+            if memory_limit_mb is not None
+            else int(os.getenv("PDF_WORKER_MEMORY_MB", "1024"))
+        )
+        # 主进程是多线程的（worker 池、uvicorn），fork 可能继承被锁住的锁，因此默认使用 forkserver
+        self.start_method = start_method or os.getenv("PDF_EXTRACT_START_METHOD", "forkserver")
+        self._context = multiprocessing.get_context(self.start_method)
+
+        self._lock = threading.Lock()
+        # 每个文档占用一个名额：排队发生在这里，不计入文档的超时
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._idle: List[_Worker] = []
+        self._busy: Set[_Worker] = set()
+        # shutdown 后递增：之前创建的子进程执行完当前文档后直接结束
+        self._generation = 0
+
+    def _acquire_worker(self) -> _Worker:
+        """取一个空闲子进程（没有则创建）"""
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+            generation = self._generation
+        if worker is None:
+            worker = _Worker(self._context, self.memory_limit_mb, generation)
+            logger.info(
+                f"🧮 PDF 提取子进程已创建 (pid={worker.process.pid}, "
+                f"timeout={self.timeout}s, memory={self.memory_limit_mb}MB)"
+            )
+        with self._lock:
+            self._busy.add(worker)
+        return worker
+
+    def _release_worker(self, worker: _Worker, reusable: bool) -> None:
+        """归还子进程：可复用时放回空闲列表，否则结束它"""
+        with self._lock:
+            self._busy.discard(worker)
+            recycle = (
+                not reusable
+                or worker.generation != self._generation
+                or (self.max_tasks_per_child and worker.tasks >= self.max_tasks_per_child)
+            )
+            if not recycle:
+                self._idle.append(worker)
+        if recycle and reusable:
+            worker.stop()
+
+    def run(self, func: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        在子进程中运行函数
+
+        参数:
+            func: 可 pickle 的模块级函数
+            *args: 传给 func 的参数
+            timeout: 超时（秒，None 表示使用 self.timeout；从子进程开始执行时计时）
+
+        返回:
+            func 的返回值
+
+        抛出:
+            RuntimeError: 超时或子进程异常退出（如超出内存上限被系统结束）
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._slots:
+            for attempt in range(2):
+                worker = self._acquire_worker()
+                try:
+                    status, value = worker.call(func, args, timeout)
+                except TimeoutError:
+                    logger.warning(
+                        f"⏱️ PDF 提取超时 ({timeout}s)，结束子进程 pid={worker.process.pid}"
+                    )
+                    worker.kill()
+                    self._release_worker(worker, reusable=False)
+                    raise RuntimeError(f"PDF 文本提取超时（{timeout}s）")
+                except (EOFError, OSError) as e:
+                    worker.kill()
+                    self._release_worker(worker, reusable=False)
+                    # 发送任务时空闲子进程已退出：换一个子进程重试一次
+                    if attempt == 0 and isinstance(e, BrokenPipeError):
+                        continue
+                    raise RuntimeError(
+                        f"PDF 提取进程异常退出 (exitcode={worker.process.exitcode})"
+                    )
+                except BaseException:
+                    # 等待时被取消：子进程仍在执行，结束它以免占用名额
+                    worker.kill()
+                    self._release_worker(worker, reusable=False)
+                    raise
+
+                self._release_worker(worker, reusable=True)
+                if status == "ok":
+                    return value
+                if isinstance(value, MemoryError):
+                    raise RuntimeError(f"PDF 提取超出内存上限（{self.memory_limit_mb}MB）")
+                raise value
+
+        raise RuntimeError("PDF 提取进程池不可用")
+
+    def extract_text(self, pdf_bytes: bytes, max_pages: Optional[int] = None) -> str:
+        """
+        在子进程中提取 PDF 文本
+
+        参数:
+            pdf_bytes: PDF 文件的字节内容
+            max_pages: 最多提取的页数（None 表示全部）
+
+        返回:
+            提取的文本内容
+        """
+        return self.run(_extract_in_worker, pdf_bytes, max_pages)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """关闭进程池（正在执行的子进程在当前文档完成后结束）"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._generation += 1
+        for worker in idle:
+            worker.stop(wait=wait)
+        if idle:
+            logger.info("🧮 PDF 提取进程池已关闭")
+
+
+_pool: Optional[PdfExtractionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_extraction_pool() -> PdfExtractionPool:
+    """获取全局 PDF 提取进程池（懒加载）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PdfExtractionPool()
+    return _pool
+
+
+def extract_pdf_text(pdf_bytes: bytes, max_pages: Optional[int] = None) -> str:
+    """
+    提取 PDF 文本（在独立进程中执行，带超时和内存上限）
+
+    PDF_EXTRACT_IN_PROCESS=true 时在当前线程中直接提取（用于调试）。
+
+    参数:
+        pdf_bytes: PDF 文件的字节内容
+        max_pages: 最多提取的页数（None 表示全部）
+
+    返回:
+        提取的文本内容
+    """
+    if os.getenv("PDF_EXTRACT_IN_PROCESS", "false").lower() in ("1", "true", "yes"):
+        return _extract_in_worker(pdf_bytes, max_pages)
+    return get_pdf_extraction_pool().extract_text(pdf_bytes, max_pages=max_pages)
+
+
+def shutdown_pdf_extractor(wait: bool = False) -> None:
+    """关闭全局 PDF 提取进程池"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
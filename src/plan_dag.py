@@ -0,0 +1,189 @@
+"""
+计划 DAG 模块 - 按步骤依赖并发执行研究计划
+
+本模块提供：
+1. linear_dependencies / normalize_dependencies: 依赖列表的构造与校验
+2. ancestors / reusable_steps: 依赖闭包计算（步骤历史、检查点复用）
+3. PlanStepError: 步骤执行失败（记录失败的步骤位置）
+4. PlanDagExecutor: 在并发上限内执行所有依赖已完成的步骤
+
+依赖用与计划平行的列表表示：dependencies[i] 是步骤 i 依赖的更早步骤的位置（从 0 开始）。
+只允许依赖更早的步骤，因此依赖图一定无环。每个步骤只看到其依赖闭包中步骤的输出
+（按计划顺序）；没有声明依赖时退化为线性顺序，每个步骤看到之前的全部历史，与原有行为一致。
+"""
+
+import contextvars
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+from src.cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+
+def linear_dependencies(count: int) -> List[List[int]]:
+    """线性依赖：每个步骤依赖前一个步骤"""
+    return [[index - 1] if index > 0 else [] for index in range(count)]
+
+
+def normalize_dependencies(
+    count: int, dependencies: Optional[Sequence[Sequence[int]]]
+) -> List[List[int]]:
+    """
+    校验依赖列表
+
+    长度不一致或缺失时返回线性依赖；只保留指向更早步骤的合法位置（去重、排序）。
+
+    参数:
+        count: 步骤数
+        dependencies: 原始依赖列表
+
+    返回:
+        规范化后的依赖列表
+    """
+    if not isinstance(dependencies, (list, tuple)) or len(dependencies) != count:
+        return linear_dependencies(count)
+    normalized = []
+    for index, deps in enumerate(dependencies):
+        if not isinstance(deps, (list, tuple)):
+            deps = [index - 1] if index > 0 else []
+        normalized.append(
+            sorted({d for d in deps if isinstance(d, int) and 0 <= d < index})
+        )
+    return normalized
+
+
+def ancestors(dependencies: Sequence[Sequence[int]], index: int) -> List[int]:
+    """步骤 index 的依赖闭包（不含自身，按计划顺序）"""
+    seen: Set[int] = set()
+    stack = list(dependencies[index])
+    while stack:
+        current = stack.pop()
+        if current not in seen:
+            seen.add(current)
+            stack.extend(dependencies[current])
+    return sorted(seen)
+
+
+def reusable_steps(
+    dependencies: Sequence[Sequence[int]], completed: Dict[int, Any]
+) -> Dict[int, Any]:
+    """
+    筛选可以直接复用的已完成步骤
+
+    步骤的依赖闭包全部可复用时，它的输出才仍然有效（依赖重新执行后输出可能不同）。
+    线性依赖下等价于"从第 0 步开始的连续前缀"。
+    """
+    reusable: Dict[int, Any] = {}
+    for index in range(len(dependencies)):
+        if index in completed and all(d in reusable for d in dependencies[index]):
+            reusable[index] = completed[index]
+    return reusable
+
+
+class PlanStepError(Exception):
+    """计划步骤执行失败"""
+
+    def __init__(self, step_index: int, step_title: str, error: BaseException):
+        super().__init__(f"Step {step_index + 1} failed: {error}")
+        self.step_index = step_index
+        self.step_title = step_title
+        self.error = error
+
+
+class PlanDagExecutor:
+    """按依赖并发执行计划步骤"""
+
+    def __init__(
+        self,
+        steps: List[str],
+        dependencies: Optional[Sequence[Sequence[int]]],
+        run_step: Callable[[int, list], tuple],
+        max_concurrency: Optional[int] = None,
+        on_start: Optional[Callable[[int, List[int]], None]] = None,
+        on_complete: Optional[Callable[[int, list, str, List[int]], None]] = None,
+    ):
+        """
+        参数:
+            steps: 计划步骤标题
+            dependencies: 依赖列表（None 表示线性顺序）
+            run_step: run_step(index, history) -> (step_desc, agent_name, output)，
+                history 为依赖闭包中步骤的 [step_title, step_desc, output]
+            max_concurrency: 同时执行的步骤数上限（None 表示从 PLAN_MAX_CONCURRENCY 读取，默认 3）
+            on_start: on_start(index, running) 步骤开始时调用，running 为正在执行的步骤位置
+            on_complete: on_complete(index, entry, agent_name, running) 步骤完成时调用
+        """
+        self.steps = steps
+        self.dependencies = normalize_dependencies(len(steps), dependencies)
+        self.run_step = run_step
+        self.max_concurrency = max(
+            1,
+            max_concurrency
+            if max_concurrency is not None
+            else int(os.getenv("PLAN_MAX_CONCURRENCY", "3")),
+        )
+        self.on_start = on_start
+        self.on_complete = on_complete
+
+    def run(self, completed: Optional[Dict[int, list]] = None) -> Dict[int, list]:
+        """
+        执行所有未完成的步骤
+
+        回调都在调用线程中执行；步骤在线程池中执行（复制调用方的上下文，共享取消令牌）。
+        任一步骤失败时抛出 PlanStepError，不再启动新的步骤。
+
+        参数:
+            completed: 已完成的步骤 {位置: [step_title, step_desc, output]}
+                （只复用依赖闭包全部完成的步骤）
+
+        返回:
+            全部步骤的结果 {位置: [step_title, step_desc, output]}
+        """
+        results = reusable_steps(self.dependencies, completed or {})
+        pending = [index for index in range(len(self.steps)) if index not in results]
+        running: Dict[Future, int] = {}
+        poll_interval = float(os.getenv("CANCEL_POLL_INTERVAL", "0.5"))
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="PlanStep"
+        )
+        try:
+            while pending or running:
+                check_cancelled()
+
+                ready = [
+                    index
+                    for index in pending
+                    if all(d in results for d in self.dependencies[index])
+                ]
+                for index in ready[: self.max_concurrency - len(running)]:
+                    pending.remove(index)
+                    history = [results[a] for a in ancestors(self.dependencies, index)]
+                    future = executor.submit(
+                        contextvars.copy_context().run, self.run_step, index, history
+                    )
+                    running[future] = index
+                    if self.on_start:
+                        self.on_start(index, sorted(running.values()))
+
+                if not running:
+                    # 依赖只指向更早的步骤，正常情况下不会发生
+                    raise RuntimeError(f"计划依赖无法满足: {pending}")
+
+                done, _ = wait(list(running), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda f: running[f]):
+                    index = running.pop(future)
+                    try:
+                        step_desc, agent_name, output = future.result()
+                    except Exception as e:
+                        raise PlanStepError(index, self.steps[index], e) from e
+                    entry = [self.steps[index], step_desc, output]
+                    results[index] = entry
+                    if self.on_complete:
+                        self.on_complete(index, entry, agent_name, sorted(running.values()))
+            return results
+        finally:
+            # 失败或取消时不等待仍在执行的步骤（它们会在后台结束）
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,14 @@
 """
 规划代理模块 - 负责组织和执行多代理研究工作流
 本模块包含：
-1. planner_agent: 生成研究计划步骤
+1. planner_agent: 生成研究计划步骤（可选输出步骤依赖）
 2. executor_agent_step: 执行单个计划步骤
 3. clean_json_block: 清理 JSON 代码块
 """
 
 import json
 import re
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from aisuite import Client
 from src.agents import (
@@ -20,10 +20,20 @@ from src.config import ModelConfig
 from src.cost_tracker import tracker
 from src.fallback import with_fallback
 from src.model_adapter import ModelAdapter
+from src.context_policies import context_routing_enabled, select_history
+from src.history_compaction import compact_history, latest_draft_index
+from src.plan_dag import linear_dependencies
+from src.research_fanout import fanout_research, fanout_subtopic_count
 
 # 初始化 AI 客户端
 client = Client()
 
+# 计划的固定步骤：无论规划模型返回什么，_ensure_contract 都会强制第一步、第二步和最后一步。
+# 第一步不依赖计划内容，因此可以在规划调用进行时提前执行（见 main.run_research_task）
+REQUIRED_FIRST_STEP = "Research agent: Use Tavily to perform a broad web search and collect top relevant items (title, authors, year, venue/source, URL, DOI if available)."
+REQUIRED_SECOND_STEP = "Research agent: For each collected item, search on arXiv to find matching preprints/versions and record arXiv URLs (if they exist)."
+REQUIRED_FINAL_STEP = "Writer agent: Generate the final comprehensive Markdown report with inline citations and a complete References section with clickable links."
+
 
 def clean_json_block(raw: str) -> str:
     """
@@ -46,17 +56,63 @@ from typing import List
 import json, ast
 
 
+# 要求规划模型声明步骤依赖时附加的提示词
+DEPENDENCY_INSTRUCTIONS = """
+🔀 Step dependencies:
+Independent steps can run at the same time. Return a JSON list where each item is an object
+{"step": "<step text>", "depends_on": [<1-based numbers of EARLIER steps whose output this step needs>]}.
+Use an empty depends_on list only when a step needs nothing but the topic itself
+(e.g. a separate search angle). Writer and editor steps must depend on the research they use.
+"""
+
+
+def _plan_dependencies(steps: List[str], declared: dict) -> List[List[int]]:
+    """
+    把规划模型按步骤文本声明的依赖映射到最终计划的位置
+
+    _ensure_contract 可能插入或移动步骤，因此依赖按步骤文本而不是序号对应。
+    固定步骤的依赖不受模型影响：第一步无依赖，arXiv 步骤依赖 Tavily 步骤，
+    最后的报告步骤依赖之前的全部步骤；未声明依赖的步骤依赖前一步。
+    没有任何步骤声明依赖时返回线性依赖。
+    """
+    if not any(deps is not None for deps in declared.values()):
+        return linear_dependencies(len(steps))
+
+    index_of = {}
+    for index, title in enumerate(steps):
+        index_of.setdefault(title, index)
+
+    dependencies = []
+    for index, title in enumerate(steps):
+        if index == 0:
+            dependencies.append([])
+        elif title == REQUIRED_SECOND_STEP:
+            dependencies.append([0])
+        elif index == len(steps) - 1:
+            dependencies.append(list(range(index)))
+        elif declared.get(title) is None:
+            dependencies.append([index - 1])
+        else:
+            dependencies.append(
+                sorted({index_of[d] for d in declared[title] if index_of.get(d, index) < index})
+            )
+    return dependencies
+
+
 @with_fallback
-def planner_agent(topic: str, model: str = None) -> List[str]:
+def planner_agent(topic: str, model: str = None, with_dependencies: bool = False):
     """
     规划代理 - 为研究主题生成结构化的执行步骤
 
     参数:
         topic: 研究主题
         model: 使用的 AI 模型（默认: None, 使用 ModelConfig.PLANNER_MODEL）
+        with_dependencies: 是否要求模型声明步骤依赖（默认: False）
 
     返回:
-        List[str]: 研究步骤列表（最多7步）
+        List[str]: 研究步骤列表（最多7步）；
+        with_dependencies=True 时返回 (steps, dependencies)，
+        dependencies[i] 为步骤 i 依赖的更早步骤位置（从 0 开始）
     """
     # 如果未指定模型，使用配置的默认模型
     if model is None:
@@ -95,6 +151,8 @@ Maximum of 7 steps.
 
 Topic: "{topic}"
 """
+    if with_dependencies:
+        prompt += DEPENDENCY_INSTRUCTIONS
 
     # 调用 AI 模型生成研究计划（使用 ModelAdapter 确保参数安全）
     response = ModelAdapter.safe_api_call(
@@ -105,7 +163,7 @@ Topic: "{topic}"
     )
 
     # 追踪成本
-    if hasattr(response, 'usage') and response.usage:
+    if hasattr(response, 'usage') and response.usage and not getattr(response, 'cache_hit', False):
         tracker.track(
             model,
             response.usage.prompt_tokens,
@@ -116,39 +174,69 @@ Topic: "{topic}"
     raw = response.choices[0].message.content.strip()
 
     # --- 鲁棒的解析：尝试 JSON -> Python 字面量 -> 回退 ---
-    def _coerce_to_list(s: str) -> List[str]:
-        """尝试将字符串转换为字符串列表"""
+    def _is_step_list(obj) -> bool:
+        """步骤列表的元素为字符串，或 {"step": ..., "depends_on": [...]} 对象"""
+        return isinstance(obj, list) and all(isinstance(x, (str, dict)) for x in obj)
+
+    def _coerce_to_list(s: str) -> list:
+        """尝试将字符串转换为步骤列表"""
         # 尝试严格的 JSON 解析
         try:
             obj = json.loads(s)
-            if isinstance(obj, list) and all(isinstance(x, str) for x in obj):
+            if _is_step_list(obj):
                 return obj[:7]
         except json.JSONDecodeError:
             pass
         # 尝试 Python 字面量列表
         try:
             obj = ast.literal_eval(s)
-            if isinstance(obj, list) and all(isinstance(x, str) for x in obj):
+            if _is_step_list(obj):
                 return obj[:7]
         except Exception:
             pass
         # 尝试提取代码围栏中的内容
         if s.startswith("```") and s.endswith("```"):
-            inner = s.strip("`")
+            inner = clean_json_block(s)
+            try:
+                obj = json.loads(inner)
+                if _is_step_list(obj):
+                    return obj[:7]
+            except Exception:
+                pass
             try:
                 obj = ast.literal_eval(inner)
-                if isinstance(obj, list) and all(isinstance(x, str) for x in obj):
+                if _is_step_list(obj):
                     return obj[:7]
             except Exception:
                 pass
         return []
 
-    steps = _coerce_to_list(raw)
+    # 拆分步骤文本和声明的依赖（依赖序号从 1 开始，转换为被依赖步骤的文本）
+    items = _coerce_to_list(raw)
+    item_titles = [
+        (x.get("step") if isinstance(x, dict) else x) for x in items
+    ]
+    steps = []
+    declared = {}
+    for item, title in zip(items, item_titles):
+        if not isinstance(title, str) or not title.strip():
+            continue
+        steps.append(title)
+        deps = item.get("depends_on") if isinstance(item, dict) else None
+        if isinstance(deps, list):
+            declared[title] = [
+                item_titles[n - 1]
+                for n in deps
+                if isinstance(n, int) and 1 <= n <= len(item_titles)
+                and isinstance(item_titles[n - 1], str)
+            ]
+        else:
+            declared.setdefault(title, None)
 
     # 强制执行步骤顺序和最小契约
-    required_first = "Research agent: Use Tavily to perform a broad web search and collect top relevant items (title, authors, year, venue/source, URL, DOI if available)."
-    required_second = "Research agent: For each collected item, search on arXiv to find matching preprints/versions and record arXiv URLs (if they exist)."
-    final_required = "Writer agent: Generate the final comprehensive Markdown report with inline citations and a complete References section with clickable links."
+    required_first = REQUIRED_FIRST_STEP
+    required_second = REQUIRED_SECOND_STEP
+    final_required = REQUIRED_FINAL_STEP
 
     def _ensure_contract(steps_list: List[str]) -> List[str]:
         """确保步骤列表符合最小契约要求"""
@@ -185,9 +273,38 @@ Topic: "{topic}"
 
     steps = _ensure_contract(steps)
 
+    if with_dependencies:
+        return steps, _plan_dependencies(steps, declared)
     return steps
 
 
+def _latest_draft(history: list) -> Optional[str]:
+    """历史记录中最新的草稿（写作或编辑步骤的输出，与上下文中的文本一致）"""
+    index = latest_draft_index(history)
+    return history[index][2].strip() if index is not None else None
+
+
+def _build_context(prompt: str, entries: list) -> str:
+    """
+    构建结构化的上下文
+
+    参数:
+        prompt: 用户原始提示
+        entries: [(原始步骤位置, [step_title, step_desc, output]), ...]
+    """
+    context = f"📘 用户提示:\n{prompt}\n\n📜 历史记录:\n"
+    for i, (desc, agent, output) in entries:
+        if "draft" in desc.lower() or agent == "writer_agent":
+            context += f"\n✍️ 草稿 (步骤 {i + 1}):\n{output.strip()}\n"
+        elif "feedback" in desc.lower() or agent == "editor_agent":
+            context += f"\n🧠 反馈 (步骤 {i + 1}):\n{output.strip()}\n"
+        elif "research" in desc.lower() or agent == "research_agent":
+            context += f"\n🔍 研究 (步骤 {i + 1}):\n{output.strip()}\n"
+        else:
+            context += f"\n🧩 其他 (步骤 {i + 1}) 由 {agent} 执行:\n{output.strip()}\n"
+    return context
+
+
 def executor_agent_step(step_title: str, history: list, prompt: str):
     """
     执行单个代理步骤
@@ -208,17 +325,33 @@ def executor_agent_step(step_title: str, history: list, prompt: str):
         - output (str)
     """
 
+    # 根据步骤描述选择相应的代理
+    step_lower = step_title.lower()
+    if "research" in step_lower:
+        agent_name = "research_agent"
+    elif "draft" in step_lower or "write" in step_lower:
+        agent_name = "writer_agent"
+    elif "revise" in step_lower or "edit" in step_lower or "feedback" in step_lower:
+        agent_name = "editor_agent"
+    else:
+        raise ValueError(f"未知的步骤类型: {step_title}")
+
+    # 按代理的上下文策略筛选历史；超过 token 预算时较早步骤的输出替换为摘要（最新草稿保持原文）
+    if context_routing_enabled():
+        selected = select_history(agent_name, history)
+    else:
+        selected = list(enumerate(history))
+    compacted = compact_history([entry for _, entry in selected])
+    entries = [(index, entry) for (index, _), entry in zip(selected, compacted)]
+
     # 构建结构化的丰富上下文
-    context = f"📘 用户提示:\n{prompt}\n\n📜 历史记录:\n"
-    for i, (desc, agent, output) in enumerate(history):
-        if "draft" in desc.lower() or agent == "writer_agent":
-            context += f"\n✍️ 草稿 (步骤 {i + 1}):\n{output.strip()}\n"
-        elif "feedback" in desc.lower() or agent == "editor_agent":
-            context += f"\n🧠 反馈 (步骤 {i + 1}):\n{output.strip()}\n"
-        elif "research" in desc.lower() or agent == "research_agent":
-            context += f"\n🔍 研究 (步骤 {i + 1}):\n{output.strip()}\n"
-        else:
-            context += f"\n🧩 其他 (步骤 {i + 1}) 由 {agent} 执行:\n{output.strip()}\n"
+    context = _build_context(prompt, entries)
+    if history:
+        tracker.track_context_savings(
+            agent_name,
+            ModelAdapter.estimate_tokens(_build_context(prompt, list(enumerate(history)))),
+            ModelAdapter.estimate_tokens(context),
+        )
 
     enriched_task = f"""{context}
 
@@ -226,20 +359,19 @@ def executor_agent_step(step_title: str, history: list, prompt: str):
 {step_title}
 """
 
-    # 根据步骤描述选择相应的代理
-    step_lower = step_title.lower()
-    if "research" in step_lower:
-        # 调用研究代理
-        content, _ = research_agent(prompt=enriched_task)
+    if agent_name == "research_agent":
+        # 调用研究代理（开启扇出时按子主题并发研究后合并）
+        if fanout_subtopic_count() > 1:
+            content = fanout_research(enriched_task, topic=f"{prompt}\n{step_title}")
+        else:
+            content, _ = research_agent(prompt=enriched_task)
         print("🔍 研究代理输出:", content)
         return step_title, "research_agent", content
-    elif "draft" in step_lower or "write" in step_lower:
+    elif agent_name == "writer_agent":
         # 调用写作代理
         content, _ = writer_agent(prompt=enriched_task)
         return step_title, "writer_agent", content
-    elif "revise" in step_lower or "edit" in step_lower or "feedback" in step_lower:
-        # 调用编辑代理
-        content, _ = editor_agent(prompt=enriched_task)
-        return step_title, "editor_agent", content
     else:
-        raise ValueError(f"未知的步骤类型: {step_title}")
+        # 调用编辑代理（补丁模式下修改应用到最新的草稿）
+        content, _ = editor_agent(prompt=enriched_task, draft=_latest_draft(history))
+        return step_title, "editor_agent", content
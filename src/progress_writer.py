@@ -0,0 +1,211 @@
+"""
+进度写入模块 - 研究任务进度的批量延迟写入（write-behind）
+
+本模块提供：
+1. PendingUpdate: 某个任务尚未写入数据库的更新（事件、progress、queue_info、字段）
+2. ProgressWriter: 按任务合并更新，定时批量刷新；状态转换时同步刷新
+
+run_research_task 原先在每个计划/进度事件后都提交一次事务，多个 worker 同时运行时
+会产生大量针对相同行的小事务。现在进度更新先在内存中按任务合并，
+由后台线程按固定间隔（默认 0.5 秒）刷新，状态轮询的延迟不超过一个刷新间隔；
+状态转换（running / completed / failed）会连同之前未写入的更新一起同步写入，
+保证状态转换持久化且事件顺序不变。
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PendingUpdate:
+    """某个任务待写入的更新"""
+
+    def __init__(self):
+        # (事件类型, 描述, 附加数据, 发生时间)，按发生顺序排列
+        self.events: List[Tuple[str, str, Optional[Dict[str, Any]], datetime]] = []
+        # 合并进 progress / queue_info JSON 列的键值
+        self.progress: Dict[str, Any] = {}
+        self.queue_info: Dict[str, Any] = {}
+        # 直接赋值的列（status, report, completed_at ...）
+        self.fields: Dict[str, Any] = {}
+
+    def is_empty(self) -> bool:
+        return not (self.events or self.progress or self.queue_info or self.fields)
+
+    def merge_after(self, earlier: "PendingUpdate") -> None:
+        """把更早的未写入更新合并到本更新之前（刷新失败时回填用）"""
+        self.events = earlier.events + self.events
+        self.progress = {**earlier.progress, **self.progress}
+        self.queue_info = {**earlier.queue_info, **self.queue_info}
+        self.fields = {**earlier.fields, **self.fields}
+
+
+class ProgressWriter:
+    """按任务合并进度更新并批量写入"""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[str, PendingUpdate], None],
+        interval: Optional[float] = None,
+    ):
+        """
+        参数:
+            flush_fn: 写入函数 flush_fn(task_id, update)，在一个事务中写入全部更新
+            interval: 后台刷新间隔（秒，None 表示从 PROGRESS_FLUSH_INTERVAL 读取，默认 0.5）
+        """
+        self.flush_fn = flush_fn
+        self.interval = (
+            interval
+            if interval is not None
+            else float(os.getenv("PROGRESS_FLUSH_INTERVAL", "0.5"))
+        )
+        self._pending: Dict[str, PendingUpdate] = {}
+        self._lock = threading.Lock()
+        # 每个任务一把刷新锁：后台刷新与同步刷新不会交错，保证写入顺序
+        self._flush_locks: Dict[str, threading.Lock] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- 记录更新 -----
+    def _get_pending(self, task_id: str) -> PendingUpdate:
+        pending = self._pending.get(task_id)
+        if pending is None:
+            pending = self._pending[task_id] = PendingUpdate()
+        return pending
+
+    def add_event(
+        self,
+        task_id: str,
+        event_type: str,
+        message: str,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """记录一个事件（下次刷新时写入）"""
+        self._ensure_started()
+        with self._lock:
+            self._get_pending(task_id).events.append(
+                (event_type, message, dict(extra) if extra else None, datetime.utcnow())
+            )
+
+    def update_progress(self, task_id: str, **values) -> None:
+        """合并 progress 计数器（同一键只保留最新值）"""
+        self._ensure_started()
+        with self._lock:
+            self._get_pending(task_id).progress.update(values)
+
+    def update_queue_info(self, task_id: str, **values) -> None:
+        """合并 queue_info 字段"""
+        self._ensure_started()
+        with self._lock:
+            self._get_pending(task_id).queue_info.update(values)
+
+    # ----- 刷新 -----
+    def _flush_lock(self, task_id: str) -> threading.Lock:
+        with self._lock:
+            lock = self._flush_locks.get(task_id)
+            if lock is None:
+                lock = self._flush_locks[task_id] = threading.Lock()
+            return lock
+
+    def flush(self, task_id: str) -> None:
+        """
+        同步写入该任务的全部待写更新
+
+        写入失败时更新会被放回队列（保持原有顺序）并抛出异常。
+        """
+        with self._flush_lock(task_id):
+            with self._lock:
+                pending = self._pending.pop(task_id, None)
+            if pending is None or pending.is_empty():
+                return
+            try:
+                self.flush_fn(task_id, pending)
+            except Exception:
+                with self._lock:
+                    newer = self._pending.get(task_id)
+                    if newer is None:
+                        self._pending[task_id] = pending
+                    else:
+                        newer.merge_after(pending)
+                raise
+
+    def transition(
+        self,
+        task_id: str,
+        status: str,
+        event: Optional[Tuple[str, str, Optional[Dict[str, Any]]]] = None,
+        progress: Optional[Dict[str, Any]] = None,
+        queue_info: Optional[Dict[str, Any]] = None,
+        **fields,
+    ) -> None:
+        """
+        状态转换：与之前未写入的更新一起同步写入
+
+        参数:
+            task_id: 任务 ID
+            status: 新状态（running, completed, failed ...）
+            event: 可选的 (事件类型, 描述, 附加数据)
+            progress: 合并进 progress 的键值
+            queue_info: 合并进 queue_info 的键值
+            **fields: 其他列（report, completed_at ...）
+        """
+        with self._lock:
+            pending = self._get_pending(task_id)
+            if event is not None:
+                event_type, message, extra = event
+                pending.events.append(
+                    (event_type, message, dict(extra) if extra else None, datetime.utcnow())
+                )
+            pending.progress.update(progress or {})
+            pending.queue_info.update(queue_info or {})
+            pending.fields.update(fields)
+            pending.fields["status"] = status
+        self.flush(task_id)
+        if status in ("completed", "failed", "cancelled"):
+            with self._lock:
+                self._flush_locks.pop(task_id, None)
+
+    def discard(self, task_id: str) -> None:
+        """丢弃任务的待写更新"""
+        with self._lock:
+            self._pending.pop(task_id, None)
+            self._flush_locks.pop(task_id, None)
+
+    def flush_all(self) -> None:
+        """写入所有任务的待写更新（单个任务失败不影响其他任务）"""
+        with self._lock:
+            task_ids = list(self._pending)
+        for task_id in task_ids:
+            try:
+                self.flush(task_id)
+            except Exception as e:
+                logger.warning(f"⚠️ 任务 {task_id} 进度写入失败，稍后重试: {e}")
+
+    # ----- 后台线程 -----
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="ProgressWriter", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.flush_all()
+
+    def stop(self) -> None:
+        """停止后台线程并写入剩余更新"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.interval * 2))
+            self._thread = None
+        self.flush_all()
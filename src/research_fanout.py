@@ -0,0 +1,256 @@
+"""
+子主题扇出研究模块 - 把宽泛的研究任务拆成子主题并发研究
+
+本模块提供：
+1. split_subtopics: 让模型把研究任务拆分为互不重叠的子主题
+2. merge_findings: 按子主题顺序确定性地合并研究结果（段落、来源、工具调用去重）
+3. fanout_research: 每个子主题一个 research_agent 并发执行，再合并结果
+
+单个 research_agent 最多串行执行 5 轮工具调用；宽泛的主题拆成 N 个子主题并发研究后，
+研究阶段的耗时约等于最慢的子主题，而不是全部查询耗时之和。
+合并只依赖子主题顺序（不依赖完成顺序），同一输入总是得到相同的输出。
+"""
+
+import ast
+import contextvars
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from aisuite import Client
+
+from src import agents
+from src.cancellation import wait_future
+from src.config import ModelConfig
+from src.cost_tracker import tracker
+from src.model_adapter import ModelAdapter
+
+logger = logging.getLogger(__name__)
+
+# 初始化 AI 客户端
+client = Client()
+
+# research_agent 在输出末尾附加的工具调用列表
+_TOOLS_BLOCK_RE = re.compile(r"\s*<h2[^>]*>\s*📎 Tools used\s*</h2>\s*<ul>(.*?)</ul>", re.S)
+_TOOL_ITEM_RE = re.compile(r"<li>(.*?)</li>", re.S)
+_URL_RE = re.compile(r"https?://[^\s<>\"')\]]+")
+
+
+def fanout_subtopic_count() -> int:
+    """扇出的子主题数（RESEARCH_FANOUT_SUBTOPICS，默认 0 表示不扇出）"""
+    return int(os.getenv("RESEARCH_FANOUT_SUBTOPICS", "0"))
+
+
+def split_subtopics(task: str, count: int, model: str = None) -> List[str]:
+    """
+    把研究任务拆分为最多 count 个互不重叠的子主题
+
+    参数:
+        task: 研究任务（用户主题 + 当前研究步骤）
+        count: 子主题数上限
+        model: 使用的 AI 模型（默认: None, 使用 ModelConfig.RESEARCHER_MODEL）
+
+    返回:
+        List[str]: 子主题列表（解析失败时为空列表，由调用方回退为单个研究代理）
+    """
+    if model is None:
+        model = ModelConfig.RESEARCHER_MODEL
+
+    prompt = f"""
+Split the following research task into at most {count} NON-overlapping subtopics that together cover it.
+Each subtopic must be a short, self-contained search focus (one sentence).
+Return ONLY a valid Python list of strings, no explanations.
+
+Research task:
+{task}
+""".strip()
+
+    try:
+        response = ModelAdapter.safe_api_call(
+            client=client,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ 子主题拆分失败，回退为单个研究代理: {e}")
+        return []
+
+    if hasattr(response, "usage") and response.usage and not getattr(response, "cache_hit", False):
+        tracker.track(
+            model,
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens,
+            metadata={"agent": "research_fanout"},
+        )
+
+    raw = (response.choices[0].message.content or "").strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`")
+        raw = raw[raw.find("[") :] if "[" in raw else raw
+    obj = None
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            obj = parse(raw)
+            break
+        except Exception:
+            continue
+    if not isinstance(obj, list):
+        return []
+
+    subtopics = []
+    seen = set()
+    for item in obj:
+        if not isinstance(item, str) or not item.strip():
+            continue
+        key = _normalize(item)
+        if key not in seen:
+            seen.add(key)
+            subtopics.append(item.strip())
+    return subtopics[:count]
+
+
+def _normalize(text: str) -> str:
+    """去重用的规范化文本（忽略大小写和空白差异）"""
+    return " ".join(text.lower().split())
+
+
+def _normalize_url(url: str) -> str:
+    """去重用的规范化 URL（忽略结尾标点和斜杠、协议与大小写差异）"""
+    url = url.rstrip(".,;:").rstrip("/")
+    return re.sub(r"^https?://(www\.)?", "", url).lower()
+
+
+def _split_tools_block(output: str) -> Tuple[str, List[str]]:
+    """拆分研究结果正文和工具调用列表"""
+    match = _TOOLS_BLOCK_RE.search(output)
+    if not match:
+        return output, []
+    tools = [item.strip() for item in _TOOL_ITEM_RE.findall(match.group(1))]
+    return output[: match.start()] + output[match.end() :], tools
+
+
+def merge_findings(subtopics: List[str], outputs: List[str]) -> str:
+    """
+    按子主题顺序合并研究结果
+
+    去重规则：
+    - 段落（空行分隔）在之前的子主题中出现过则跳过
+    - 来源 URL 汇总为一个列表，按首次出现的顺序去重
+    - 工具调用列表合并为一个，按首次出现的顺序去重
+
+    参数:
+        subtopics: 子主题列表
+        outputs: 与子主题一一对应的研究结果
+
+    返回:
+        str: 合并后的研究结果（与 research_agent 输出格式一致，工具调用列表在末尾）
+    """
+    seen_paragraphs = set()
+    seen_urls = set()
+    seen_tools = set()
+    urls: List[str] = []
+    tools: List[str] = []
+    sections = []
+
+    for index, (subtopic, output) in enumerate(zip(subtopics, outputs), start=1):
+        body, tool_lines = _split_tools_block(output)
+        for line in tool_lines:
+            if line not in seen_tools:
+                seen_tools.add(line)
+                tools.append(line)
+
+        paragraphs = []
+        for paragraph in re.split(r"\n\s*\n", body.strip()):
+            key = _normalize(paragraph)
+            if not key or key in seen_paragraphs:
+                continue
+            seen_paragraphs.add(key)
+            paragraphs.append(paragraph.strip())
+            for url in _URL_RE.findall(paragraph):
+                url_key = _normalize_url(url)
+                if url_key not in seen_urls:
+                    seen_urls.add(url_key)
+                    urls.append(url.rstrip(".,;:"))
+
+        sections.append(f"## Subtopic {index}: {subtopic}\n\n" + "\n\n".join(paragraphs))
+
+    content = "\n\n".join(sections)
+    if urls:
+        content += "\n\n## Sources (deduplicated)\n\n" + "\n".join(f"- {url}" for url in urls)
+    if tools:
+        content += (
+            "\n\n<h2 style='font-size:1.5em; color:#2563eb;'>📎 Tools used</h2>"
+            + "<ul>" + "".join(f"<li>{line}</li>" for line in tools) + "</ul>"
+        )
+    return content
+
+
+def fanout_research(
+    task: str,
+    topic: str,
+    count: Optional[int] = None,
+    research: Optional[Callable[..., tuple]] = None,
+) -> str:
+    """
+    子主题扇出研究
+
+    拆分出的子主题少于 2 个时回退为单个研究代理。
+    某个子主题失败时跳过它；全部失败时返回第一个错误输出。
+
+    参数:
+        task: 完整的研究任务（含历史上下文，传给每个子主题的研究代理）
+        topic: 用于拆分子主题的简短描述（用户主题 + 当前步骤）
+        count: 子主题数上限（None 表示从 RESEARCH_FANOUT_SUBTOPICS 读取）
+        research: 研究代理（默认: agents.research_agent）
+
+    返回:
+        str: 合并后的研究结果
+    """
+    research = research or agents.research_agent
+    count = count if count is not None else fanout_subtopic_count()
+
+    subtopics = split_subtopics(topic, count) if count > 1 else []
+    if len(subtopics) < 2:
+        content, _ = research(prompt=task)
+        return content
+
+    logger.info(f"🔀 扇出研究 {len(subtopics)} 个子主题: {subtopics}")
+
+    def _research_subtopic(subtopic: str) -> str:
+        content, _ = research(
+            prompt=f"{task}\n\n🎯 子主题（只研究这一方面，避免与其他子主题重复）:\n{subtopic}"
+        )
+        return content
+
+    executor = ThreadPoolExecutor(
+        max_workers=len(subtopics), thread_name_prefix="ResearchFanout"
+    )
+    try:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _research_subtopic, subtopic)
+            for subtopic in subtopics
+        ]
+        kept_subtopics, outputs, errors = [], [], []
+        for subtopic, future in zip(subtopics, futures):
+            try:
+                output = wait_future(future)
+            except Exception as e:
+                logger.warning(f"⚠️ 子主题研究失败 ({subtopic}): {e}")
+                errors.append(f"[Model Error: {str(e)}]")
+                continue
+            if output.startswith("[Model Error"):
+                logger.warning(f"⚠️ 子主题研究失败 ({subtopic}): {output[:100]}")
+                errors.append(output)
+                continue
+            kept_subtopics.append(subtopic)
+            outputs.append(output)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not outputs:
+        return errors[0]
+    return merge_findings(kept_subtopics, outputs)
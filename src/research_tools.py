@@ -9,9 +9,17 @@
 
 from typing import List, Dict, Optional
 import os, re, time
+import threading
 import requests
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
+from urllib.parse import urlparse
+
+from src.pdf_cache import get_pdf_cache
+from src.pdf_extractor import extract_pdf_text
+from src.search_cache import cached_search
 
 # ----- 带重试和请求头的会话配置 -----
 from requests.adapters import HTTPAdapter
@@ -61,6 +69,72 @@ def _build_session(
 session = _build_session()
 
 
+# ----- 按主机限速 -----
+class HostRateLimiter:
+    """
+    按主机限速器 - 控制对同一主机的请求频率和并发数
+
+    - 同一主机相邻两次请求的开始时间至少间隔 min_interval 秒
+    - 同一主机同时进行的请求不超过 max_concurrent 个
+    """
+
+    def __init__(self, min_interval: float = 3.0, max_concurrent: int = 1):
+        """
+        参数:
+            min_interval: 同一主机请求开始时间的最小间隔（秒）
+            max_concurrent: 同一主机的最大并发请求数
+        """
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrent)
+            return self._semaphores[host]
+
+    def _wait_for_slot(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    @contextmanager
+    def limit(self, url: str):
+        """
+        在限速范围内执行请求
+
+        用法:
+            with limiter.limit(pdf_url):
+                r = session.get(pdf_url)
+        """
+        host = urlparse(url).netloc.lower()
+        with self._semaphore(host):
+            self._wait_for_slot(host)
+            yield
+
+
+def create_arxiv_rate_limiter() -> HostRateLimiter:
+    """
+    按 arXiv 的礼貌访问要求创建限速器：每 3 秒一个请求、单连接
+
+    ARXIV_MIN_INTERVAL / ARXIV_MAX_CONCURRENT_DOWNLOADS 可调整（默认 3.0 秒 / 1）
+    """
+    return HostRateLimiter(
+        min_interval=float(os.getenv("ARXIV_MIN_INTERVAL", "3.0")),
+        max_concurrent=int(os.getenv("ARXIV_MAX_CONCURRENT_DOWNLOADS", "1")),
+    )
+
+
+arxiv_rate_limiter = create_arxiv_rate_limiter()
+
+
 # ----- 工具函数 -----
 def ensure_pdf_url(abs_or_pdf_url: str) -> str:
     """
@@ -222,9 +296,49 @@ def arxiv_search_tool(
     _MAX_PAGES = 6  # 最多提取的页数
     _TEXT_CHARS = 5000  # 文本字符数限制
     _SAVE_FULL_TEXT = False  # 是否保存完整文本
-    _SLEEP_SECONDS = 1.0  # 请求间隔（秒）
+    _DOWNLOAD_WORKERS = int(os.getenv("ARXIV_DOWNLOAD_WORKERS", "3"))  # 并发处理的论文数
     # ==========================
 
+    def _enrich(item: Dict) -> None:
+        """下载单篇论文的 PDF 并提取文本（结果写回 item，优先使用磁盘缓存）"""
+        link_pdf = item.get("link_pdf")
+        if not link_pdf:
+            return
+
+        cache = get_pdf_cache()
+
+        # 命中文本缓存时无需下载和解析
+        text = cache.get_text(link_pdf, max_pages=_MAX_PAGES) if cache and _EXTRACT_TEXT else None
+
+        if text is None:
+            # 下载 PDF（按主机限速，避免请求过快）
+            pdf_bytes = cache.get_pdf(link_pdf) if cache else None
+            if pdf_bytes is None:
+                try:
+                    with arxiv_rate_limiter.limit(link_pdf):
+                        pdf_bytes = fetch_pdf_bytes(link_pdf, timeout=90)
+                    if cache:
+                        cache.put_pdf(link_pdf, pdf_bytes)
+                except Exception as e:
+                    item["pdf_error"] = f"PDF 下载失败: {e}"
+
+            # 提取 PDF 文本（如果需要）
+            if _EXTRACT_TEXT and pdf_bytes:
+                try:
+                    # 在独立进程中解析（带超时和内存上限），不占用当前进程的 GIL
+                    text = extract_pdf_text(pdf_bytes, max_pages=_MAX_PAGES)
+                    text = clean_text(text) if text else ""
+                    if cache:
+                        cache.put_text(link_pdf, text, max_pages=_MAX_PAGES)
+                except Exception as e:
+                    item["text_error"] = f"文本提取失败: {e}"
+
+        if text:
+            if _SAVE_FULL_TEXT:
+                item["summary"] = text  # 保存完整文本
+            else:
+                item["summary"] = text[:_TEXT_CHARS]  # 截断文本
+
     # 构建 arXiv API 查询 URL
     api_url = (
         "https://export.arxiv.org/api/query"
@@ -233,7 +347,8 @@ def arxiv_search_tool(
 
     out: List[Dict] = []
     try:
-        resp = session.get(api_url, timeout=60)
+        with arxiv_rate_limiter.limit(api_url):
+            resp = session.get(api_url, timeout=60)
         resp.raise_for_status()
     except requests.exceptions.RequestException as e:
         return [{"error": f"arXiv API 请求失败: {e}"}]
@@ -283,30 +398,16 @@ def arxiv_search_tool(
                 "summary": abstract_summary,
                 "link_pdf": link_pdf,
             }
+            out.append(item)
 
-            # 下载 PDF（如果需要）
-            pdf_bytes = None
-            if (_INCLUDE_PDF or _EXTRACT_TEXT) and link_pdf:
-                try:
-                    pdf_bytes = fetch_pdf_bytes(link_pdf, timeout=90)
-                    time.sleep(_SLEEP_SECONDS)  # 避免请求过快
-                except Exception as e:
-                    item["pdf_error"] = f"PDF 下载失败: {e}"
-
-            # 提取 PDF 文本（如果需要）
-            if _EXTRACT_TEXT and pdf_bytes:
-                try:
-                    text = pdf_bytes_to_text(pdf_bytes, max_pages=_MAX_PAGES)
-                    text = clean_text(text) if text else ""
-                    if text:
-                        if _SAVE_FULL_TEXT:
-                            item["summary"] = text  # 保存完整文本
-                        else:
-                            item["summary"] = text[:_TEXT_CHARS]  # 截断文本
-                except Exception as e:
-                    item["text_error"] = f"文本提取失败: {e}"
+        # 下载和提取 PDF（流水线：下载并发进行且按主机限速，先下载完的先提取）
+        if (_INCLUDE_PDF or _EXTRACT_TEXT) and out:
+            workers = max(1, min(_DOWNLOAD_WORKERS, len(out)))
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="ArxivPDF"
+            ) as pool:
+                list(pool.map(_enrich, out))
 
-            out.append(item)
         return out
     except ET.ParseError as e:
         return [{"error": f"arXiv API XML 解析失败: {e}"}]
@@ -342,6 +443,7 @@ from tavily import TavilyClient
 load_dotenv()  # 从 .env 文件加载环境变量
 
 
+@cached_search("tavily_search_tool", "TAVILY_CACHE_TTL", 3600)
 def tavily_search_tool(
     query: str, max_results: int = 5, include_images: bool = False
 ) -> list[dict]:
@@ -424,6 +526,7 @@ from typing import List, Dict
 import wikipedia
 
 
+@cached_search("wikipedia_search_tool", "WIKIPEDIA_CACHE_TTL", 86400)
 def wikipedia_search_tool(query: str, sentences: int = 5) -> List[Dict]:
     """
     在 Wikipedia 上搜索给定查询的摘要
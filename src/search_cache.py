@@ -0,0 +1,436 @@
+"""
+搜索缓存模块 - Tavily / Wikipedia 搜索结果的分层 TTL 缓存
+
+本模块提供：
+1. TTLCache: 线程安全的内存 LRU 缓存（每个条目有独立过期时间）
+2. DiskCacheTier: 磁盘缓存层（同一主机上的多个进程共享）
+3. SearchCache: 内存 LRU + 磁盘两级缓存，支持负缓存和相同请求合并
+4. cached_search: 搜索工具装饰器
+
+规划阶段强制的第一步通常会让多个任务在几秒内发出相同的搜索。
+缓存键为"工具名 + 规范化查询 + 参数"；返回错误的结果只缓存很短时间（负缓存），
+同时进行的相同查询只会发出一次网络请求，其他调用等待并共享结果。
+"""
+
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：去除首尾空白、合并空白、转小写"""
+    return re.sub(r"\s+", " ", str(query)).strip().lower()
+
+
+def make_cache_key(namespace: str, query: str, **params) -> str:
+    """
+    生成缓存键
+
+    参数:
+        namespace: 命名空间（通常为工具名）
+        query: 查询字符串（会被规范化）
+        **params: 影响结果的其他参数
+
+    返回:
+        SHA-256 十六进制字符串
+    """
+    payload = json.dumps(
+        {"ns": namespace, "q": normalize_query(query), "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """线程安全的内存 LRU 缓存，每个条目有独立的过期时间"""
+
+    def __init__(self, max_entries: int = 1000):
+        """
+        参数:
+            max_entries: 最大条目数，超出时淘汰最久未使用的条目
+        """
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取条目（不存在或已过期返回 default）"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """写入条目（ttl 秒后过期）"""
+        self.set_until(key, value, time.time() + ttl)
+
+    def set_until(self, key: str, value: Any, expires_at: float) -> None:
+        """写入条目（在 expires_at 时间戳过期）"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """删除条目"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class DiskCacheTier:
+    """
+    磁盘缓存层 - 每个条目一个 JSON 文件
+
+    写入使用"临时文件 + os.replace"保证原子性。文件的 mtime 设为条目的过期时间，
+    清理时不需要读取文件内容：
+    - 每隔 sweep_interval 秒（由写入触发）删除所有已过期的文件
+    - 总大小超过上限时先删除过期文件，再按过期时间从早到晚淘汰
+    过期条目在读取时也会被删除。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: Optional[int] = None,
+        sweep_interval: float = 600.0,
+    ):
+        """
+        参数:
+            cache_dir: 缓存目录
+            max_bytes: 磁盘层总大小上限（None 表示从 SEARCH_CACHE_DISK_MAX_MB 读取，默认 256MB）
+            sweep_interval: 清理过期文件的最小间隔（秒）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(float(os.getenv("SEARCH_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024)
+        )
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self._last_sweep = time.monotonic()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """读取条目，返回 (过期时间戳, 值)；不存在或已过期返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 读取搜索缓存失败 {path}: {e}")
+            return None
+
+        if entry.get("expires_at", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry["expires_at"], entry["value"]
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        """写入条目"""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+                # mtime 记录过期时间（清理时按 mtime 判断）
+                os.utime(tmp_path, (time.time(), expires_at))
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ 写入搜索缓存失败 {path}: {e}")
+            return
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size - previous
+        self._evict(sweep=time.monotonic() - self._last_sweep >= self.sweep_interval)
+
+    # ----- 清理 -----
+    def _entries(self):
+        """列出所有缓存文件 [(过期时间, size, path)]"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for sub in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """磁盘层当前总大小（字节）"""
+        return sum(size for _, size, _ in self._entries())
+
+    def sweep(self) -> int:
+        """删除所有已过期的文件（超过大小上限时同时淘汰），返回删除的文件数"""
+        return self._evict(sweep=True)
+
+    def _evict(self, sweep: bool = False) -> int:
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self.size()
+            if not sweep and self._total_bytes <= self.max_bytes:
+                return 0
+            if sweep:
+                self._last_sweep = time.monotonic()
+
+            now = time.time()
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for expires_at, size, path in entries:
+                if expires_at > now and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._total_bytes = total
+        if removed:
+            logger.info(f"🧹 搜索磁盘缓存清理 {removed} 个文件，当前 {total / 1024 / 1024:.1f}MB")
+        return removed
+
+
+class _InFlight:
+    """进行中的请求（供相同查询的其他调用等待）"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SearchCache:
+    """内存 LRU + 磁盘两级搜索结果缓存"""
+
+    def __init__(self, max_entries: Optional[int] = None, cache_dir: Optional[str] = None):
+        """
+        参数:
+            max_entries: 内存层最大条目数（None 表示从 SEARCH_CACHE_MAX_ENTRIES 读取，默认 1000）
+            cache_dir: 磁盘层目录（None 表示从 SEARCH_CACHE_DIR 读取，默认 .cache/search；
+                空字符串表示只使用内存层）
+        """
+        max_entries = (
+            max_entries
+            if max_entries is not None
+            else int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+        )
+        cache_dir = cache_dir if cache_dir is not None else os.getenv("SEARCH_CACHE_DIR", ".cache/search")
+
+        self.memory = TTLCache(max_entries)
+        self.disk = DiskCacheTier(cache_dir) if cache_dir else None
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = _MISSING) -> Any:
+        """依次查询内存层和磁盘层（磁盘命中会回填内存层）"""
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                self.memory.set_until(key, value, expires_at)
+                return value
+        return default
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """写入两级缓存"""
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self.memory.set_until(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.set(key, value, expires_at)
+
+    def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        ttl: float,
+        negative_ttl: float = 0,
+        is_error: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 fetch 并写入缓存
+
+        同一时刻相同 key 的并发调用只会执行一次 fetch，其余调用等待并共享结果。
+        fetch 抛出的异常不缓存，会传给所有等待中的调用。
+
+        参数:
+            key: 缓存键
+            fetch: 未命中时获取结果的函数
+            ttl: 正常结果的缓存时间（秒）
+            negative_ttl: 错误结果的缓存时间（秒，0 表示不缓存）
+            is_error: 判断结果是否为错误的函数
+
+        返回:
+            结果的深拷贝（调用方修改结果不会影响缓存）
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            return copy.deepcopy(value)
+
+        with self._lock:
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = _InFlight()
+                self._inflight[key] = inflight
+
+        if not leader:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return copy.deepcopy(inflight.value)
+
+        try:
+            value = fetch()
+            failed = is_error(value) if is_error else False
+            self.set(key, value, negative_ttl if failed else ttl)
+            inflight.value = value
+            return copy.deepcopy(value)
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.done.set()
+
+
+def _is_error_result(result: Any) -> bool:
+    """搜索工具以 [{"error": ...}] 的形式返回错误"""
+    return isinstance(result, list) and any(
+        isinstance(item, dict) and "error" in item for item in result
+    )
+
+
+_cache: Optional[SearchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    获取全局搜索缓存（懒加载）
+
+    SEARCH_CACHE_ENABLED=false 时返回 None。
+    """
+    global _cache
+    if os.getenv("SEARCH_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache()
+    return _cache
+
+
+def cached_search(namespace: str, ttl_env: str, default_ttl: float):
+    """
+    搜索工具缓存装饰器
+
+    所有参数（包括默认值）都参与缓存键，第一个参数视为查询字符串。
+    被装饰函数的名称、签名和文档保持不变（工具定义依赖它们生成）。
+
+    参数:
+        namespace: 缓存命名空间（通常为工具名）
+        ttl_env: 读取 TTL 的环境变量名
+        default_ttl: 默认 TTL（秒）
+
+    用法:
+        @cached_search("tavily", "TAVILY_CACHE_TTL", 3600)
+        def tavily_search_tool(query: str, max_results: int = 5): ...
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_search_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            query = params.pop(next(iter(signature.parameters)))
+            key = make_cache_key(namespace, query, **params)
+
+            return cache.get_or_fetch(
+                key,
+                lambda: func(*args, **kwargs),
+                ttl=float(os.getenv(ttl_env, str(default_ttl))),
+                negative_ttl=float(os.getenv("SEARCH_NEGATIVE_CACHE_TTL", "60")),
+                is_error=_is_error_result,
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,352 @@
+"""
+分章节并行写作模块 - 先生成大纲和引用表，再并行撰写各章节
+
+本模块提供：
+1. REPORT_SECTIONS: 报告的必备章节（不含标题和参考文献）
+2. plan_outline: 生成标题、引用表（编号 → 参考文献）和各章节要点
+3. write_section: 按大纲撰写单个章节（共享同一份研究材料和引用表）
+4. assemble_report: 按出现顺序重新编号引用，生成唯一的 References 章节
+5. write_report_by_sections: 完整流程（大纲 → 并行章节 → 组装）
+
+writer_agent 一次生成 2400+ 词的报告时，耗时主要取决于单个输出流的解码速度，
+而且经常接近 deepseek-chat 8192 的 max_tokens 上限。
+分章节后每次调用只输出一个章节，各章节并行生成，耗时约等于最长的章节。
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from aisuite import Client
+
+from src.cancellation import wait_future
+from src.cost_tracker import tracker
+from src.model_adapter import ModelAdapter
+
+logger = logging.getLogger(__name__)
+
+# 初始化 AI 客户端
+client = Client()
+
+# 必备章节及目标字数（None 表示使用 min_words_per_section）
+REPORT_SECTIONS: List[Tuple[str, Optional[int]]] = [
+    ("Abstract", 150),
+    ("Introduction", None),
+    ("Background/Literature Review", None),
+    ("Methodology", None),
+    ("Key Findings/Results", None),
+    ("Discussion", None),
+    ("Conclusion", None),
+]
+
+# 章节中的数字引用：[1]、[1, 2]、[1-3]
+_CITATION_RE = re.compile(r"\[(\d+(?:\s*[,–-]\s*\d+)*)\](?!\()")
+# 章节模型自行输出的参考文献列表（组装时统一生成）
+_REFERENCES_RE = re.compile(r"\n#{1,6}\s*(References|Bibliography|参考文献)\b.*", re.S | re.I)
+
+
+def parallel_sections_enabled() -> bool:
+    """是否开启分章节并行写作（WRITER_PARALLEL_SECTIONS，默认 false）"""
+    return os.getenv("WRITER_PARALLEL_SECTIONS", "false").lower() in ("1", "true", "yes")
+
+
+def _call(model: str, messages: list, agent: str, max_tokens: Optional[int] = None) -> str:
+    """调用模型并记录成本（temperature=0，可命中 LLM 缓存）"""
+    api_params: Dict[str, Any] = {"temperature": 0}
+    if max_tokens is not None:
+        api_params["max_tokens"] = max_tokens
+    resp = ModelAdapter.safe_api_call(
+        client=client,
+        model=model,
+        messages=messages,
+        **api_params,
+    )
+    if hasattr(resp, "usage") and resp.usage and not getattr(resp, "cache_hit", False):
+        tracker.track(
+            model,
+            resp.usage.prompt_tokens,
+            resp.usage.completion_tokens,
+            metadata={"agent": agent},
+        )
+    return resp.choices[0].message.content or ""
+
+
+def _parse_json_object(raw: str) -> Optional[Dict[str, Any]]:
+    """解析模型返回的 JSON 对象（允许代码围栏和前后说明文字）"""
+    start, end = raw.find("{"), raw.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        obj = json.loads(raw[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def plan_outline(prompt: str, model: str) -> Optional[Dict[str, Any]]:
+    """
+    生成报告大纲和引用表
+
+    参数:
+        prompt: 写作任务描述和研究材料
+        model: 使用的 AI 模型
+
+    返回:
+        dict: {"title": str,
+               "sources": {编号: {"reference": str, "url": str}},
+               "points": {章节名: [要点, ...]}}
+        无法解析时返回 None（由调用方回退为一次性写作）
+    """
+    headings = ", ".join(name for name, _ in REPORT_SECTIONS)
+    instructions = f"""
+You are planning an academic report that several writers will draft in parallel, one section each.
+From the research materials below, produce ONLY a JSON object with this shape:
+
+{{
+  "title": "Report title",
+  "sources": [{{"id": 1, "reference": "Authors (Year). Title. Venue.", "url": "https://..."}}],
+  "sections": [{{"heading": "Introduction", "points": ["key point citing [1]", "..."]}}]
+}}
+
+Rules:
+- "sources" is the citation map: number EVERY source in the materials that the report should cite,
+  preserving the original URLs, DOIs and bibliographic details. Never invent sources.
+- "sections" must contain exactly these headings, in this order: {headings}.
+- Each section gets 3-6 concrete points; cite evidence with the source numbers, e.g. [1], [2].
+- Split the evidence so sections do not repeat each other.
+
+RESEARCH MATERIALS AND TASK:
+{prompt}
+""".strip()
+
+    raw = _call(model, [{"role": "user", "content": instructions}], "writer_outline")
+    obj = _parse_json_object(raw)
+    if obj is None:
+        logger.warning("⚠️ 报告大纲解析失败，回退为一次性写作")
+        return None
+
+    sources = {}
+    for item in obj.get("sources") or []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            number = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        sources.setdefault(
+            number,
+            {"reference": str(item.get("reference") or "").strip(), "url": str(item.get("url") or "").strip()},
+        )
+
+    points = {}
+    for item in obj.get("sections") or []:
+        if isinstance(item, dict) and isinstance(item.get("heading"), str):
+            points[item["heading"].strip().lower()] = [
+                str(p) for p in item.get("points") or [] if str(p).strip()
+            ]
+
+    return {
+        "title": str(obj.get("title") or "").strip(),
+        "sources": sources,
+        "points": {name: points.get(name.lower(), []) for name, _ in REPORT_SECTIONS},
+    }
+
+
+def _citation_map_text(sources: Dict[int, Dict[str, str]]) -> str:
+    """引用表的文本形式（提供给每个章节的写作调用）"""
+    return "\n".join(
+        f"[{number}] {source['reference']} {source['url']}".strip()
+        for number, source in sorted(sources.items())
+    )
+
+
+def write_section(
+    prompt: str,
+    outline: Dict[str, Any],
+    heading: str,
+    min_words: int,
+    model: str,
+    system_message: str,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """
+    撰写单个章节
+
+    参数:
+        prompt: 写作任务描述和研究材料（所有章节共享）
+        outline: plan_outline 的结果
+        heading: 章节名
+        min_words: 章节目标字数
+        model: 使用的 AI 模型
+        system_message: writer_agent 的系统消息（保持写作风格一致）
+        max_tokens: 本章节的最大生成 token 数（None 表示由 ModelAdapter 决定）
+
+    返回:
+        str: 以 "## 章节名" 开头的 Markdown 章节
+    """
+    outline_text = "\n".join(
+        f"- {name}: " + "; ".join(outline["points"].get(name) or ["(no points)"])
+        for name, _ in REPORT_SECTIONS
+    )
+    user_message = f"""
+{prompt}
+
+---
+You are writing ONLY the "{heading}" section of the report titled "{outline['title']}".
+Other writers are drafting the remaining sections in parallel from the same outline.
+
+REPORT OUTLINE:
+{outline_text}
+
+CITATION MAP (use ONLY these numbers for inline citations):
+{_citation_map_text(outline['sources']) or "(no sources)"}
+
+Requirements:
+- Start with the heading "## {heading}" and output nothing but this section.
+- Write at least {min_words} words, covering the points listed for "{heading}".
+- Cite with the numbers from the citation map, e.g. [1] or [2, 3].
+- Do NOT include a title or a References section; they are assembled separately.
+""".strip()
+
+    content = _call(
+        model,
+        [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message},
+        ],
+        "writer_section",
+        max_tokens,
+    ).strip()
+    content = _REFERENCES_RE.sub("", "\n" + content).strip()
+    if not content.lstrip().startswith("#"):
+        content = f"## {heading}\n\n{content}"
+    return content
+
+
+def _expand_citation(group: str) -> List[int]:
+    """展开引用组：'1, 3-5' → [1, 3, 4, 5]"""
+    numbers = []
+    for part in re.split(r"\s*,\s*", group.strip()):
+        bounds = re.split(r"\s*[–-]\s*", part)
+        if len(bounds) == 2 and bounds[0].isdigit() and bounds[1].isdigit():
+            low, high = int(bounds[0]), int(bounds[1])
+            if low <= high and high - low < 50:
+                numbers.extend(range(low, high + 1))
+                continue
+        if part.isdigit():
+            numbers.append(int(part))
+    return numbers
+
+
+def assemble_report(
+    title: str, sections: List[str], sources: Dict[int, Dict[str, str]]
+) -> str:
+    """
+    组装报告
+
+    引用按在正文中首次出现的顺序重新编号为 [1], [2], ...；
+    引用表中不存在的编号被删除；References 只列出被引用的来源。
+
+    参数:
+        title: 报告标题
+        sections: 按顺序排列的章节 Markdown
+        sources: 引用表 {原编号: {"reference": str, "url": str}}
+
+    返回:
+        str: 完整报告（Markdown）
+    """
+    renumber: Dict[int, int] = {}
+
+    def _replace(match: re.Match) -> str:
+        numbers = []
+        for old in _expand_citation(match.group(1)):
+            if old not in sources:
+                continue
+            if old not in renumber:
+                renumber[old] = len(renumber) + 1
+            if renumber[old] not in numbers:
+                numbers.append(renumber[old])
+        return f"[{', '.join(str(n) for n in numbers)}]" if numbers else ""
+
+    body = "\n\n".join(_CITATION_RE.sub(_replace, section) for section in sections)
+    # 删除引用后可能留下的多余空格（如 "text ." ）
+    body = re.sub(r"[ \t]+([.,;:])", r"\1", body)
+
+    references = []
+    for old, new in sorted(renumber.items(), key=lambda item: item[1]):
+        reference, url = sources[old]["reference"], sources[old]["url"]
+        entry = f"[{new}] {reference}".rstrip()
+        if url and url not in reference:
+            entry += f' <a href="{url}" target="_blank">{url}</a>'
+        references.append(entry)
+
+    report = f"# {title}\n\n{body}" if title else body
+    if references:
+        report += "\n\n## References\n\n" + "\n\n".join(references)
+    return report
+
+
+def write_report_by_sections(
+    prompt: str,
+    model: str,
+    system_message: str,
+    min_words_per_section: int = 400,
+    max_workers: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+) -> Optional[str]:
+    """
+    分章节并行写作
+
+    参数:
+        prompt: 写作任务描述和研究材料
+        model: 使用的 AI 模型
+        system_message: writer_agent 的系统消息
+        min_words_per_section: 每个章节最少字数
+        max_workers: 并行章节数（None 表示从 WRITER_SECTION_CONCURRENCY 读取，默认全部章节并行）
+        max_tokens: 整篇报告的最大生成 token 数，平均分配给各章节（None 表示由 ModelAdapter 决定）
+
+    返回:
+        str: 完整报告；大纲无法生成时返回 None（由调用方回退为一次性写作）
+    """
+    outline = plan_outline(prompt, model)
+    if outline is None:
+        return None
+
+    max_workers = (
+        max_workers
+        if max_workers is not None
+        else int(os.getenv("WRITER_SECTION_CONCURRENCY", str(len(REPORT_SECTIONS))))
+    )
+    section_tokens = None if max_tokens is None else max(1, max_tokens // len(REPORT_SECTIONS))
+    logger.info(
+        f"✍️ 分章节并行写作: {len(REPORT_SECTIONS)} 个章节，"
+        f"{len(outline['sources'])} 个来源，并发 {max_workers}"
+    )
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, max_workers), thread_name_prefix="WriterSection"
+    )
+    try:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                write_section,
+                prompt,
+                outline,
+                heading,
+                words or min_words_per_section,
+                model,
+                system_message,
+                section_tokens,
+            )
+            for heading, words in REPORT_SECTIONS
+        ]
+        sections = [wait_future(future) for future in futures]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return assemble_report(outline["title"], sections, outline["sources"])
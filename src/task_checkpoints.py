@@ -0,0 +1,119 @@
+"""
+任务检查点模块 - 研究任务的步骤级检查点
+
+本模块提供：
+1. ResearchTaskCheckpoint: research_task_checkpoints 表模型（每个已完成步骤一行）
+2. save_checkpoint: 保存已完成步骤的 (标题, 描述, 输出)
+3. load_checkpoint_map: 按计划读取全部已完成步骤（可复用的步骤由 plan_dag.reusable_steps 判断）
+4. clear_checkpoints: 清除任务的全部检查点（重新开始时）
+
+进程在第 5/7 步崩溃时，原先只保存在内存中的 execution_history 会丢失，
+重新排队后要从 planner_agent 开始重新支付所有 LLM 和工具调用。
+现在每个步骤完成后立即写入检查点，计划保存在 progress["plan"] 中，
+恢复或重试的任务直接从第一个未完成的步骤继续。
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, UniqueConstraint
+from sqlalchemy.orm import Session, declarative_base
+
+CheckpointBase = declarative_base()
+
+
+class ResearchTaskCheckpoint(CheckpointBase):
+    """
+    research_task_checkpoints 表模型 - 已完成步骤的执行结果
+
+    (task_id, step_index) 唯一，step_index 从 0 开始，与计划中的步骤位置一致。
+    """
+
+    __tablename__ = "research_task_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("task_id", "step_index", name="uq_research_task_checkpoints_task_step"),
+        {"extend_existing": True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String, nullable=False)
+    step_index = Column(Integer, nullable=False)
+    step_title = Column(Text, nullable=False)
+    step_desc = Column(Text, nullable=True)
+    output = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+def save_checkpoint(
+    session: Session,
+    task_id: str,
+    step_index: int,
+    step_title: str,
+    step_desc: str,
+    output: str,
+) -> None:
+    """
+    保存（或覆盖）一个已完成步骤的检查点，调用方负责提交
+
+    参数:
+        session: 数据库会话
+        task_id: 任务 ID
+        step_index: 步骤位置（从 0 开始）
+        step_title: 计划中的步骤标题
+        step_desc: 实际执行的步骤描述
+        output: 步骤输出
+    """
+    session.query(ResearchTaskCheckpoint).filter(
+        ResearchTaskCheckpoint.task_id == task_id,
+        ResearchTaskCheckpoint.step_index == step_index,
+    ).delete(synchronize_session=False)
+    session.add(
+        ResearchTaskCheckpoint(
+            task_id=task_id,
+            step_index=step_index,
+            step_title=step_title,
+            step_desc=step_desc,
+            output=output,
+            created_at=datetime.utcnow(),
+        )
+    )
+
+
+def load_checkpoint_map(
+    session: Session,
+    task_id: str,
+    plan: List[str],
+) -> Dict[int, List[str]]:
+    """
+    读取与计划一致的全部检查点（不要求连续）
+
+    按依赖并发执行时步骤可能乱序完成；哪些步骤可以复用由调用方根据依赖判断
+    （见 plan_dag.reusable_steps）。
+
+    返回:
+        {步骤位置: [step_title, step_desc, output]}
+    """
+    rows = (
+        session.query(ResearchTaskCheckpoint)
+        .filter(ResearchTaskCheckpoint.task_id == task_id)
+        .all()
+    )
+    return {
+        row.step_index: [row.step_title, row.step_desc or "", row.output or ""]
+        for row in rows
+        if 0 <= row.step_index < len(plan) and plan[row.step_index] == row.step_title
+    }
+
+
+def clear_checkpoints(session: Session, task_id: str) -> int:
+    """
+    删除任务的全部检查点，调用方负责提交
+
+    返回:
+        删除的行数
+    """
+    return (
+        session.query(ResearchTaskCheckpoint)
+        .filter(ResearchTaskCheckpoint.task_id == task_id)
+        .delete(synchronize_session=False)
+    )
@@ -0,0 +1,154 @@
+"""
+任务事件模块 - 研究任务事件的追加式存储
+
+本模块提供：
+1. ResearchTaskEvent: research_task_events 表模型（每个事件一行）
+2. append_event: 追加事件并分配单调递增的序号
+3. fetch_events: 按游标（序号）读取事件
+4. clear_events: 清除任务的全部事件（任务重新排队时）
+
+原先事件保存在 research_tasks.progress["events"] 中，每次提交都会重写整个
+不断增长的 JSONB（包括 done 事件中的完整报告），持久化开销随事件数平方增长。
+现在每个事件单独插入一行，progress 只保留少量计数器（lastEventSeq 记录最新序号），
+状态查询和 SSE 读取方按 "序号 > 游标" 增量拉取。
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Integer,
+    JSON,
+    String,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session, declarative_base
+
+EventBase = declarative_base()
+
+
+class ResearchTaskEvent(EventBase):
+    """
+    research_task_events 表模型 - 研究任务的事件流
+
+    (task_id, seq) 唯一，seq 在同一任务内从 1 开始单调递增。
+    """
+
+    __tablename__ = "research_task_events"
+    __table_args__ = (
+        UniqueConstraint("task_id", "seq", name="uq_research_task_events_task_seq"),
+        {"extend_existing": True},
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    task_id = Column(String, nullable=False)
+    seq = Column(Integer, nullable=False)
+    type = Column(String, nullable=False)
+    message = Column(Text, nullable=True)
+    data = Column(JSON().with_variant(JSONB, "postgresql"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+def event_to_dict(row: ResearchTaskEvent) -> Dict[str, Any]:
+    """
+    转换为 API 返回的事件格式（与原 progress["events"] 中的结构一致，另含 seq）
+    """
+    event = {
+        "type": row.type,
+        "message": row.message,
+        "timestamp": row.created_at.isoformat() + "Z",
+    }
+    if row.data:
+        event.update(row.data)
+    event["seq"] = row.seq
+    return event
+
+
+def append_event(
+    session: Session,
+    task_id: str,
+    progress: Dict[str, Any],
+    event_type: str,
+    message: str,
+    extra: Optional[Dict[str, Any]] = None,
+    created_at: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    追加一个事件
+
+    序号来自 progress["lastEventSeq"]，与任务行在同一事务中更新。
+    取消接口和 worker 的进度写入可能同时追加事件，调用方必须先用
+    SELECT ... FOR UPDATE（query.with_for_update()）锁定任务行再读取 progress，
+    否则两个事务会分配到相同的序号并违反 uq_research_task_events_task_seq。
+
+    参数:
+        session: 数据库会话（事件行随该会话一起提交）
+        task_id: 任务 ID
+        progress: 任务的 progress 字典（会被更新 lastEventSeq）
+        event_type: 事件类型（queued, start, plan, progress, done, error ...）
+        message: 事件描述
+        extra: 附加数据
+        created_at: 事件发生时间（None 表示当前时间；批量写入时传入事件实际发生的时间）
+
+    返回:
+        事件字典
+    """
+    seq = int(progress.get("lastEventSeq") or 0) + 1
+    progress["lastEventSeq"] = seq
+    row = ResearchTaskEvent(
+        task_id=task_id,
+        seq=seq,
+        type=event_type,
+        message=message,
+        data=dict(extra) if extra else None,
+        created_at=created_at or datetime.utcnow(),
+    )
+    session.add(row)
+    return event_to_dict(row)
+
+
+def fetch_events(
+    session: Session,
+    task_id: str,
+    after_seq: int = 0,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    按游标读取事件
+
+    参数:
+        session: 数据库会话
+        task_id: 任务 ID
+        after_seq: 只返回序号大于该值的事件（0 表示从头读取）
+        limit: 最多返回的事件数
+
+    返回:
+        按序号升序排列的事件列表
+    """
+    query = (
+        session.query(ResearchTaskEvent)
+        .filter(ResearchTaskEvent.task_id == task_id, ResearchTaskEvent.seq > after_seq)
+        .order_by(ResearchTaskEvent.seq)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return [event_to_dict(row) for row in query.all()]
+
+
+def clear_events(session: Session, task_id: str) -> int:
+    """
+    删除任务的全部事件（任务重新排队时调用，序号从 1 重新开始）
+
+    返回:
+        删除的行数
+    """
+    return (
+        session.query(ResearchTaskEvent)
+        .filter(ResearchTaskEvent.task_id == task_id)
+        .delete(synchronize_session=False)
+    )
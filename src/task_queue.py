@@ -0,0 +1,431 @@
+"""
+任务队列模块 - 研究任务的排队、认领与租约管理
+
+本模块提供：
+1. MemoryTaskQueue: 进程内队列（本地开发和测试使用）
+2. PostgresTaskQueue: 基于 research_tasks 表的持久化共享队列
+3. create_task_queue: 根据环境变量选择队列后端
+
+Postgres 队列的工作方式：
+- enqueue: 在 queue_info 中写入 availableAt，标记任务可被认领
+- claim: 使用 SELECT ... FOR UPDATE SKIP LOCKED 原子地认领一个排队任务
+- heartbeat: 执行期间定期刷新 updated_at，作为可见性租约
+- requeue_expired: 租约超时（worker 崩溃/重启）的任务重新排队，
+  超过最大尝试次数则标记为 failed
+- 任务被取消（status 不再是 running）后心跳失败，执行中的任务收到取消信号
+- 租约丢失后（任务被重新排队或由其他 worker 认领），原 worker 的进度写入经 holds_lease
+  检查后被丢弃，不会覆盖新执行者的状态
+
+任意数量的 API 进程或 worker 进程（跨节点）都可以消费同一个共享积压队列。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from src.cancellation import cancel_task
+
+logger = logging.getLogger(__name__)
+
+# 心跳发现租约丢失时的取消原因
+LEASE_LOST = "lease lost"
+
+
+def _utc_now_iso() -> str:
+    """返回 ISO 格式的 UTC 时间戳（与 queue_info 中其他时间字段格式一致）"""
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def holds_lease(status: Optional[str], queue_info: Any, worker_id: str) -> bool:
+    """
+    判断 worker 是否仍持有任务（写入进度前在锁定的行上检查）
+
+    租约超时后任务会被重新排队（status 变为 queued）或由其他 worker 认领（workerId 改变），
+    此时原 worker 的任何写入都会覆盖新的执行状态，必须丢弃。
+    status 为 cancelled 时任务仍属于原 worker，以便写入取消事件。
+
+    Returns:
+        True 表示 worker_id 仍是任务的执行者
+    """
+    if not isinstance(queue_info, dict) or queue_info.get("workerId") != worker_id:
+        return False
+    return status in ("running", "cancelled")
+
+
+class TaskQueue:
+    """
+    任务队列基类
+
+    子类需要实现 enqueue / claim；heartbeat 和 requeue_expired 默认无操作。
+    """
+
+    def __init__(
+        self,
+        poll_interval: Optional[float] = None,
+        visibility_timeout: Optional[float] = None,
+        heartbeat_interval: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        """
+        初始化任务队列
+
+        Args:
+            poll_interval: 空闲时等待新任务的时间（秒，None 表示从环境变量读取）
+            visibility_timeout: 任务租约时长（秒，None 表示从环境变量读取）
+            heartbeat_interval: 租约续期间隔（秒，None 表示 visibility_timeout 的 1/3）
+            max_attempts: 单个任务的最大认领次数（None 表示从环境变量读取）
+        """
+        self.poll_interval = (
+            poll_interval
+            if poll_interval is not None
+            else float(os.getenv("TASK_QUEUE_POLL_INTERVAL", "2"))
+        )
+        self.visibility_timeout = (
+            visibility_timeout
+            if visibility_timeout is not None
+            else float(os.getenv("TASK_VISIBILITY_TIMEOUT", "300"))
+        )
+        self.heartbeat_interval = (
+            heartbeat_interval
+            if heartbeat_interval is not None
+            else self.visibility_timeout / 3
+        )
+        self.max_attempts = (
+            max_attempts
+            if max_attempts is not None
+            else int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+        )
+        self._cond = threading.Condition()
+
+    def enqueue(self, task_id: str, prompt: Optional[str] = None, model: Optional[str] = None) -> None:
+        """
+        将任务加入队列
+
+        Args:
+            task_id: 研究任务 ID
+            prompt: 研究主题
+            model: 可选的模型名称
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        认领一个待执行任务（最多阻塞 timeout 秒）
+
+        Args:
+            worker_id: 认领任务的 worker 标识
+            timeout: 最长等待时间（None 表示使用 poll_interval）
+
+        Returns:
+            队列项字典 {task_id, prompt, model, worker_id, attempt}，无任务时返回 None
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        """
+        续期任务租约
+
+        Returns:
+            True 表示该 worker 仍持有任务
+        """
+        return True
+
+    def requeue_expired(self) -> List[str]:
+        """
+        将租约超时的任务重新排队
+
+        Returns:
+            被重新排队（或因尝试次数耗尽而失败）的任务 ID 列表
+        """
+        return []
+
+    def remove(self, task_id: str) -> bool:
+        """
+        从队列中移除尚未被认领的任务（取消任务时调用）
+
+        Postgres 队列只认领 status='queued' 的任务，把状态改为 cancelled 即可将其移出，
+        因此默认无操作。
+
+        Returns:
+            True 表示移除了排队中的队列项
+        """
+        return False
+
+    def wake_all(self) -> None:
+        """唤醒所有阻塞在 claim 上的 worker（用于停止 worker）"""
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextmanager
+    def hold(self, item: Dict[str, Any]):
+        """
+        在执行任务期间持有租约（后台线程定期调用 heartbeat）
+
+        用法:
+            with task_queue.hold(item):
+                run_research_task(item)
+        """
+        stop = threading.Event()
+        task_id = item.get("task_id")
+        worker_id = item.get("worker_id")
+
+        def _beat():
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    if not self.heartbeat(task_id, worker_id):
+                        logger.warning(
+                            f"⚠️ 任务 {task_id} 的租约已不属于 {worker_id}（已被取消或重新排队）"
+                        )
+                        # 其他进程取消了任务或任务已被重新认领：停止本地执行
+                        cancel_task(task_id, LEASE_LOST)
+                except Exception as e:
+                    logger.warning(f"⚠️ 任务 {task_id} 租约续期失败: {e}")
+
+        beat_thread = threading.Thread(
+            target=_beat, name=f"{worker_id}-heartbeat", daemon=True
+        )
+        beat_thread.start()
+        try:
+            yield item
+        finally:
+            stop.set()
+            beat_thread.join(timeout=5)
+
+
+class MemoryTaskQueue(TaskQueue):
+    """
+    进程内任务队列
+
+    仅在单进程内共享，进程重启后队列内容丢失。适用于本地开发和测试。
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._items: deque = deque()
+
+    def enqueue(self, task_id: str, prompt: Optional[str] = None, model: Optional[str] = None) -> None:
+        with self._cond:
+            self._items.append({"task_id": task_id, "prompt": prompt, "model": model})
+            self._cond.notify()
+
+    def claim(self, worker_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        timeout = self.poll_interval if timeout is None else timeout
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = dict(self._items.popleft())
+        item["worker_id"] = worker_id
+        item["attempt"] = 1
+        return item
+
+    def remove(self, task_id: str) -> bool:
+        with self._cond:
+            remaining = deque(item for item in self._items if item["task_id"] != task_id)
+            removed = len(remaining) != len(self._items)
+            self._items = remaining
+        return removed
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+
+class PostgresTaskQueue(TaskQueue):
+    """
+    基于 research_tasks 表的持久化任务队列
+
+    不新增表或列（表结构与 Next.js Drizzle 定义保持对齐），队列元数据存放在
+    queue_info JSONB 中：
+        availableAt: 可被认领的时间（由 enqueue 写入）
+        model: 执行时使用的模型
+        workerId / claimedAt / attempts: 认领信息
+    租约通过 updated_at 表示：running 状态且 updated_at 超过可见性超时的任务视为被遗弃。
+    """
+
+    _ENQUEUE_SQL = text(
+        """
+        UPDATE research_tasks
+        SET status = 'queued',
+            topic = COALESCE(CAST(:prompt AS text), topic),
+            queue_info = COALESCE(queue_info, '{}'::jsonb) || jsonb_build_object(
+                'availableAt', CAST(:now AS text),
+                'model', CAST(:model AS text)
+            ),
+            updated_at = timezone('utc', now())
+        WHERE task_id = :task_id
+        """
+    )
+
+    _CLAIM_SQL = text(
+        """
+        WITH next_task AS (
+            SELECT id
+            FROM research_tasks
+            WHERE status = 'queued' AND queue_info ? 'availableAt'
+            ORDER BY queue_info->>'availableAt', created_at
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        UPDATE research_tasks AS t
+        SET status = 'running',
+            updated_at = timezone('utc', now()),
+            queue_info = t.queue_info || jsonb_build_object(
+                'workerId', CAST(:worker_id AS text),
+                'claimedAt', CAST(:now AS text),
+                'attempts', COALESCE((t.queue_info->>'attempts')::int, 0) + 1
+            )
+        FROM next_task
+        WHERE t.id = next_task.id
+        RETURNING t.task_id, t.topic, t.queue_info
+        """
+    )
+
+    _HEARTBEAT_SQL = text(
+        """
+        UPDATE research_tasks
+        SET updated_at = timezone('utc', now())
+        WHERE task_id = :task_id
+          AND status = 'running'
+          AND queue_info->>'workerId' = :worker_id
+        """
+    )
+
+    _REQUEUE_EXPIRED_SQL = text(
+        """
+        UPDATE research_tasks
+        SET status = CASE
+                WHEN COALESCE((queue_info->>'attempts')::int, 0) >= :max_attempts THEN 'failed'
+                ELSE 'queued'
+            END,
+            failed_at = CASE
+                WHEN COALESCE((queue_info->>'attempts')::int, 0) >= :max_attempts
+                THEN timezone('utc', now())
+                ELSE failed_at
+            END,
+            queue_info = queue_info || jsonb_build_object(
+                'availableAt', CAST(:now AS text),
+                'requeuedAt', CAST(:now AS text),
+                'lastError', 'visibility timeout expired'
+            ),
+            updated_at = timezone('utc', now())
+        WHERE status = 'running'
+          AND queue_info ? 'claimedAt'
+          AND updated_at < timezone('utc', now()) - make_interval(secs => :timeout)
+        RETURNING task_id, status
+        """
+    )
+
+    def __init__(self, engine, **kwargs):
+        """
+        初始化 Postgres 任务队列
+
+        Args:
+            engine: SQLAlchemy Engine（必须连接 PostgreSQL）
+            **kwargs: 传递给 TaskQueue 的队列参数
+        """
+        super().__init__(**kwargs)
+        self.engine = engine
+        self._last_requeue_check = 0.0
+
+    def enqueue(self, task_id: str, prompt: Optional[str] = None, model: Optional[str] = None) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                self._ENQUEUE_SQL,
+                {"task_id": task_id, "prompt": prompt, "model": model, "now": _utc_now_iso()},
+            )
+        # 唤醒本进程内等待的 worker；其他进程通过轮询发现新任务
+        with self._cond:
+            self._cond.notify()
+
+    def _try_claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                self._CLAIM_SQL, {"worker_id": worker_id, "now": _utc_now_iso()}
+            ).first()
+        if row is None:
+            return None
+        queue_info = row.queue_info or {}
+        return {
+            "task_id": row.task_id,
+            "prompt": row.topic,
+            "model": queue_info.get("model"),
+            "worker_id": worker_id,
+            "attempt": queue_info.get("attempts", 1),
+        }
+
+    def claim(self, worker_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        timeout = self.poll_interval if timeout is None else timeout
+        self._maybe_requeue_expired()
+        item = self._try_claim(worker_id)
+        if item is not None:
+            return item
+        with self._cond:
+            self._cond.wait(timeout)
+        return self._try_claim(worker_id)
+
+    def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                self._HEARTBEAT_SQL, {"task_id": task_id, "worker_id": worker_id}
+            )
+        return result.rowcount > 0
+
+    def requeue_expired(self) -> List[str]:
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                self._REQUEUE_EXPIRED_SQL,
+                {
+                    "max_attempts": self.max_attempts,
+                    "timeout": self.visibility_timeout,
+                    "now": _utc_now_iso(),
+                },
+            ).fetchall()
+        for row in rows:
+            if row.status == "failed":
+                logger.error(f"❌ 任务 {row.task_id} 租约超时且尝试次数已用尽，标记为失败")
+            else:
+                logger.warning(f"♻️ 任务 {row.task_id} 租约超时，已重新排队")
+        return [row.task_id for row in rows]
+
+    def _maybe_requeue_expired(self) -> None:
+        """限制扫描频率：每半个可见性超时周期最多扫描一次"""
+        now = time.monotonic()
+        if now - self._last_requeue_check < self.visibility_timeout / 2:
+            return
+        self._last_requeue_check = now
+        try:
+            self.requeue_expired()
+        except Exception as e:
+            logger.warning(f"⚠️ 扫描超时任务失败: {e}")
+
+
+def create_task_queue(engine=None, backend: Optional[str] = None) -> TaskQueue:
+    """
+    根据配置创建任务队列
+
+    Args:
+        engine: SQLAlchemy Engine（postgres 后端必需）
+        backend: 队列后端（"postgres" 或 "memory"，None 表示从 TASK_QUEUE_BACKEND 读取）
+
+    Returns:
+        任务队列实例
+    """
+    backend = (backend or os.getenv("TASK_QUEUE_BACKEND", "postgres")).lower()
+    if backend == "memory":
+        logger.info("📥 使用进程内任务队列")
+        return MemoryTaskQueue()
+    if backend == "postgres":
+        if engine is None:
+            raise ValueError("postgres 任务队列需要数据库 engine")
+        logger.info("📥 使用 Postgres 持久化任务队列")
+        return PostgresTaskQueue(engine)
+    raise ValueError(f"未知的任务队列后端: {backend}")
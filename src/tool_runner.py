@@ -0,0 +1,220 @@
+"""
+工具执行模块 - 项目自有的工具调用循环
+
+本模块提供：
+1. build_tool_specs: 将 Python 函数转换为 OpenAI 格式的工具定义
+2. execute_tool_calls: 并发执行一条助手消息中的所有工具调用
+3. run_tool_loop: 多轮 "模型 → 工具 → 模型" 循环（替代 aisuite 的 max_turns）
+
+aisuite 的 max_turns 会逐个串行执行同一轮中的工具调用；
+这里同一轮的工具调用并发执行，每个调用有独立的超时，结果按原始顺序返回，
+一轮的耗时约等于其中最慢的工具，而不是所有工具耗时之和。
+所在任务被取消时，等待工具结果和开始下一轮之前都会立即退出（TaskCancelledError）。
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+from aisuite.utils.tools import Tools
+
+from src.cancellation import check_cancelled, wait_future
+from src.model_adapter import ModelAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def build_tool_specs(tools: List[Callable]) -> List[Dict[str, Any]]:
+    """
+    生成 OpenAI 格式的工具定义（复用 aisuite 的函数签名/文档解析）
+
+    Args:
+        tools: 工具函数列表
+
+    Returns:
+        工具定义列表
+    """
+    return Tools(tools).tools()
+
+
+def _parse_tool_call(tool_call) -> tuple:
+    """提取工具调用的 (id, 名称, 参数字典)，兼容对象和字典两种格式"""
+    if isinstance(tool_call, dict):
+        call_id = tool_call.get("id")
+        name = tool_call["function"]["name"]
+        arguments = tool_call["function"].get("arguments")
+    else:
+        call_id = tool_call.id
+        name = tool_call.function.name
+        arguments = tool_call.function.arguments
+
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments) if arguments.strip() else {}
+    return call_id, name, arguments or {}
+
+
+def execute_tool_calls(
+    tool_calls: list,
+    tool_map: Dict[str, Callable],
+    timeout: Optional[float] = None,
+    max_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    并发执行工具调用，按原始顺序返回工具消息
+
+    单个工具失败或超时不会影响其他工具，错误以 {"error": ...} 的形式返回给模型。
+
+    Args:
+        tool_calls: 助手消息中的 tool_calls
+        tool_map: 工具名称到函数的映射
+        timeout: 单个工具调用的超时（秒，None 表示从 TOOL_CALL_TIMEOUT 读取，默认 120）
+        max_workers: 最大并发数（None 表示从 TOOL_MAX_CONCURRENCY 读取，默认 8）
+
+    Returns:
+        role 为 "tool" 的消息列表，顺序与 tool_calls 一致
+    """
+    if not tool_calls:
+        return []
+
+    timeout = (
+        timeout
+        if timeout is not None
+        else float(os.getenv("TOOL_CALL_TIMEOUT", "120"))
+    )
+    max_workers = (
+        max_workers
+        if max_workers is not None
+        else int(os.getenv("TOOL_MAX_CONCURRENCY", "8"))
+    )
+
+    started_at: Dict[int, float] = {}
+
+    def _invoke(index: int, func: Callable, args: Dict[str, Any]):
+        started_at[index] = time.monotonic()
+        return func(**args)
+
+    calls = []
+    futures = []
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(tool_calls))),
+        thread_name_prefix="ToolCall",
+    )
+    try:
+        for index, tool_call in enumerate(tool_calls):
+            call_id, name, args, future = None, None, {}, None
+            try:
+                call_id, name, args = _parse_tool_call(tool_call)
+                func = tool_map.get(name)
+                if func is None:
+                    raise ValueError(f"Tool '{name}' not registered.")
+                future = executor.submit(_invoke, index, func, args)
+            except Exception as e:
+                future = e
+            calls.append((call_id, name, args))
+            futures.append(future)
+
+        logger.info(f"🔧 并发执行 {len(tool_calls)} 个工具调用")
+
+        messages = []
+        for index, ((call_id, name, args), future) in enumerate(zip(calls, futures)):
+            if isinstance(future, Exception):
+                result = {"error": f"工具调用无效: {future}"}
+            else:
+                # 超时从工具实际开始执行时计算
+                start = started_at.get(index, time.monotonic())
+                remaining = max(0.0, start + timeout - time.monotonic())
+                try:
+                    result = wait_future(future, timeout=remaining)
+                except FutureTimeoutError:
+                    logger.warning(f"⏱️ 工具 {name} 超时 ({timeout}s): {args}")
+                    future.cancel()
+                    result = {"error": f"工具 {name} 执行超时（{timeout}s）"}
+                except Exception as e:
+                    logger.warning(f"⚠️ 工具 {name} 执行失败: {e}")
+                    result = {"error": str(e)}
+
+            messages.append(
+                {
+                    "role": "tool",
+                    "name": name,
+                    "content": json.dumps(result, ensure_ascii=False, default=str),
+                    "tool_call_id": call_id,
+                }
+            )
+        return messages
+    finally:
+        # 不等待超时的工具线程结束（它们会在后台自行退出）
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_tool_loop(
+    client,
+    model: str,
+    messages: list,
+    tools: List[Callable],
+    max_turns: int = 5,
+    tool_timeout: Optional[float] = None,
+    **kwargs,
+):
+    """
+    运行多轮工具调用循环
+
+    每轮通过 ModelAdapter.safe_api_call 调用模型；如果模型请求了工具，
+    并发执行本轮全部工具调用并把结果追加到对话中，直到模型不再请求工具或达到 max_turns。
+
+    返回的响应对象与 aisuite max_turns 模式保持一致：
+        - response.intermediate_responses: 除最终响应外的所有中间响应
+        - response.choices[0].intermediate_messages: 助手消息和工具消息
+
+    Args:
+        client: aisuite 客户端实例
+        model: 模型名称
+        messages: 消息列表（会被原地追加助手消息和工具消息）
+        tools: 工具函数列表
+        max_turns: 最多执行工具的轮数
+        tool_timeout: 单个工具调用的超时（秒）
+        **kwargs: 其他 API 参数（如 tool_choice, temperature）
+
+    Returns:
+        最终的 API 响应对象
+    """
+    tool_specs = build_tool_specs(tools)
+    tool_map = {tool.__name__: tool for tool in tools}
+
+    intermediate_responses = []
+    intermediate_messages = []
+    response = None
+
+    for turn in range(max_turns):
+        response = ModelAdapter.safe_api_call(
+            client=client,
+            model=model,
+            messages=messages,
+            tools=tool_specs,
+            **kwargs,
+        )
+        intermediate_responses.append(response)
+
+        message = response.choices[0].message
+        intermediate_messages.append(message)
+        tool_calls = getattr(message, "tool_calls", None)
+        if not tool_calls:
+            break
+
+        logger.info(f"🔁 工具轮次 {turn + 1}/{max_turns}: {len(tool_calls)} 个工具调用")
+        tool_messages = execute_tool_calls(tool_calls, tool_map, timeout=tool_timeout)
+        intermediate_messages.extend(tool_messages)
+        messages.extend([message, *tool_messages])
+        # 工具调用之间检查任务是否已被取消（不再发起下一轮模型调用）
+        check_cancelled()
+
+    if response is None:
+        raise ValueError("max_turns 必须大于 0")
+
+    # 与 aisuite 一致：中间响应不包含最终响应
+    response.intermediate_responses = intermediate_responses[:-1]
+    response.choices[0].intermediate_messages = intermediate_messages
+    return response
@@ -0,0 +1,147 @@
+"""
+Worker 池模块 - 并发执行排队中的研究任务
+
+本模块提供：
+1. ResearchWorkerPool: 可配置大小的 worker 线程池
+
+研究任务几乎全部时间都在等待网络 I/O（LLM、搜索、PDF 下载），
+因此单进程内使用多个线程即可同时推进多个任务。
+每个 worker 拥有唯一 ID（主机名:进程号:线程名），记录在 queue_info["workerId"] 中。
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from src.task_queue import TaskQueue
+
+logger = logging.getLogger(__name__)
+
+
+class ResearchWorkerPool:
+    """研究任务 worker 池"""
+
+    def __init__(
+        self,
+        task_queue: TaskQueue,
+        handler: Callable[[Dict[str, Any]], None],
+        size: Optional[int] = None,
+        name_prefix: str = "ResearchWorker",
+    ):
+        """
+        初始化 worker 池
+
+        Args:
+            task_queue: 任务队列
+            handler: 任务处理函数，接收队列项字典
+            size: worker 数量（None 表示从 RESEARCH_WORKER_CONCURRENCY 读取，默认 2）
+            name_prefix: worker 线程名前缀
+        """
+        self.task_queue = task_queue
+        self.handler = handler
+        self.size = (
+            size
+            if size is not None
+            else int(os.getenv("RESEARCH_WORKER_CONCURRENCY", "2"))
+        )
+        if self.size < 1:
+            raise ValueError(f"worker 数量必须大于 0: {self.size}")
+        self.name_prefix = name_prefix
+
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._active: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def worker_id(self, thread_name: str) -> str:
+        """生成跨节点唯一的 worker ID"""
+        return f"{socket.gethostname()}:{os.getpid()}:{thread_name}"
+
+    def is_running(self) -> bool:
+        """是否有存活的 worker"""
+        return any(t.is_alive() for t in self._threads)
+
+    def active_tasks(self) -> Dict[str, str]:
+        """返回正在执行的任务 {worker_id: task_id}"""
+        with self._lock:
+            return dict(self._active)
+
+    def start(self) -> None:
+        """启动所有 worker（已在运行时不重复启动）"""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._threads = []
+        for index in range(self.size):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self.name_prefix}-{index + 1}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"🚀 已启动 {self.size} 个研究任务 worker")
+
+    def stop(self, drain_timeout: Optional[float] = None) -> bool:
+        """
+        停止 worker 池：不再认领新任务，并等待执行中的任务完成
+
+        Args:
+            drain_timeout: 等待执行中任务完成的最长时间
+                （秒，None 表示从 WORKER_DRAIN_TIMEOUT 读取，默认 30）
+
+        Returns:
+            True 表示所有 worker 已退出；False 表示超时仍有任务在执行
+            （Postgres 队列中的这些任务会在租约过期后被其他 worker 重新认领）
+        """
+        drain_timeout = (
+            drain_timeout
+            if drain_timeout is not None
+            else float(os.getenv("WORKER_DRAIN_TIMEOUT", "30"))
+        )
+        self._stop_event.set()
+        self.task_queue.wake_all()
+
+        deadline = time.monotonic() + drain_timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+        unfinished = self.active_tasks()
+        if unfinished:
+            logger.warning(
+                f"⚠️ worker 池停止超时，仍有 {len(unfinished)} 个任务在执行: "
+                f"{list(unfinished.values())}"
+            )
+            return False
+
+        self._threads = []
+        logger.info("✅ 所有研究任务 worker 已停止")
+        return True
+
+    def _worker_loop(self) -> None:
+        worker_id = self.worker_id(threading.current_thread().name)
+        logger.info(f"Research worker {worker_id} started.")
+        while not self._stop_event.is_set():
+            try:
+                queue_item = self.task_queue.claim(worker_id)
+                if queue_item is None:
+                    continue
+                queue_item["worker_id"] = worker_id
+                with self._lock:
+                    self._active[worker_id] = queue_item.get("task_id")
+                try:
+                    with self.task_queue.hold(queue_item):
+                        self.handler(queue_item)
+                finally:
+                    with self._lock:
+                        self._active.pop(worker_id, None)
+            except Exception as exc:
+                logger.error(f"Unexpected error in worker loop: {exc}")
+                logger.error(traceback.format_exc())
+                # 避免数据库不可用时空转
+                self._stop_event.wait(self.task_queue.poll_interval)
+        logger.info(f"Research worker {worker_id} stopped.")
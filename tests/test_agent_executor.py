@@ -0,0 +1,85 @@
+"""
+单元测试 - 代理执行器
+
+测试范围:
+- 在线程池中执行阻塞函数
+- 异常传播
+- 不阻塞事件循环
+- contextvars 传递
+"""
+
+import asyncio
+import contextvars
+import time
+
+import pytest
+from src.agent_executor import (
+    get_agent_executor,
+    run_in_agent_executor,
+    shutdown_agent_executor,
+)
+
+
+def test_run_in_agent_executor_returns_result():
+    """测试返回阻塞函数的结果"""
+    result = asyncio.run(run_in_agent_executor(lambda a, b=0: a + b, 1, b=2))
+
+    assert result == 3
+
+
+def test_run_in_agent_executor_propagates_exception():
+    """测试异常原样抛出"""
+    def _fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(run_in_agent_executor(_fail))
+
+
+def test_run_in_agent_executor_does_not_block_loop():
+    """测试阻塞调用期间事件循环仍可调度其他协程"""
+    async def _main():
+        ticks = []
+
+        async def _ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(
+            run_in_agent_executor(time.sleep, 0.2),
+            _ticker(),
+        )
+        return ticks
+
+    ticks = asyncio.run(_main())
+
+    # 如果事件循环被阻塞，ticker 会在 sleep 结束后才运行
+    assert len(ticks) == 5
+    assert ticks[-1] - ticks[0] < 0.2
+
+
+def test_run_in_agent_executor_copies_context():
+    """测试线程内可以读取调用方的 contextvars"""
+    var = contextvars.ContextVar("var", default=None)
+
+    async def _main():
+        var.set("task-1")
+        return await run_in_agent_executor(var.get)
+
+    assert asyncio.run(_main()) == "task-1"
+
+
+def test_executor_size_from_env(monkeypatch):
+    """测试从环境变量读取线程数"""
+    shutdown_agent_executor()
+    monkeypatch.setenv("AGENT_EXECUTOR_THREADS", "3")
+
+    executor = get_agent_executor()
+
+    assert executor._max_workers == 3
+    shutdown_agent_executor()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
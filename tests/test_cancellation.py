@@ -0,0 +1,132 @@
+"""
+单元测试 - 任务取消
+
+测试范围:
+- 取消令牌与上下文作用域
+- 可取消的等待（sleep / future）
+- 按任务 ID 登记与发出取消信号
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pytest
+from src.cancellation import (
+    CancellationToken,
+    TaskCancelledError,
+    cancel_task,
+    cancellable_sleep,
+    cancellation_scope,
+    check_cancelled,
+    current_token,
+    register_task,
+    unregister_task,
+    wait_future,
+)
+
+
+def test_token_cancel_keeps_first_reason():
+    """测试取消令牌只记录第一次的原因"""
+    token = CancellationToken("task-1")
+    token.raise_if_cancelled()
+
+    token.cancel("user")
+    token.cancel("lease lost")
+
+    assert token.cancelled
+    assert token.reason == "user"
+    with pytest.raises(TaskCancelledError, match="user"):
+        token.raise_if_cancelled()
+
+
+def test_cancelled_error_not_caught_by_exception_handlers():
+    """测试 TaskCancelledError 不会被 except Exception 吞掉"""
+    assert not issubclass(TaskCancelledError, Exception)
+
+
+def test_check_cancelled_uses_current_scope():
+    """测试 check_cancelled 只在作用域内生效"""
+    token = CancellationToken()
+    token.cancel()
+
+    check_cancelled()  # 没有令牌：不抛出
+    with cancellation_scope(token):
+        assert current_token() is token
+        with pytest.raises(TaskCancelledError):
+            check_cancelled()
+    assert current_token() is None
+
+
+def test_cancellable_sleep_wakes_on_cancel():
+    """测试等待中被取消会立即返回"""
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+
+    start = time.monotonic()
+    with cancellation_scope(token):
+        with pytest.raises(TaskCancelledError):
+            cancellable_sleep(5)
+
+    assert time.monotonic() - start < 1
+
+
+def test_wait_future_stops_on_cancel(monkeypatch):
+    """测试等待 future 时定期检查取消"""
+    monkeypatch.setenv("CANCEL_POLL_INTERVAL", "0.01")
+    token = CancellationToken()
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(time.sleep, 0.5)
+        threading.Timer(0.05, token.cancel).start()
+
+        start = time.monotonic()
+        with cancellation_scope(token):
+            with pytest.raises(TaskCancelledError):
+                wait_future(future, timeout=5)
+        assert time.monotonic() - start < 0.4
+    finally:
+        executor.shutdown(wait=True)
+
+
+def test_wait_future_timeout_and_result():
+    """测试 wait_future 的超时和正常结果与 future.result 一致"""
+    token = CancellationToken()
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        with cancellation_scope(token):
+            slow = executor.submit(time.sleep, 0.3)
+            with pytest.raises(FutureTimeoutError):
+                wait_future(slow, timeout=0.05)
+            assert wait_future(executor.submit(lambda: 42), timeout=1) == 42
+    finally:
+        executor.shutdown(wait=True)
+
+
+def test_cancel_task_signals_registered_token():
+    """测试按任务 ID 发出取消信号"""
+    token = register_task("task-cancel")
+    try:
+        assert cancel_task("task-cancel", "user") is True
+        assert token.cancelled
+    finally:
+        unregister_task("task-cancel", token)
+
+    assert cancel_task("task-cancel") is False
+
+
+def test_unregister_task_ignores_newer_token():
+    """测试注销旧令牌不会影响同一任务新登记的令牌"""
+    old = register_task("task-reuse")
+    new = register_task("task-reuse")
+    try:
+        unregister_task("task-reuse", old)
+        assert cancel_task("task-reuse") is True
+        assert new.cancelled
+        assert not old.cancelled
+    finally:
+        unregister_task("task-reuse", new)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -6,10 +6,21 @@
 - 超长段落分割
 - 上下文保持
 - 块合并
+- 并行处理（并发上限、结果顺序）
+- 多层归约与调用次数预测
+- 合并时去除边界重复
+- 流式分块（与原分块边界一致、支持分片输入）
 """
 
+import re
+import threading
+import time
+
 import pytest
 from src.chunking import ChunkingProcessor
+from src.model_adapter import ModelAdapter
+
+MODEL = "deepseek:deepseek-chat"
 
 
 @pytest.fixture
@@ -76,6 +87,17 @@ def test_split_long_paragraph():
         assert len(chunk) > 0
 
 
+def test_split_long_paragraph_keeps_trailing_text():
+    """测试最后一个句末标点之后的内容不会丢失"""
+    processor = ChunkingProcessor(max_chunk_size=50, overlap_size=10)
+    long_para = "This is a very long paragraph. " * 30 + "Final words without a period"
+
+    chunks = processor._split_long_paragraph(long_para)
+
+    assert chunks[-1].endswith("Final words without a period")
+    assert " ".join(chunks).split() == long_para.split()
+
+
 def test_process_with_context():
     """测试带上下文处理"""
     processor = ChunkingProcessor(max_chunk_size=500, overlap_size=50)
@@ -97,6 +119,45 @@ def test_process_with_context():
         assert result.startswith("Processed:")
 
 
+def test_process_with_context_runs_chunks_concurrently_in_order():
+    """测试各块在并发上限内并行处理，结果保持原始顺序"""
+    processor = ChunkingProcessor(max_chunk_size=500, overlap_size=10, max_workers=4)
+    chunks = [f"Chunk {i} content" for i in range(8)]
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def slow_processor(text):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        # 越靠前的块越慢，验证结果顺序与完成顺序无关
+        index = int(text.split("[📄 当前段落]:\nChunk ")[1].split()[0])
+        time.sleep(0.1 - index * 0.01)
+        with lock:
+            state["active"] -= 1
+        return f"result {index}"
+
+    start = time.monotonic()
+    results = processor.process_with_context(chunks, slow_processor, show_progress=False)
+
+    assert results == [f"result {i}" for i in range(8)]
+    assert state["peak"] == 4
+    assert time.monotonic() - start < 0.45  # 串行需要 0.52s
+
+
+def test_process_with_context_sequential_when_single_worker():
+    """测试并发上限为 1 时按顺序逐块处理"""
+    processor = ChunkingProcessor(max_chunk_size=500, overlap_size=10, max_workers=1)
+    order = []
+
+    processor.process_with_context(
+        ["a", "b", "c"], lambda text: order.append(text) or "", show_progress=False
+    )
+
+    assert len(order) == 3
+    assert "[📍 文档位置: 1/3]" in order[0]
+
+
 def test_build_chunk_prompt_first():
     """测试构建第一个块的提示"""
     processor = ChunkingProcessor()
@@ -175,6 +236,96 @@ def test_merge_chunks_multiple():
     assert "\n\n" in result
 
 
+BOUNDARY = "Quantum error correction protects logical qubits from decoherence"
+
+
+def test_merge_chunks_removes_boundary_overlap():
+    """测试删除后一块开头与前一块结尾重复的内容，并记录删除的 token 数"""
+    processor = ChunkingProcessor(overlap_size=20)
+    chunks = [
+        f"Intro text. {BOUNDARY}.",
+        f"{BOUNDARY}. Surface codes need thousands of physical qubits.",
+    ]
+
+    result = processor.merge_chunks(chunks)
+
+    assert result.count("Quantum error correction") == 1
+    assert result.endswith("Surface codes need thousands of physical qubits.")
+    assert processor.last_removed_tokens > 0
+
+
+def test_merge_chunks_overlap_is_fuzzy_on_case_and_punctuation():
+    """测试边界比较忽略大小写、标点和空白差异"""
+    processor = ChunkingProcessor(overlap_size=20)
+    chunks = [
+        f"Intro. {BOUNDARY}",
+        "quantum error-correction protects\nlogical qubits, from decoherence; Next part.",
+    ]
+
+    result = processor.merge_chunks(chunks)
+
+    assert result.lower().count("protects") == 1
+    assert result.endswith("Next part.")
+
+
+def test_merge_chunks_removes_lightly_reworded_overlap():
+    """测试模型改写了重叠区域（个别词被替换、增删）时仍删除边界重复"""
+    processor = ChunkingProcessor(overlap_size=20)
+    original = (
+        "Surface codes arrange physical qubits on a two dimensional lattice and measure "
+        "stabilizers every cycle to detect bit flip and phase flip errors"
+    )
+    reworded = (
+        "Surface codes place physical qubits on a two dimensional grid and measure "
+        "the stabilizers each cycle to detect bit flip and phase flip errors"
+    )
+    chunks = [f"Intro. {original}.", f"{reworded}. Logical error rates fall exponentially."]
+
+    result = processor.merge_chunks(chunks)
+
+    assert result.count("Surface codes") == 1
+    assert result.endswith("Logical error rates fall exponentially.")
+    assert processor.last_removed_tokens > 0
+
+
+def test_boundary_overlap_tolerates_differences():
+    """测试近似重合：少量差异时按相似度阈值接受，不延伸到后面的新内容"""
+    prev = "intro one two three four five six seven eight nine ten".split()
+    nxt = "one two THREE four five six 7 eight nine ten new words here".lower().split()
+
+    assert ChunkingProcessor._boundary_overlap(prev, nxt, min_similarity=0.8) == 10
+    assert ChunkingProcessor._boundary_overlap(prev, nxt, min_similarity=1.0) == 0
+
+
+def test_merge_chunks_keeps_short_or_inner_repetition():
+    """测试重合词数低于阈值、或重复不在边界时不删除"""
+    processor = ChunkingProcessor(overlap_size=20)
+
+    short = processor.merge_chunks(["Results of the", "of the experiment follow."])
+    assert short == "Results of the\n\nof the experiment follow."
+    assert processor.last_removed_tokens == 0
+
+    inner = processor.merge_chunks([f"{BOUNDARY}. End.", f"Start. {BOUNDARY}."])
+    assert inner.count("Quantum error correction") == 2
+
+
+def test_merge_chunks_without_redundancy_removal():
+    """测试关闭去重时保持简单拼接"""
+    processor = ChunkingProcessor(overlap_size=20)
+    chunks = [f"Intro. {BOUNDARY}", f"{BOUNDARY} tail"]
+
+    assert processor.merge_chunks(chunks, remove_redundancy=False) == "\n\n".join(chunks)
+
+
+def test_boundary_overlap_longest_suffix_prefix():
+    """测试完全相同时找到最长的"后缀 = 前缀"重合"""
+    prev = "a b a b a b".split()
+    nxt = "a b a b c".split()
+
+    assert ChunkingProcessor._boundary_overlap(prev, nxt) == 4
+    assert ChunkingProcessor._boundary_overlap(prev, ["x"]) == 0
+
+
 def test_chunk_and_process_short_text():
     """测试短文本的完整处理流程"""
     processor = ChunkingProcessor(max_chunk_size=5000, overlap_size=200)
@@ -238,5 +389,156 @@ def test_get_overlap_start():
     assert overlap == text[:40]
 
 
+def _long_document(count):
+    """count 个段落，每段约 880 tokens（每段单独成块）"""
+    return "\n\n".join(f"P{i} " + "word " * 700 for i in range(count))
+
+
+def _summarize(text):
+    """模拟处理：保留部分编号，输出约 1000 tokens"""
+    ids = re.findall(r"\[📄 当前段落\]:\n(P\d+)", text) or re.findall(r"\bP\d+\b", text)
+    ids = list(dict.fromkeys(ids))
+    return " ".join(ids) + " " + "y" * (4000 - len(" ".join(ids)))
+
+
+def test_reduce_budget_reserves_output_tokens():
+    """测试每批预算为上下文窗口的 80% 减去输出上限"""
+    assert ChunkingProcessor.reduce_budget(MODEL) == int(32768 * 0.8) - 8192
+
+
+def test_plan_hierarchical_predicts_levels():
+    """测试执行前预测各层的调用次数和 token 数"""
+    processor = ChunkingProcessor(max_chunk_size=1000, overlap_size=50)
+
+    plan = processor.plan_hierarchical(_long_document(40), MODEL, expected_output_tokens=1000)
+
+    assert [level["calls"] for level in plan["levels"]] == [40, 3]
+    assert plan["total_calls"] == 43
+    assert plan["levels"][1]["input_tokens"] <= 3 * plan["reduce_budget"]
+    assert plan["total_output_tokens"] == plan["levels"][0]["output_tokens"] + 3000
+
+
+def test_plan_hierarchical_single_level_when_results_fit():
+    """测试各块结果合起来能放进一次调用时只有一层"""
+    processor = ChunkingProcessor(max_chunk_size=1000, overlap_size=50)
+
+    plan = processor.plan_hierarchical(_long_document(5), MODEL, expected_output_tokens=500)
+
+    assert len(plan["levels"]) == 1
+    assert plan["total_calls"] == 5
+
+
+def test_hierarchical_reduce_fits_budget_and_matches_plan():
+    """测试多层归约：结果放得进一次调用，保持原始顺序，调用次数与预测一致"""
+    processor = ChunkingProcessor(max_chunk_size=1000, overlap_size=50, max_workers=8)
+    text = _long_document(40)
+    calls = []
+    lock = threading.Lock()
+
+    def counting(prompt):
+        with lock:
+            calls.append(prompt)
+        return _summarize(prompt)
+
+    plan = processor.plan_hierarchical(text, MODEL, expected_output_tokens=1000)
+    result = processor.chunk_and_process_hierarchical(text, counting, MODEL, show_progress=False)
+
+    assert len(calls) == plan["total_calls"]
+    assert ModelAdapter.estimate_tokens(result) <= ChunkingProcessor.reduce_budget(MODEL)
+    ids = [int(i) for i in re.findall(r"\bP(\d+)\b", result)]
+    assert ids == sorted(ids)
+    assert ids[0] == 0
+
+
+def _reference_chunks(processor, text):
+    """原来的分块实现：整体按段落 split，逐段、逐句调用 estimate_tokens（作为对照，保留最后一句）"""
+    chunks, current, tokens = [], [], 0
+    for para in text.split("\n\n"):
+        para_tokens = ModelAdapter.estimate_tokens(para)
+        if tokens + para_tokens > processor.max_chunk_size and current:
+            chunks.append("\n\n".join(current))
+            current, tokens = [], 0
+        if para_tokens <= processor.max_chunk_size:
+            current.append(para)
+            tokens += para_tokens
+            continue
+        parts = re.split(r"([.!?。！？])\s+", para)
+        sentences = [parts[i] + parts[i + 1] for i in range(0, len(parts) - 1, 2)]
+        # 最后一个句末标点之后的内容单独成句
+        if parts[-1]:
+            sentences.append(parts[-1])
+        if len(sentences) <= 1:
+            size = processor.max_chunk_size * 4
+            chunks.extend(para[i:i + size] for i in range(0, len(para), size))
+            continue
+        group, group_tokens = [], 0
+        for sent in sentences:
+            sent_tokens = ModelAdapter.estimate_tokens(sent)
+            if group_tokens + sent_tokens > processor.max_chunk_size and group:
+                chunks.append(" ".join(group))
+                group, group_tokens = [], 0
+            group.append(sent)
+            group_tokens += sent_tokens
+        if group:
+            chunks.append(" ".join(group))
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _mixed_document():
+    """中英文混合、含空段落、超长段落和无句子边界的超长段落"""
+    english = "Qubits decohere within 100 microseconds! Is that enough? Yes."
+    chinese = "量子纠错技术提升了逻辑量子比特的保真度。它仍然很昂贵！"
+    parts = [
+        "# Title",
+        "",
+        english * 3,
+        chinese * 20,
+        "\n",
+        (english + " ") * 120 + "trailing words",
+        (chinese + " ") * 150,
+        "x" * 9000,
+        "Mixed 混合 text. " * 400,
+    ]
+    return "\n\n".join(parts * 3) + "\n\n\n"
+
+
+@pytest.mark.parametrize("max_chunk_size", [50, 300, 1000])
+def test_iter_chunks_matches_original_boundaries(max_chunk_size):
+    """测试流式分块与原来的分块结果完全一致"""
+    processor = ChunkingProcessor(max_chunk_size=max_chunk_size, overlap_size=20)
+    text = _mixed_document()
+
+    assert list(processor.iter_chunks(text)) == _reference_chunks(processor, text)
+    assert processor.chunk_by_semantic(text) == _reference_chunks(processor, text)
+
+
+@pytest.mark.parametrize("piece_size", [1, 7, 4096])
+def test_iter_chunks_accepts_streamed_pieces(piece_size):
+    """测试按片段输入（分隔符跨越片段边界）时结果与整段输入一致"""
+    processor = ChunkingProcessor(max_chunk_size=300, overlap_size=20)
+    text = _mixed_document()
+    pieces = (text[i:i + piece_size] for i in range(0, len(text), piece_size))
+
+    assert list(processor.iter_chunks(pieces)) == list(processor.iter_chunks(text))
+
+
+def test_iter_chunks_is_lazy():
+    """测试分块逐个产出：取第一块时不会读取全部输入"""
+    processor = ChunkingProcessor(max_chunk_size=50, overlap_size=10)
+    consumed = []
+
+    def pieces():
+        for i in range(1000):
+            consumed.append(i)
+            yield f"Paragraph {i}. " + "word " * 40 + "\n\n"
+
+    first = next(processor.iter_chunks(pieces()))
+
+    assert first.startswith("Paragraph 0.")
+    assert len(consumed) < 5
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
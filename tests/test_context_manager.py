@@ -6,10 +6,16 @@
 - 上下文使用率计算
 - 文本处理流程
 - 成本估算
+- 代理输入的分块压缩（map-reduce）
+- 分块处理的调用次数预测
 """
 
+from types import SimpleNamespace
+
 import pytest
+from src.agents import writer_agent
 from src.context_manager import ContextManager, create_manager_for_agent
+from src.model_adapter import ModelAdapter
 
 
 @pytest.fixture
@@ -243,5 +249,113 @@ def test_chunking_threshold():
     assert manager.should_chunk(below_threshold) is False
 
 
+def test_plan_processing_uses_model_budget():
+    """测试调用次数预测使用管理器的模型和阈值"""
+    manager = ContextManager(
+        model="deepseek:deepseek-chat",
+        enable_chunking=True,
+        chunking_threshold=0.8,
+        max_chunk_size=1000,
+        chunk_overlap=50
+    )
+    text = "\n\n".join(f"P{i} " + "word " * 700 for i in range(40))
+
+    plan = manager.plan_processing(text, expected_output_tokens=1000)
+
+    assert plan["reduce_budget"] == int(32768 * 0.8) - 8192
+    assert plan["total_calls"] == 43
+
+
+def test_prepare_prompt_short_text_unchanged(manager):
+    """测试阈值内的输入原样返回，不调用处理函数"""
+    calls = []
+
+    result = manager.prepare_prompt("Short prompt.", processor_func=lambda t: calls.append(t) or "x")
+
+    assert result == "Short prompt."
+    assert calls == []
+
+
+def test_prepare_prompt_condenses_long_text(monkeypatch):
+    """测试超过阈值的输入按块压缩后合并（默认使用模型压缩）"""
+    manager = ContextManager(
+        model="deepseek:deepseek-chat",
+        enable_chunking=True,
+        chunking_threshold=0.001,
+        max_chunk_size=50,
+        chunk_overlap=5
+    )
+    calls = []
+
+    def fake_call(cls, **kwargs):
+        calls.append(kwargs["messages"][0]["content"])
+        message = SimpleNamespace(content=f"notes {len(calls)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    monkeypatch.setattr(ModelAdapter, "safe_api_call", classmethod(fake_call))
+    text = "\n\n".join(f"Paragraph {i}: " + "fact " * 30 for i in range(4))
+
+    result = manager.prepare_prompt(text, agent_name="writer_agent")
+
+    assert len(calls) == 4
+    assert all("Condense it into dense notes" in c for c in calls)
+    assert result.count("notes") == 4
+
+
+def test_prepare_prompt_budgets_reserved_text(manager, monkeypatch):
+    """测试 reserved_text 计入阈值但不参与压缩，归约预算扣除其占用的比例"""
+    manager.chunking_threshold = 0.5
+    manager.hierarchical = True
+    calls = []
+    fill_ratios = []
+
+    def fake_hierarchical(text, processor_func, model, show_progress, fill_ratio):
+        fill_ratios.append(fill_ratio)
+        return processor_func(text)
+
+    monkeypatch.setattr(
+        manager.chunking_processor, "chunk_and_process_hierarchical", fake_hierarchical
+    )
+    # 各占约 30% 的上下文窗口（"word " 约 1.25 tokens）
+    words = int(manager.limits["context_window"] * 0.3 / 1.25)
+    text = "context " + "word " * words
+    reserved = "draft " + "word " * words
+
+    # 单独的 text 在阈值内，加上 reserved_text 后超过阈值
+    assert not manager.should_chunk(text)
+    result = manager.prepare_prompt(
+        text, processor_func=lambda t: calls.append(t) or "notes", reserved_text=reserved
+    )
+
+    assert result == "notes"
+    assert calls == [text]
+    reserved_ratio = ModelAdapter.estimate_tokens(reserved) / manager.limits["context_window"]
+    assert fill_ratios == [pytest.approx(0.5 - reserved_ratio)]
+
+
+def test_writer_agent_routes_oversized_input_through_manager(monkeypatch):
+    """测试写作代理的超长输入先分块压缩，再用压缩结果撰写报告"""
+    monkeypatch.setenv("CHUNKING_THRESHOLD", "0.001")
+    monkeypatch.setenv("MAX_CHUNK_SIZE", "50")
+    prompts = []
+
+    def fake_call(cls, **kwargs):
+        content = kwargs["messages"][-1]["content"]
+        prompts.append(content)
+        reply = "condensed notes" if "Condense it into dense notes" in content else "report"
+        message = SimpleNamespace(content=reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    monkeypatch.setattr(ModelAdapter, "safe_api_call", classmethod(fake_call))
+    text = "\n\n".join(f"Evidence {i}: " + "data " * 30 for i in range(3))
+
+    content, messages = writer_agent(text, model="deepseek:deepseek-chat", parallel_sections=False)
+
+    assert content == "report"
+    assert len(prompts) == 4  # 3 个分块压缩 + 1 次写作
+    assert "Evidence 0" not in messages[-1]["content"]
+    assert "condensed notes" in messages[-1]["content"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
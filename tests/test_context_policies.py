@@ -0,0 +1,93 @@
+"""
+单元测试 - 按代理的上下文策略
+
+测试范围:
+- 历史条目类型的判断
+- 编辑代理只看最新草稿和之后的反馈
+- 写作代理用排序后的证据替代排序之前的原始研究结果
+- executor_agent_step 按策略构建上下文并记录节省的 token
+"""
+
+import pytest
+from src import planning_agent
+from src.context_policies import entry_kind, select_history
+from src.cost_tracker import tracker
+
+HISTORY = [
+    ["Research agent: Use Tavily to perform a broad web search", "d", "tavily results"],
+    ["Research agent: For each collected item, search on arXiv", "d", "arxiv results"],
+    ["Research agent: Synthesize and rank findings by relevance", "d", "ranked evidence"],
+    ["Writer agent: Draft a structured outline", "d", "first draft"],
+    ["Editor agent: Review for coherence and request fixes", "d", "revised draft"],
+    ["Research agent: Fill the gaps flagged by the editor", "d", "gap research"],
+]
+
+
+def _indices(selected):
+    return [index for index, _ in selected]
+
+
+def test_entry_kind():
+    """测试条目类型与代理选择规则一致"""
+    assert [entry_kind(entry[0]) for entry in HISTORY] == [
+        "research", "research", "ranked", "draft", "feedback", "research",
+    ]
+    assert entry_kind("Summarize everything") == "other"
+
+
+def test_editor_sees_latest_draft_and_later_feedback():
+    """测试编辑代理只看最新草稿（编辑步骤的修订稿）"""
+    assert _indices(select_history("editor_agent", HISTORY)) == [4]
+
+    history = HISTORY[:4] + [["Editor agent: Review for coherence", "d", "[Model Error: x]"]]
+    # 编辑失败的输出不是草稿：最新草稿仍是写作步骤，之后的反馈也保留
+    assert _indices(select_history("editor_agent", history)) == [3, 4]
+
+
+def test_writer_uses_ranked_evidence_instead_of_raw_research():
+    """测试写作代理用排序后的证据替代排序之前的原始研究结果，保留之后补充的研究和最新草稿"""
+    assert _indices(select_history("writer_agent", HISTORY)) == [2, 4, 5]
+
+    without_ranking = [HISTORY[0], HISTORY[1], HISTORY[3]]
+    assert _indices(select_history("writer_agent", without_ranking)) == [0, 1, 2]
+
+
+def test_research_agent_sees_research_only():
+    """测试研究代理只看研究结果，没有策略的代理看到完整历史"""
+    assert _indices(select_history("research_agent", HISTORY)) == [0, 1, 2, 5]
+    assert _indices(select_history("unknown_agent", HISTORY)) == list(range(len(HISTORY)))
+
+
+def test_empty_selection_falls_back_to_full_history():
+    """测试策略筛掉全部条目时退回完整历史"""
+    history = HISTORY[:2]
+    assert _indices(select_history("editor_agent", history)) == [0, 1]
+
+
+def test_executor_routes_context_and_tracks_savings(monkeypatch):
+    """测试 executor_agent_step 按策略构建编辑代理的上下文，保留原始步骤编号"""
+    captured = {}
+
+    def fake_editor(prompt, draft=None):
+        captured["prompt"] = prompt
+        captured["draft"] = draft
+        return "edited", []
+
+    monkeypatch.setenv("CONTEXT_ROUTING", "true")
+    monkeypatch.setattr(planning_agent, "editor_agent", fake_editor)
+    tracker.saved_prompt_tokens.clear()
+
+    result = planning_agent.executor_agent_step(
+        "Editor agent: Revise the report for clarity", HISTORY[:5], "量子计算"
+    )
+
+    assert result == ("Editor agent: Revise the report for clarity", "editor_agent", "edited")
+    assert "revised draft" in captured["prompt"]
+    assert "(步骤 5)" in captured["prompt"]
+    assert "tavily results" not in captured["prompt"]
+    assert captured["draft"] == "revised draft"
+    assert tracker.saved_prompt_tokens["editor_agent"] > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -197,5 +197,17 @@ def test_track_with_metadata():
     assert tracker.history[0]["metadata"] == metadata
 
 
+def test_track_context_savings():
+    """测试按代理累计上下文筛选节省的提示 token（不计入调用历史）"""
+    tracker = CostTracker()
+
+    assert tracker.track_context_savings("editor_agent", 10000, 2500) == 7500
+    tracker.track_context_savings("editor_agent", 3000, 1000)
+    tracker.track_context_savings("writer_agent", 500, 800)
+
+    assert tracker.summary()["saved_prompt_tokens"] == {"editor_agent": 9500, "writer_agent": 0}
+    assert len(tracker.history) == 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,110 @@
+"""
+单元测试 - 执行历史压缩
+
+测试范围:
+- 摘要保留标题、事实句和来源 URL，并受 token 上限约束
+- 摘要按步骤输出缓存，只计算一次
+- 超过预算时从最早的步骤开始压缩，最新草稿保持原文
+"""
+
+import pytest
+from src import history_compaction
+from src.history_compaction import (
+    compact_history,
+    digest_output,
+    history_tokens,
+    latest_draft_index,
+)
+
+RESEARCH = (
+    "## Key Findings\n\n"
+    "Quantum computing is an exciting field with many open questions and broad interest. "
+    "IBM announced a 1,121-qubit processor in 2023 [1]. "
+    "Researchers are generally optimistic about the future.\n\n"
+    "Source: https://example.com/ibm-condor.\n\n"
+    + "Filler sentence without facts. " * 200
+    + "\n\n<h2>📎 Tools used</h2><ul><li>- tavily_search_tool(query='qubits')</li></ul>"
+)
+
+
+def test_digest_keeps_facts_and_sources():
+    """测试摘要保留标题、包含数字的句子和 URL，丢弃无事实的句子和工具列表"""
+    digest = digest_output(RESEARCH, max_tokens=200)
+
+    assert digest.startswith("[Digest] ## Key Findings")
+    assert "IBM announced a 1,121-qubit processor in 2023 [1]." in digest
+    assert "- https://example.com/ibm-condor" in digest
+    assert "optimistic" not in digest
+    assert "Filler" not in digest
+    assert "tavily_search_tool" not in digest
+
+
+def test_digest_respects_token_limit():
+    """测试摘要不超过 token 上限（来源 URL 始终保留）"""
+    output = "\n".join(f"Fact {i}: value {i * 7} measured in 2024." for i in range(500))
+
+    digest = digest_output(output, max_tokens=100)
+
+    assert history_compaction.ModelAdapter.estimate_tokens(digest) <= 110
+    assert "Fact 0:" in digest
+
+
+def test_digest_computed_once_per_output(monkeypatch):
+    """测试同一步骤输出的摘要只计算一次"""
+    calls = []
+    original = history_compaction._extract_digest
+
+    def counting_extract(output, max_tokens):
+        calls.append(output)
+        return original(output, max_tokens)
+
+    monkeypatch.setattr(history_compaction, "_extract_digest", counting_extract)
+    output = RESEARCH + " unique-for-cache-test 42."
+
+    assert digest_output(output) == digest_output(output)
+    assert len(calls) == 1
+
+
+def test_compact_history_under_budget_is_unchanged():
+    """测试未超过预算时历史记录保持不变"""
+    history = [["Research agent: search", "d", "short 1"]]
+
+    assert compact_history(history, budget_tokens=1000) is history
+
+
+def test_compact_history_replaces_oldest_first_and_keeps_latest_draft():
+    """测试从最早的步骤开始压缩，最新草稿保持原文"""
+    draft = "# Draft\n\n" + "Body text with 3 facts. " * 300
+    history = [
+        ["Research agent: Tavily search", "d", RESEARCH],
+        ["Research agent: arXiv search", "d", RESEARCH + " arXiv 2024."],
+        ["Writer agent: Draft the report", "d", draft],
+    ]
+    budget = history_tokens(history) - 100
+
+    compacted = compact_history(history, budget_tokens=budget)
+
+    assert compacted[0][2].startswith("[Digest]")
+    assert compacted[1][2] == history[1][2]  # 压缩第一条后已在预算内
+    assert compacted[2][2] == draft
+    assert history[0][2] == RESEARCH  # 原列表不被修改
+    assert history_tokens(compacted) <= budget
+
+
+def test_compact_history_never_digests_latest_draft():
+    """测试预算再小也不压缩最新草稿"""
+    draft = "# Draft\n\n" + "Body text with 3 facts. " * 300
+    history = [
+        ["Writer agent: Draft the report", "d", "old draft 1. " * 300],
+        ["Editor agent: Revise the draft", "d", draft],
+    ]
+
+    compacted = compact_history(history, budget_tokens=10)
+
+    assert latest_draft_index(history) == 1
+    assert compacted[0][2].startswith("[Digest]")
+    assert compacted[1][2] == draft
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,112 @@
+"""
+单元测试 - LLM 响应缓存
+
+测试范围:
+- 可缓存判断
+- 缓存键
+- 命中时返回零 usage 的副本
+- 容量上限与 TTL
+- 命中缓存的调用只记账一次（不再由代理重复调用 tracker.track）
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+from src import agents, llm_cache
+from src.cost_tracker import tracker
+from src.llm_cache import LLMResponseCache, get_llm_cache, is_cacheable, make_request_key
+
+
+def test_is_cacheable():
+    """测试只有确定性调用可以缓存"""
+    assert is_cacheable({"temperature": 0})
+    assert is_cacheable({"temperature": 0.0, "max_tokens": 100})
+    assert not is_cacheable({})
+    assert not is_cacheable({"temperature": 0.7})
+    assert not is_cacheable({"temperature": 0, "stream": True})
+    assert not is_cacheable({"temperature": 0, "n": 3})
+
+
+def test_make_request_key():
+    """测试缓存键由模型、消息和参数决定"""
+    messages = [{"role": "user", "content": "hi"}]
+    key = make_request_key("deepseek:deepseek-chat", messages, temperature=0)
+
+    assert key == make_request_key("deepseek:deepseek-chat", list(messages), temperature=0)
+    assert key != make_request_key("openai:gpt-4o-mini", messages, temperature=0)
+    assert key != make_request_key("deepseek:deepseek-chat", messages, temperature=0, tools=[{"type": "function"}])
+
+
+def test_make_request_key_message_objects():
+    """测试消息列表中包含对象（如工具循环中的助手消息）时也能生成键"""
+    message = SimpleNamespace(role="assistant", content=None, tool_calls=[])
+
+    key = make_request_key("deepseek:deepseek-chat", [message], temperature=0)
+
+    assert len(key) == 64
+
+
+def test_cache_hit_returns_zero_usage_copy():
+    """测试命中时返回副本，usage 置零，原始 usage 保留在 cached_usage"""
+    cache = LLMResponseCache(max_entries=10, ttl=60)
+    response = SimpleNamespace(
+        content="answer", usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+    )
+
+    cache.set("key", response)
+    hit = cache.get("key")
+
+    assert hit is not response
+    assert hit.content == "answer"
+    assert hit.cache_hit is True
+    assert hit.usage.prompt_tokens == 0
+    assert hit.cached_usage.prompt_tokens == 10
+    # 原对象不受影响
+    assert response.usage.prompt_tokens == 10
+
+
+def test_cache_bounded_and_expires():
+    """测试容量上限和 TTL"""
+    cache = LLMResponseCache(max_entries=2, ttl=0.05)
+
+    for i in range(3):
+        cache.set(f"key-{i}", SimpleNamespace(content=i))
+    assert len(cache) == 2
+    assert cache.get("key-0") is None
+
+    time.sleep(0.08)
+    assert cache.get("key-2") is None
+
+
+def test_get_llm_cache_opt_in(monkeypatch):
+    """测试缓存默认关闭"""
+    monkeypatch.delenv("LLM_CACHE_ENABLED", raising=False)
+
+    assert get_llm_cache() is None
+
+
+def test_cache_hit_tracked_once(monkeypatch):
+    """测试命中缓存时只记录一次缓存命中，不再额外记一次零成本调用"""
+    model = "deepseek:deepseek-chat"
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+    monkeypatch.setattr(llm_cache, "_cache", LLMResponseCache())
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50, total_tokens=150)
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="# Edited"))], usage=usage
+    )
+    completions = SimpleNamespace(create=lambda **kwargs: response)
+    monkeypatch.setattr(agents, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    tracker.reset()
+
+    for _ in range(2):
+        content, _ = agents.editor_agent(prompt="Draft text", model=model, patch_mode=False)
+        assert content == "# Edited"
+
+    assert tracker.calls[model] == 1
+    assert tracker.cache_hits[model] == 1
+    assert len(tracker.history) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
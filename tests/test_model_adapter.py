@@ -6,12 +6,59 @@
 - 参数验证和调整
 - Token 估算
 - 上下文使用率计算
+- 同步/异步安全调用的重试与并发限制
+- 确定性调用的响应缓存
+- 重试之间检查任务取消
 """
 
+import asyncio
+from types import SimpleNamespace
+
 import pytest
+from src.cancellation import CancellationToken, TaskCancelledError, cancellation_scope
+from src.cost_tracker import tracker
+from src.llm_cache import LLMResponseCache
 from src.model_adapter import ModelAdapter
 
 
+class _FakeCompletions:
+    """模拟 aisuite 的 chat.completions（可按顺序抛出错误）"""
+
+    def __init__(self, errors=None, delay=0.0):
+        self.errors = list(errors or [])
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    def create(self, model, messages, **kwargs):
+        self.calls.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(model=model, kwargs=kwargs)
+
+
+class _FakeAsyncCompletions(_FakeCompletions):
+    async def acreate(self, model, messages, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return self.create(model, messages, **kwargs)
+        finally:
+            self.active -= 1
+
+
+def _fake_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """测试中不等待退避时间"""
+    monkeypatch.setattr(ModelAdapter, "BASE_WAIT_TIME", 0)
+
+
 def test_get_model_limits_deepseek_chat():
     """测试 DeepSeek Chat 模型限制"""
     limits = ModelAdapter.get_model_limits("deepseek:deepseek-chat")
@@ -154,5 +201,201 @@ def test_get_context_usage_high():
     assert usage > 0.8
 
 
+def test_safe_api_call_retries_connection_error(no_backoff):
+    """测试连接错误后重试成功"""
+    completions = _FakeCompletions(errors=[ConnectionError("reset")])
+
+    resp = ModelAdapter.safe_api_call(
+        _fake_client(completions), "deepseek:deepseek-chat", [], temperature=0
+    )
+
+    assert resp.model == "deepseek:deepseek-chat"
+    assert len(completions.calls) == 2
+
+
+def test_safe_api_call_halves_max_tokens_on_400():
+    """测试参数错误时 max_tokens 减半重试"""
+    completions = _FakeCompletions(errors=[ValueError("400 invalid max_tokens")])
+
+    resp = ModelAdapter.safe_api_call(
+        _fake_client(completions), "deepseek:deepseek-chat", [], max_tokens=8000
+    )
+
+    assert completions.calls[0]["max_tokens"] == 8000
+    assert resp.kwargs["max_tokens"] == 4000
+
+
+def test_safe_api_call_raises_after_retries(no_backoff):
+    """测试所有重试失败后抛出原始异常"""
+    completions = _FakeCompletions(errors=[RuntimeError("boom")] * 3)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        ModelAdapter.safe_api_call(_fake_client(completions), "deepseek:deepseek-chat", [])
+
+    assert len(completions.calls) == ModelAdapter.MAX_RETRIES
+
+
+def test_safe_api_call_stops_retrying_when_cancelled():
+    """测试退避等待中被取消时立即停止重试"""
+    token = CancellationToken()
+    completions = _FakeCompletions(errors=[ConnectionError("connection reset")] * 3)
+    original_create = completions.create
+
+    def create(model, messages, **kwargs):
+        token.cancel("user")
+        return original_create(model, messages, **kwargs)
+
+    completions.create = create
+
+    with cancellation_scope(token):
+        with pytest.raises(TaskCancelledError):
+            ModelAdapter.safe_api_call(_fake_client(completions), "deepseek:deepseek-chat", [])
+
+    assert len(completions.calls) == 1
+
+
+def test_async_safe_api_call_uses_acreate(no_backoff):
+    """测试异步调用优先使用 acreate 并共享重试逻辑"""
+    completions = _FakeAsyncCompletions(errors=[ValueError("400 max_tokens")])
+
+    resp = asyncio.run(ModelAdapter.async_safe_api_call(
+        _fake_client(completions), "deepseek:deepseek-chat", [], max_tokens=8000
+    ))
+
+    assert resp.kwargs["max_tokens"] == 4000
+    assert len(completions.calls) == 2
+
+
+def test_async_safe_api_call_sync_client_fallback(no_backoff):
+    """测试客户端没有 acreate 时在线程中调用同步接口"""
+    completions = _FakeCompletions(errors=[ConnectionError("reset")])
+
+    resp = asyncio.run(ModelAdapter.async_safe_api_call(
+        _fake_client(completions), "openai:gpt-4o-mini", [], temperature=0
+    ))
+
+    assert resp.model == "openai:gpt-4o-mini"
+    assert len(completions.calls) == 2
+
+
+def test_async_safe_api_call_raises_after_retries(no_backoff):
+    """测试异步调用所有重试失败后抛出原始异常"""
+    completions = _FakeAsyncCompletions(errors=[RuntimeError("boom")] * 3)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(ModelAdapter.async_safe_api_call(
+            _fake_client(completions), "deepseek:deepseek-chat", []
+        ))
+
+
+def test_async_safe_api_call_provider_concurrency(monkeypatch):
+    """测试按提供商限制并发请求数"""
+    monkeypatch.setenv("LLM_CONCURRENCY_DEEPSEEK", "2")
+    completions = _FakeAsyncCompletions(delay=0.02)
+    client = _fake_client(completions)
+
+    async def _main():
+        await asyncio.gather(*[
+            ModelAdapter.async_safe_api_call(client, "deepseek:deepseek-chat", [])
+            for _ in range(6)
+        ])
+
+    asyncio.run(_main())
+
+    assert len(completions.calls) == 6
+    assert completions.max_active == 2
+
+
+def test_get_provider_concurrency_defaults(monkeypatch):
+    """测试提供商并发上限默认值和环境变量覆盖"""
+    monkeypatch.delenv("LLM_CONCURRENCY_OPENAI", raising=False)
+    monkeypatch.setenv("LLM_CONCURRENCY_QWEN", "3")
+
+    assert ModelAdapter.get_provider_concurrency("openai") == 16
+    assert ModelAdapter.get_provider_concurrency("qwen") == 3
+    assert ModelAdapter.get_provider_concurrency("unknown") == ModelAdapter.DEFAULT_PROVIDER_CONCURRENCY
+
+
+@pytest.fixture
+def llm_cache(monkeypatch):
+    """开启独立的 LLM 响应缓存，并重置成本追踪器"""
+    cache = LLMResponseCache(max_entries=10, ttl=60)
+    monkeypatch.setattr("src.model_adapter.get_llm_cache", lambda: cache)
+    tracker.reset()
+    yield cache
+    tracker.reset()
+
+
+def test_safe_api_call_cache_hit(llm_cache):
+    """测试相同的 temperature=0 调用命中缓存，且记为零成本"""
+    completions = _FakeCompletions()
+    client = _fake_client(completions)
+    messages = [{"role": "user", "content": "hi"}]
+
+    def _create(model, messages, **kwargs):
+        completions.calls.append(kwargs)
+        return SimpleNamespace(
+            content="answer",
+            usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=500),
+        )
+
+    completions.create = _create
+
+    first = ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", messages, temperature=0)
+    second = ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", messages, temperature=0)
+
+    assert len(completions.calls) == 1
+    assert second.content == "answer"
+    assert second.cache_hit is True
+    assert second.usage.prompt_tokens == 0
+    assert first.usage.prompt_tokens == 1000
+
+    summary = tracker.summary()
+    assert summary["cache_hits"] == 1
+    assert summary["saved_cost"] > 0
+
+
+def test_safe_api_call_cache_skips_nondeterministic(llm_cache):
+    """测试 temperature 非 0 或未设置的调用不缓存"""
+    completions = _FakeCompletions()
+    client = _fake_client(completions)
+    messages = [{"role": "user", "content": "hi"}]
+
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", messages, temperature=1)
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", messages, temperature=1)
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", messages)
+
+    assert len(completions.calls) == 3
+    assert len(llm_cache) == 0
+
+
+def test_safe_api_call_cache_key_includes_params(llm_cache):
+    """测试消息或参数不同时不命中缓存"""
+    completions = _FakeCompletions()
+    client = _fake_client(completions)
+
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", [{"role": "user", "content": "a"}], temperature=0)
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", [{"role": "user", "content": "b"}], temperature=0)
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", [{"role": "user", "content": "a"}], temperature=0, max_tokens=100)
+    ModelAdapter.safe_api_call(client, "openai:gpt-4o-mini", [{"role": "user", "content": "a"}], temperature=0)
+
+    assert len(completions.calls) == 4
+
+
+def test_async_safe_api_call_cache_hit(llm_cache):
+    """测试异步调用共享响应缓存"""
+    completions = _FakeAsyncCompletions()
+    client = _fake_client(completions)
+    messages = [{"role": "user", "content": "hi"}]
+
+    ModelAdapter.safe_api_call(client, "deepseek:deepseek-chat", messages, temperature=0)
+    response = asyncio.run(
+        ModelAdapter.async_safe_api_call(client, "deepseek:deepseek-chat", messages, temperature=0)
+    )
+
+    assert len(completions.calls) == 1
+    assert response.cache_hit is True
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
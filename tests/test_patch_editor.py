@@ -0,0 +1,171 @@
+"""
+单元测试 - 补丁式编辑
+
+测试范围:
+- 修改列表的解析与校验
+- 查找替换与按章节替换
+- 无法应用时抛出 PatchApplyError
+- editor_agent 补丁模式与回退为整篇重写
+- 超长输入在补丁模式下只压缩草稿以外的上下文
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from src.agents import editor_agent
+from src.model_adapter import ModelAdapter
+from src.patch_editor import PatchApplyError, apply_edits, parse_edits
+
+DRAFT = """# Report
+
+## Introduction
+
+Quantum computers use qubits.
+
+### Scope
+
+Only hardware.
+
+## Discussion
+
+Old discussion [1].
+
+## References
+
+[1] Smith (2020)."""
+
+
+def _response(content):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_parse_edits_accepts_fenced_json():
+    """测试解析代码围栏中的修改列表"""
+    raw = '```json\n{"edits": [{"op": "replace", "find": "a", "replace": "b"}]}\n```'
+
+    assert parse_edits(raw) == [{"op": "replace", "find": "a", "replace": "b"}]
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        "# Revised report\n\nFull text",
+        '{"edits": [{"op": "delete", "find": "a"}]}',
+        '{"edits": [{"op": "replace", "find": "a"}]}',
+        '{"changes": []}',
+    ],
+)
+def test_parse_edits_rejects_invalid(raw):
+    """测试不合法的修改格式返回 None"""
+    assert parse_edits(raw) is None
+
+
+def test_apply_replace_and_section_edits():
+    """测试查找替换和按章节替换（包含子章节，保留后续章节）"""
+    edits = [
+        {"op": "replace", "find": "use qubits.", "replace": "use superconducting qubits."},
+        {"op": "replace_section", "heading": "## introduction", "content": "## Introduction\n\nNew intro."},
+        {"op": "replace_section", "heading": "## Discussion", "content": "## Discussion\n\nNew discussion [1]."},
+    ]
+
+    result = apply_edits(DRAFT, edits)
+
+    assert "## Introduction\n\nNew intro.\n\n## Discussion" in result
+    assert "### Scope" not in result
+    assert "New discussion [1].\n\n## References\n\n[1] Smith (2020)." in result
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        {"op": "replace", "find": "not in draft", "replace": "x"},
+        {"op": "replace", "find": "## ", "replace": "x"},
+        {"op": "replace_section", "heading": "## Methods", "content": "## Methods"},
+    ],
+)
+def test_apply_edits_fails_when_patch_does_not_apply(edit):
+    """测试查找文本不存在/不唯一、章节不存在时抛出 PatchApplyError"""
+    with pytest.raises(PatchApplyError):
+        apply_edits(DRAFT, [edit])
+
+
+def test_editor_agent_applies_patch(monkeypatch):
+    """测试补丁模式下只调用一次模型，修改在本地应用"""
+    calls = []
+    edits = {"edits": [{"op": "replace", "find": "Old discussion", "replace": "Better discussion"}]}
+
+    def fake_call(cls, **kwargs):
+        calls.append(kwargs["messages"])
+        return _response(json.dumps(edits))
+
+    monkeypatch.setattr(ModelAdapter, "safe_api_call", classmethod(fake_call))
+
+    content, _ = editor_agent(
+        prompt=f"草稿:\n{DRAFT}", model="deepseek:deepseek-chat", draft=DRAFT, patch_mode=True
+    )
+
+    assert content == DRAFT.replace("Old discussion", "Better discussion")
+    assert len(calls) == 1
+    assert "PATCH MODE" in calls[0][0]["content"]
+    # 草稿已在提示中，不重复附加
+    assert calls[0][1]["content"].count("Old discussion") == 1
+
+
+def test_editor_agent_falls_back_to_full_rewrite(monkeypatch):
+    """测试补丁无法应用时回退为整篇重写"""
+    responses = iter([
+        json.dumps({"edits": [{"op": "replace", "find": "missing", "replace": "x"}]}),
+        "# Fully rewritten report",
+    ])
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: _response(next(responses)))
+    )
+
+    content, messages = editor_agent(
+        prompt=f"草稿:\n{DRAFT}", model="deepseek:deepseek-chat", draft=DRAFT, patch_mode=True
+    )
+
+    assert content == "# Fully rewritten report"
+    assert "PATCH MODE" not in messages[0]["content"]
+
+
+def test_editor_agent_patch_mode_condenses_context_around_draft(monkeypatch):
+    """测试补丁模式下超长输入只压缩草稿以外的上下文，草稿原样出现一次"""
+    monkeypatch.setenv("CHUNKING_THRESHOLD", "0.002")
+    monkeypatch.setenv("MAX_CHUNK_SIZE", "50")
+    condensed_chunks = []
+    patch_calls = []
+    edits = {"edits": [{"op": "replace", "find": "Old discussion", "replace": "Better discussion"}]}
+
+    def fake_call(cls, **kwargs):
+        content = kwargs["messages"][0]["content"]
+        if "Condense it into dense notes" in content:
+            condensed_chunks.append(content)
+            return _response("notes")
+        patch_calls.append(kwargs["messages"])
+        return _response(json.dumps(edits))
+
+    monkeypatch.setattr(ModelAdapter, "safe_api_call", classmethod(fake_call))
+    research = "\n\n".join(f"Source {i}: " + "finding " * 30 for i in range(4))
+
+    content, _ = editor_agent(
+        prompt=f"{research}\n\n草稿:\n{DRAFT}",
+        model="deepseek:deepseek-chat",
+        draft=DRAFT,
+        patch_mode=True,
+    )
+
+    assert condensed_chunks
+    assert all("Old discussion" not in chunk for chunk in condensed_chunks)
+    assert len(patch_calls) == 1
+    user_content = patch_calls[0][1]["content"]
+    assert "finding" not in user_content
+    assert user_content.count("Old discussion") == 1
+    assert user_content.endswith(DRAFT)
+    assert content == DRAFT.replace("Old discussion", "Better discussion")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,99 @@
+"""
+单元测试 - PDF 磁盘缓存
+
+测试范围:
+- 缓存键生成
+- PDF / 文本读写
+- LRU 淘汰
+"""
+
+import os
+import time
+
+import pytest
+from src.pdf_cache import PdfCache, cache_key, get_pdf_cache
+
+
+def test_cache_key_arxiv_versioned():
+    """测试同一论文的 abs / pdf 链接共享缓存键"""
+    assert cache_key("https://arxiv.org/abs/2401.01234v2") == "arxiv_2401.01234v2"
+    assert cache_key("https://arxiv.org/pdf/2401.01234v2.pdf") == "arxiv_2401.01234v2"
+    assert cache_key("http://arxiv.org/abs/cs/0112017v1") == "arxiv_cs_0112017v1"
+
+
+def test_cache_key_other_urls_hashed():
+    """测试无版本号或非 arXiv 链接使用 URL 哈希"""
+    key = cache_key("https://arxiv.org/pdf/2401.01234")
+
+    assert key.startswith("url_")
+    assert key != cache_key("https://arxiv.org/pdf/2401.01235")
+    assert "/" not in cache_key("https://example.com/a/b.pdf")
+
+
+def test_pdf_roundtrip(tmp_path):
+    """测试 PDF 字节读写"""
+    cache = PdfCache(cache_dir=str(tmp_path))
+    url = "https://arxiv.org/pdf/2401.01234v1"
+
+    assert cache.get_pdf(url) is None
+    cache.put_pdf(url, b"%PDF-1.4 data")
+
+    assert cache.get_pdf(url) == b"%PDF-1.4 data"
+    assert cache.get_pdf("https://arxiv.org/abs/2401.01234v1") == b"%PDF-1.4 data"
+
+
+def test_text_cached_per_page_limit(tmp_path):
+    """测试文本按页数限制分别缓存"""
+    cache = PdfCache(cache_dir=str(tmp_path))
+    url = "https://arxiv.org/pdf/2401.01234v1"
+
+    cache.put_text(url, "前 6 页", max_pages=6)
+    cache.put_text(url, "全文", max_pages=None)
+
+    assert cache.get_text(url, max_pages=6) == "前 6 页"
+    assert cache.get_text(url) == "全文"
+    assert cache.get_text(url, max_pages=3) is None
+
+
+def test_atomic_write_leaves_no_temp_files(tmp_path):
+    """测试写入后不残留临时文件"""
+    cache = PdfCache(cache_dir=str(tmp_path))
+
+    cache.put_pdf("https://arxiv.org/pdf/2401.01234v1", b"x" * 100)
+    cache.put_pdf("https://arxiv.org/pdf/2401.01234v1", b"y" * 50)
+
+    files = os.listdir(tmp_path / "pdf")
+    assert files == ["arxiv_2401.01234v1.pdf"]
+    assert cache.size() == 50
+
+
+def test_lru_eviction(tmp_path):
+    """测试超过上限时淘汰最久未访问的文件"""
+    cache = PdfCache(cache_dir=str(tmp_path), max_bytes=250)
+    urls = [f"https://arxiv.org/pdf/2401.0000{i}v1" for i in range(3)]
+
+    cache.put_pdf(urls[0], b"a" * 100)
+    cache.put_pdf(urls[1], b"b" * 100)
+    # 让 mtime 有明显先后顺序，并访问第一篇使其成为最近使用
+    old = time.time() - 100
+    os.utime(cache._pdf_path(urls[1]), (old, old))
+    os.utime(cache._pdf_path(urls[0]), (old - 10, old - 10))
+    assert cache.get_pdf(urls[0]) is not None
+
+    cache.put_pdf(urls[2], b"c" * 100)
+
+    assert cache.get_pdf(urls[0]) is not None
+    assert cache.get_pdf(urls[1]) is None
+    assert cache.get_pdf(urls[2]) is not None
+    assert cache.size() <= 250
+
+
+def test_get_pdf_cache_disabled(monkeypatch):
+    """测试通过环境变量关闭缓存"""
+    monkeypatch.setenv("PDF_CACHE_ENABLED", "false")
+
+    assert get_pdf_cache() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
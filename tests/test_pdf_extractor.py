@@ -0,0 +1,126 @@
+"""
+单元测试 - PDF 提取进程池
+
+测试范围:
+- 在子进程中执行并返回结果
+- 超时后结束卡住的进程并重建进程池
+- 排队等待不计入超时；超时只结束执行该文档的子进程
+- 子进程内存上限
+- 提取失败时抛出异常
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from src.pdf_extractor import PdfExtractionPool, extract_pdf_text
+
+
+@pytest.fixture
+def pool():
+    """小规模进程池（测试结束后关闭）"""
+    pool = PdfExtractionPool(workers=1, timeout=10, max_tasks_per_child=2, memory_limit_mb=512)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_run_returns_result(pool):
+    """测试子进程执行结果返回给调用方"""
+    assert pool.run(sum, [1, 2, 3]) == 6
+    assert pool.run(divmod, 7, 2) == (3, 1)
+
+
+def test_workers_recycled(pool):
+    """测试多次执行（超过 max_tasks_per_child）后进程池仍可用"""
+    results = [pool.run(abs, -i) for i in range(5)]
+
+    assert results == [0, 1, 2, 3, 4]
+
+
+def test_timeout_kills_and_rebuilds_pool(pool):
+    """测试超时后抛出异常，进程池重建后可继续使用"""
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="超时"):
+        pool.run(time.sleep, 30, timeout=0.5)
+
+    assert time.monotonic() - start < 10
+    assert pool.run(sum, [1, 1]) == 2
+
+
+def test_memory_limit(pool):
+    """测试超出内存上限时抛出异常而不影响主进程"""
+    with pytest.raises(RuntimeError, match="内存"):
+        pool.run(bytearray, 2 * 1024 * 1024 * 1024)
+
+    assert pool.run(sum, [2, 2]) == 4
+
+
+def test_extract_invalid_pdf_raises(pool):
+    """测试无法解析的 PDF 抛出 RuntimeError"""
+    with pytest.raises(RuntimeError):
+        pool.extract_text(b"not a pdf", max_pages=1)
+
+
+def test_extract_in_process_mode(monkeypatch):
+    """测试 PDF_EXTRACT_IN_PROCESS=true 时在当前进程提取"""
+    monkeypatch.setenv("PDF_EXTRACT_IN_PROCESS", "true")
+
+    with pytest.raises(RuntimeError, match="PDF 文本提取失败"):
+        extract_pdf_text(b"not a pdf")
+
+
+def test_invalid_worker_count():
+    """测试进程数必须大于 0"""
+    with pytest.raises(ValueError):
+        PdfExtractionPool(workers=0)
+
+
+def test_queue_wait_not_counted_in_timeout():
+    """测试任务数多于子进程数时，排队等待的时间不计入超时"""
+    pool = PdfExtractionPool(workers=1, timeout=1.5, max_tasks_per_child=0, memory_limit_mb=0)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(pool.run, time.sleep, 0.5) for _ in range(4)]
+            results = [future.result() for future in futures]
+    finally:
+        pool.shutdown(wait=True)
+
+    # 总耗时约 2s，超过单个文档的超时，但每个文档自身只执行 0.5s
+    assert results == [None] * 4
+
+
+def test_timeout_only_kills_hung_document():
+    """测试一个文档超时不影响其他子进程中正在提取的文档"""
+    pool = PdfExtractionPool(workers=2, timeout=10, max_tasks_per_child=0, memory_limit_mb=0)
+    errors = []
+
+    def hung():
+        try:
+            pool.run(time.sleep, 30, timeout=0.5)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    try:
+        pool.run(sum, [0])  # 预先创建一个子进程
+        thread = threading.Thread(target=hung)
+        thread.start()
+        assert pool.run(time.sleep, 1.5) is None
+        thread.join()
+    finally:
+        pool.shutdown(wait=True)
+
+    assert len(errors) == 1 and "超时" in errors[0]
+
+
+def test_dead_idle_worker_replaced(pool):
+    """测试空闲子进程意外退出后自动换用新的子进程"""
+    assert pool.run(sum, [1]) == 1
+    pool._idle[0].process.kill()
+    pool._idle[0].process.join()
+
+    assert pool.run(sum, [1, 2]) == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
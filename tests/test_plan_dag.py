@@ -0,0 +1,169 @@
+"""
+单元测试 - 计划 DAG 执行
+
+测试范围:
+- 依赖列表的规范化与线性回退
+- 依赖闭包与检查点复用
+- 无依赖的步骤并发执行，且不超过并发上限
+- 步骤历史只包含依赖闭包中的步骤
+- 步骤失败与任务取消
+"""
+
+import threading
+import time
+
+import pytest
+from src.cancellation import CancellationToken, TaskCancelledError, cancellation_scope
+from src.plan_dag import (
+    PlanDagExecutor,
+    PlanStepError,
+    ancestors,
+    linear_dependencies,
+    normalize_dependencies,
+    reusable_steps,
+)
+
+STEPS = ["A", "B", "C", "D"]
+
+
+def test_normalize_dependencies_falls_back_to_linear():
+    """测试缺失或长度不一致的依赖回退为线性顺序"""
+    assert normalize_dependencies(3, None) == linear_dependencies(3) == [[], [0], [1]]
+    assert normalize_dependencies(3, [[], [0]]) == [[], [0], [1]]
+
+
+def test_normalize_dependencies_drops_forward_references():
+    """测试只保留指向更早步骤的依赖（保证无环）"""
+    assert normalize_dependencies(3, [[1], [0, 0, 2], "x"]) == [[], [0], [1]]
+
+
+def test_ancestors_and_reusable_steps():
+    """测试依赖闭包，以及依赖需要重新执行时下游检查点不复用"""
+    deps = [[], [], [0], [1, 2]]
+    assert ancestors(deps, 3) == [0, 1, 2]
+    assert ancestors(deps, 2) == [0]
+
+    completed = {1: "b", 2: "c", 3: "d"}
+    # 步骤 0 缺失 → 步骤 2 及依赖它的步骤 3 都不能复用
+    assert reusable_steps(deps, completed) == {1: "b"}
+
+
+def test_linear_plan_runs_in_order_with_full_history():
+    """测试未声明依赖时按顺序执行，每步看到之前的全部历史"""
+    calls = []
+
+    def run_step(index, history):
+        calls.append((index, [entry[0] for entry in history]))
+        return f"desc {index}", "agent", f"out {index}"
+
+    results = PlanDagExecutor(STEPS, None, run_step, max_concurrency=3).run()
+
+    assert calls == [(0, []), (1, ["A"]), (2, ["A", "B"]), (3, ["A", "B", "C"])]
+    assert results[3] == ["D", "desc 3", "out 3"]
+
+
+def test_independent_steps_run_concurrently_within_cap():
+    """测试互不依赖的步骤并发执行，同时执行数不超过上限"""
+    deps = [[], [], [], [0, 1, 2]]
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+    histories = {}
+
+    def run_step(index, history):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.1)
+        with lock:
+            state["active"] -= 1
+        histories[index] = [entry[0] for entry in history]
+        return "", "agent", STEPS[index]
+
+    started = []
+    start = time.monotonic()
+    PlanDagExecutor(
+        STEPS, deps, run_step, max_concurrency=2,
+        on_start=lambda index, running: started.append((index, running)),
+    ).run()
+
+    assert state["peak"] == 2
+    assert time.monotonic() - start < 0.38  # 串行需要 0.4s
+    assert histories[3] == ["A", "B", "C"]
+    assert started[:2] == [(0, [0]), (1, [0, 1])]
+
+
+def test_history_limited_to_dependency_closure():
+    """测试步骤只看到依赖闭包中的步骤输出"""
+    deps = [[], [], [1], [2]]
+    histories = {}
+
+    def run_step(index, history):
+        histories[index] = [entry[0] for entry in history]
+        return "", "agent", ""
+
+    PlanDagExecutor(STEPS, deps, run_step).run()
+
+    assert histories == {0: [], 1: [], 2: ["B"], 3: ["B", "C"]}
+
+
+def test_completed_steps_are_not_rerun():
+    """测试已完成的步骤直接复用，不会重新执行"""
+    executed = []
+    completions = []
+
+    def run_step(index, history):
+        executed.append(index)
+        return "", "agent", ""
+
+    results = PlanDagExecutor(
+        STEPS, None, run_step,
+        on_complete=lambda index, entry, agent, running: completions.append(index),
+    ).run(completed={0: ["A", "d", "saved"], 2: ["C", "d", "stale"]})
+
+    assert executed == [1, 2, 3]
+    assert completions == [1, 2, 3]
+    assert results[0][2] == "saved"
+
+
+def test_step_failure_raises_plan_step_error():
+    """测试步骤失败时抛出 PlanStepError，且不再启动依赖它的步骤"""
+    executed = []
+
+    def run_step(index, history):
+        executed.append(index)
+        if index == 1:
+            raise ValueError("boom")
+        return "", "agent", ""
+
+    with pytest.raises(PlanStepError) as exc_info:
+        PlanDagExecutor(STEPS, None, run_step).run()
+
+    assert exc_info.value.step_index == 1
+    assert exc_info.value.step_title == "B"
+    assert isinstance(exc_info.value.error, ValueError)
+    assert executed == [0, 1]
+
+
+def test_cancellation_stops_scheduling(monkeypatch):
+    """测试任务取消后立即退出，不再启动新的步骤"""
+    monkeypatch.setenv("CANCEL_POLL_INTERVAL", "0.01")
+    token = CancellationToken()
+    executed = []
+
+    def run_step(index, history):
+        executed.append(index)
+        token.cancel("user")
+        time.sleep(0.2)
+        return "", "agent", ""
+
+    start = time.monotonic()
+    with cancellation_scope(token):
+        with pytest.raises(TaskCancelledError):
+            PlanDagExecutor(STEPS, None, run_step).run()
+
+    assert executed == [0]
+    assert time.monotonic() - start < 0.15
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,86 @@
+"""
+单元测试 - 规划代理
+
+测试范围:
+- 计划的固定步骤契约（提前执行第一步的前提）
+- 步骤依赖的解析（按依赖并发执行）
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from src.model_adapter import ModelAdapter
+from src.plan_dag import linear_dependencies
+from src.planning_agent import (
+    REQUIRED_FINAL_STEP,
+    REQUIRED_FIRST_STEP,
+    REQUIRED_SECOND_STEP,
+    planner_agent,
+)
+
+
+def _plan_response(content):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        '["Writer agent: Draft the report.", "Editor agent: Revise the draft."]',
+        "not a list",
+        f'["{REQUIRED_FIRST_STEP}", "Research agent: Search arXiv for everything."]',
+    ],
+)
+def test_planner_always_starts_with_fixed_step(monkeypatch, raw):
+    """测试无论模型返回什么，计划的第一步总是固定的 Tavily 搜索步骤"""
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: _plan_response(raw))
+    )
+
+    steps = planner_agent("量子计算", model="deepseek:deepseek-chat")
+
+    assert steps[0] == REQUIRED_FIRST_STEP
+    assert steps[1] == REQUIRED_SECOND_STEP
+    assert REQUIRED_FINAL_STEP in steps
+    assert len(steps) <= 7
+
+
+def test_planner_dependencies_follow_step_text(monkeypatch):
+    """测试依赖按步骤文本映射到最终计划，固定步骤的依赖不受模型影响"""
+    raw = json.dumps([
+        {"step": "Research agent: Search Wikipedia for background.", "depends_on": []},
+        {"step": "Research agent: Search news for recent results.", "depends_on": []},
+        {"step": "Writer agent: Draft the report.", "depends_on": [1, 2]},
+    ])
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: _plan_response(raw))
+    )
+
+    steps, deps = planner_agent("量子计算", model="deepseek:deepseek-chat", with_dependencies=True)
+
+    wiki = steps.index("Research agent: Search Wikipedia for background.")
+    news = steps.index("Research agent: Search news for recent results.")
+    writer = steps.index("Writer agent: Draft the report.")
+    assert deps[0] == []
+    assert deps[1] == [0]
+    assert deps[wiki] == [] and deps[news] == []
+    assert deps[writer] == [wiki, news]
+    assert deps[-1] == list(range(len(steps) - 1))
+
+
+def test_planner_without_declared_dependencies_is_linear(monkeypatch):
+    """测试模型没有声明依赖时回退为线性顺序"""
+    raw = '["Writer agent: Draft the report.", "Editor agent: Revise the draft."]'
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: _plan_response(raw))
+    )
+
+    steps, deps = planner_agent("量子计算", model="deepseek:deepseek-chat", with_dependencies=True)
+
+    assert deps == linear_dependencies(len(steps))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
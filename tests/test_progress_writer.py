@@ -0,0 +1,153 @@
+"""
+单元测试 - 进度批量写入
+
+测试范围:
+- 同一任务的更新合并为一次写入
+- 后台定时刷新
+- 状态转换同步写入且保持事件顺序
+- 写入失败时更新保留并重试
+"""
+
+import threading
+import time
+
+import pytest
+from src.progress_writer import ProgressWriter
+
+
+class _Sink:
+    """记录每次写入的内容"""
+
+    def __init__(self, fail_times=0):
+        self.flushes = []
+        self.fail_times = fail_times
+        self.lock = threading.Lock()
+
+    def __call__(self, task_id, update):
+        with self.lock:
+            if self.fail_times:
+                self.fail_times -= 1
+                raise RuntimeError("database unavailable")
+            self.flushes.append(
+                (
+                    task_id,
+                    [e[0] for e in update.events],
+                    dict(update.progress),
+                    dict(update.queue_info),
+                    dict(update.fields),
+                )
+            )
+
+
+def test_updates_coalesced_into_one_flush():
+    """测试同一任务的多次更新合并为一次写入，progress 只保留最新值"""
+    sink = _Sink()
+    writer = ProgressWriter(sink, interval=60)
+
+    writer.add_event("task-1", "plan", "Plan generated", {"steps": ["a", "b"]})
+    writer.update_progress("task-1", totalSteps=2, completedSteps=0)
+    writer.add_event("task-1", "progress", "a", {"step": 1})
+    writer.update_progress("task-1", completedSteps=1, currentStep="a")
+    writer.flush("task-1")
+
+    assert len(sink.flushes) == 1
+    task_id, events, progress, _, _ = sink.flushes[0]
+    assert task_id == "task-1"
+    assert events == ["plan", "progress"]
+    assert progress == {"totalSteps": 2, "completedSteps": 1, "currentStep": "a"}
+    writer.stop()
+
+
+def test_background_flush_within_interval():
+    """测试后台线程按间隔写入"""
+    sink = _Sink()
+    writer = ProgressWriter(sink, interval=0.05)
+
+    writer.add_event("task-1", "progress", "a")
+    time.sleep(0.2)
+
+    assert sink.flushes and sink.flushes[0][1] == ["progress"]
+    writer.stop()
+
+
+def test_transition_flushes_pending_in_order():
+    """测试状态转换连同之前的更新同步写入，事件顺序不变"""
+    sink = _Sink()
+    writer = ProgressWriter(sink, interval=60)
+
+    writer.add_event("task-1", "progress", "step 3", {"step": 3})
+    writer.transition(
+        "task-1",
+        "completed",
+        event=("done", "Research completed", {"report": "# Report"}),
+        progress={"currentStep": None},
+        queue_info={"finishedAt": "2024-01-01T00:00:00Z"},
+        report="# Report",
+    )
+
+    assert len(sink.flushes) == 1
+    _, events, progress, queue_info, fields = sink.flushes[0]
+    assert events == ["progress", "done"]
+    assert progress == {"currentStep": None}
+    assert queue_info == {"finishedAt": "2024-01-01T00:00:00Z"}
+    assert fields == {"report": "# Report", "status": "completed"}
+    writer.stop()
+
+
+def test_tasks_flushed_independently():
+    """测试不同任务的更新分别写入"""
+    sink = _Sink()
+    writer = ProgressWriter(sink, interval=60)
+
+    writer.add_event("task-1", "progress", "a")
+    writer.add_event("task-2", "progress", "b")
+    writer.flush_all()
+
+    assert sorted(f[0] for f in sink.flushes) == ["task-1", "task-2"]
+    writer.stop()
+
+
+def test_failed_flush_keeps_updates_in_order():
+    """测试写入失败时更新被保留，之后的更新排在其后"""
+    sink = _Sink(fail_times=1)
+    writer = ProgressWriter(sink, interval=60)
+
+    writer.add_event("task-1", "plan", "Plan generated")
+    with pytest.raises(RuntimeError):
+        writer.flush("task-1")
+
+    writer.add_event("task-1", "progress", "a")
+    writer.flush("task-1")
+
+    assert len(sink.flushes) == 1
+    assert sink.flushes[0][1] == ["plan", "progress"]
+    writer.stop()
+
+
+def test_transition_raises_when_flush_fails():
+    """测试状态转换写入失败时抛出异常（调用方可以处理）"""
+    sink = _Sink(fail_times=1)
+    writer = ProgressWriter(sink, interval=60)
+
+    with pytest.raises(RuntimeError):
+        writer.transition("task-1", "failed", event=("error", "Task failed", None))
+
+    writer.discard("task-1")
+    writer.flush_all()
+    assert sink.flushes == []
+    writer.stop()
+
+
+def test_stop_flushes_remaining():
+    """测试停止时写入剩余更新"""
+    sink = _Sink()
+    writer = ProgressWriter(sink, interval=60)
+
+    writer.update_progress("task-1", completedSteps=2)
+    writer.stop()
+
+    assert sink.flushes[0][2] == {"completedSteps": 2}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
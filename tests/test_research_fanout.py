@@ -0,0 +1,129 @@
+"""
+单元测试 - 子主题扇出研究
+
+测试范围:
+- 子主题拆分结果的解析与去重
+- 研究结果的确定性合并（段落、来源、工具调用去重）
+- 子主题并发研究（耗时约等于最慢的子主题）
+- 子主题不足或失败时的回退
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from src.model_adapter import ModelAdapter
+from src.research_fanout import fanout_research, merge_findings, split_subtopics
+
+
+def _mock_split(monkeypatch, content):
+    message = SimpleNamespace(content=content)
+    response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: response)
+    )
+
+
+def _tools_block(*lines):
+    return (
+        "\n\n<h2 style='font-size:1.5em; color:#2563eb;'>📎 Tools used</h2>"
+        + "<ul>" + "".join(f"<li>{line}</li>" for line in lines) + "</ul>"
+    )
+
+
+def test_split_subtopics_parses_and_dedupes(monkeypatch):
+    """测试子主题解析：去掉重复和空项，并截断到上限"""
+    _mock_split(monkeypatch, '```python\n["硬件", "算法", " 硬件 ", "", "应用", "伦理"]\n```')
+
+    assert split_subtopics("量子计算", 3) == ["硬件", "算法", "应用"]
+
+
+def test_split_subtopics_invalid_output_returns_empty(monkeypatch):
+    """测试无法解析时返回空列表（由调用方回退）"""
+    _mock_split(monkeypatch, "I cannot split this topic.")
+
+    assert split_subtopics("量子计算", 3) == []
+
+
+def test_merge_findings_dedupes_paragraphs_sources_and_tools():
+    """测试合并时去掉重复段落、来源和工具调用，并保持子主题顺序"""
+    outputs = [
+        "Shared background.\n\nQubits see https://example.com/a."
+        + _tools_block("- tavily_search_tool(query='qubits')"),
+        "shared   background.\n\nAlgorithms see https://www.example.com/a/ and https://example.com/b"
+        + _tools_block("- tavily_search_tool(query='qubits')", "- arxiv_search_tool(query='shor')"),
+    ]
+
+    merged = merge_findings(["硬件", "算法"], outputs)
+
+    assert merged.index("## Subtopic 1: 硬件") < merged.index("## Subtopic 2: 算法")
+    assert merged.lower().count("shared background") == 1
+    assert "- https://example.com/a\n- https://example.com/b" in merged
+    assert merged.count("tavily_search_tool") == 1
+    assert merged.count("📎 Tools used") == 1
+    assert merged.rstrip().endswith("</ul>")
+
+
+def test_fanout_runs_subtopics_concurrently_and_merges_in_order(monkeypatch):
+    """测试子主题并发研究，合并结果按子主题顺序而不是完成顺序"""
+    _mock_split(monkeypatch, '["slow", "fast", "medium"]')
+    delays = {"slow": 0.3, "fast": 0.05, "medium": 0.15}
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def fake_research(prompt):
+        subtopic = prompt.rsplit("\n", 1)[-1]
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(delays[subtopic])
+        with lock:
+            state["active"] -= 1
+        return f"Findings about {subtopic}.", []
+
+    start = time.monotonic()
+    merged = fanout_research("研究任务", topic="量子计算", count=3, research=fake_research)
+
+    assert time.monotonic() - start < 0.45  # 串行需要 0.5s
+    assert state["peak"] == 3
+    assert merged.index("Findings about slow") < merged.index("Findings about fast")
+    assert merged.index("Findings about fast") < merged.index("Findings about medium")
+
+
+def test_fanout_falls_back_to_single_agent(monkeypatch):
+    """测试拆分出的子主题少于 2 个时只调用一次研究代理"""
+    _mock_split(monkeypatch, '["only one"]')
+    prompts = []
+
+    def fake_research(prompt):
+        prompts.append(prompt)
+        return "single result", []
+
+    assert fanout_research("研究任务", topic="量子计算", count=3, research=fake_research) == "single result"
+    assert prompts == ["研究任务"]
+
+
+def test_fanout_skips_failed_subtopics(monkeypatch):
+    """测试某个子主题失败时跳过它，全部失败时返回错误输出"""
+    _mock_split(monkeypatch, '["ok", "bad"]')
+
+    def fake_research(prompt):
+        if prompt.endswith("bad"):
+            raise RuntimeError("boom")
+        return "good findings", []
+
+    merged = fanout_research("研究任务", topic="量子计算", count=2, research=fake_research)
+    assert "good findings" in merged
+    assert "Subtopic 2" not in merged
+
+    def failing_research(prompt):
+        return "[Model Error: down]", []
+
+    assert fanout_research(
+        "研究任务", topic="量子计算", count=2, research=failing_research
+    ) == "[Model Error: down]"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
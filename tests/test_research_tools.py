@@ -0,0 +1,193 @@
+"""
+单元测试 - 研究工具（不访问网络）
+
+测试范围:
+- 按主机限速器（arXiv 默认遵守礼貌访问要求）
+- arXiv 搜索工具的流水线下载和结果格式
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from src import research_tools
+from src.pdf_cache import PdfCache
+from src.research_tools import HostRateLimiter, arxiv_search_tool
+
+
+ARXIV_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+{entries}
+</feed>"""
+
+ARXIV_ENTRY = """
+  <entry>
+    <id>http://arxiv.org/abs/2401.0000{i}v1</id>
+    <published>2024-01-0{i}T00:00:00Z</published>
+    <title>Paper {i}</title>
+    <summary>Abstract {i}</summary>
+    <author><name>Author {i}</name></author>
+    <link title="pdf" href="https://arxiv.org/pdf/2401.0000{i}v1" rel="related"/>
+  </entry>"""
+
+
+@pytest.fixture
+def fake_arxiv(monkeypatch):
+    """模拟 arXiv API、PDF 下载和文本提取"""
+    state = {"active": 0, "max_active": 0, "downloads": 0, "lock": threading.Lock()}
+    monkeypatch.setenv("PDF_CACHE_ENABLED", "false")
+
+    def fake_get(url, timeout=None):
+        entries = "".join(ARXIV_ENTRY.format(i=i) for i in range(1, 4))
+        return SimpleNamespace(
+            content=ARXIV_FEED.format(entries=entries).encode(),
+            raise_for_status=lambda: None,
+        )
+
+    def fake_fetch(url, timeout=90):
+        with state["lock"]:
+            state["active"] += 1
+            state["downloads"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+        time.sleep(0.1)
+        with state["lock"]:
+            state["active"] -= 1
+        if url.endswith("2v1"):
+            raise RuntimeError("404")
+        return url.encode()
+
+    monkeypatch.setattr(research_tools.session, "get", fake_get)
+    monkeypatch.setattr(research_tools, "fetch_pdf_bytes", fake_fetch)
+    monkeypatch.setattr(
+        research_tools, "extract_pdf_text", lambda b, max_pages=None: f"Text of {b.decode()}"
+    )
+    monkeypatch.setattr(
+        research_tools, "arxiv_rate_limiter", HostRateLimiter(min_interval=0, max_concurrent=3)
+    )
+    return state
+
+
+def test_rate_limiter_spaces_requests():
+    """测试同一主机请求开始时间间隔"""
+    limiter = HostRateLimiter(min_interval=0.05, max_concurrent=5)
+    starts = []
+
+    def _request():
+        with limiter.limit("https://arxiv.org/pdf/1"):
+            starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=_request) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    starts.sort()
+    assert starts[1] - starts[0] >= 0.04
+    assert starts[2] - starts[1] >= 0.04
+
+
+def test_rate_limiter_hosts_are_independent():
+    """测试不同主机互不限速"""
+    limiter = HostRateLimiter(min_interval=1.0, max_concurrent=1)
+
+    start = time.monotonic()
+    with limiter.limit("https://arxiv.org/pdf/1"):
+        pass
+    with limiter.limit("https://export.arxiv.org/api/query"):
+        pass
+
+    assert time.monotonic() - start < 0.5
+
+
+def test_rate_limiter_max_concurrent():
+    """测试同一主机并发数上限"""
+    limiter = HostRateLimiter(min_interval=0, max_concurrent=2)
+    state = {"active": 0, "max_active": 0}
+    lock = threading.Lock()
+
+    def _request():
+        with limiter.limit("https://arxiv.org/pdf/1"):
+            with lock:
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+
+    threads = [threading.Thread(target=_request) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert state["max_active"] == 2
+
+
+
+def test_arxiv_rate_limiter_defaults(monkeypatch):
+    """测试 arXiv 限速器默认遵守礼貌访问要求：每 3 秒一个请求、单连接"""
+    monkeypatch.delenv("ARXIV_MIN_INTERVAL", raising=False)
+    monkeypatch.delenv("ARXIV_MAX_CONCURRENT_DOWNLOADS", raising=False)
+
+    limiter = research_tools.create_arxiv_rate_limiter()
+
+    assert limiter.min_interval == 3.0
+    assert limiter.max_concurrent == 1
+
+
+def test_arxiv_rate_limiter_from_env(monkeypatch):
+    """测试限速参数可通过环境变量调整"""
+    monkeypatch.setenv("ARXIV_MIN_INTERVAL", "5")
+    monkeypatch.setenv("ARXIV_MAX_CONCURRENT_DOWNLOADS", "2")
+
+    limiter = research_tools.create_arxiv_rate_limiter()
+
+    assert limiter.min_interval == 5.0
+    assert limiter.max_concurrent == 2
+
+def test_arxiv_search_tool_pipelined(fake_arxiv):
+    """测试 PDF 并发下载，结果保持原有格式和顺序"""
+    start = time.monotonic()
+    results = arxiv_search_tool("transformers", max_results=3)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.3
+    assert fake_arxiv["max_active"] > 1
+    assert [r["title"] for r in results] == ["Paper 1", "Paper 2", "Paper 3"]
+    assert results[0]["summary"] == "Text of https://arxiv.org/pdf/2401.00001v1"
+    assert results[0]["authors"] == ["Author 1"]
+    assert results[0]["published"] == "2024-01-01"
+    # 下载失败时保留原始摘要并记录错误
+    assert results[1]["summary"] == "Abstract 2"
+    assert "PDF 下载失败" in results[1]["pdf_error"]
+
+
+def test_arxiv_search_tool_serial_mode(fake_arxiv, monkeypatch):
+    """测试 ARXIV_DOWNLOAD_WORKERS=1 时串行处理"""
+    monkeypatch.setenv("ARXIV_DOWNLOAD_WORKERS", "1")
+
+    results = arxiv_search_tool("transformers", max_results=3)
+
+    assert fake_arxiv["max_active"] == 1
+    assert len(results) == 3
+
+
+def test_arxiv_search_tool_uses_pdf_cache(fake_arxiv, monkeypatch, tmp_path):
+    """测试重复搜索命中磁盘缓存，不再下载 PDF"""
+    cache = PdfCache(cache_dir=str(tmp_path))
+    monkeypatch.setattr(research_tools, "get_pdf_cache", lambda: cache)
+
+    first = arxiv_search_tool("transformers", max_results=3)
+    downloads = fake_arxiv["downloads"]
+    second = arxiv_search_tool("transformers", max_results=3)
+
+    assert downloads == 3
+    # 失败的下载不缓存，只重试这一篇
+    assert fake_arxiv["downloads"] == downloads + 1
+    assert [r["summary"] for r in second] == [r["summary"] for r in first]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
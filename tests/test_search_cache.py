@@ -0,0 +1,223 @@
+"""
+单元测试 - 搜索结果缓存
+
+测试范围:
+- 查询规范化和缓存键
+- 内存 LRU / TTL
+- 磁盘层回填、过期清理和大小上限
+- 负缓存
+- 相同请求合并
+- 搜索工具装饰器
+"""
+
+import threading
+import time
+
+import pytest
+from src.search_cache import (
+    DiskCacheTier,
+    SearchCache,
+    TTLCache,
+    cached_search,
+    make_cache_key,
+    normalize_query,
+)
+
+
+def test_normalize_query():
+    """测试查询规范化"""
+    assert normalize_query("  Large   Language\nModels ") == "large language models"
+
+
+def test_cache_key_includes_params():
+    """测试缓存键包含规范化查询和参数"""
+    key = make_cache_key("tavily", "LLM  agents", max_results=5)
+
+    assert key == make_cache_key("tavily", "llm agents", max_results=5)
+    assert key != make_cache_key("tavily", "llm agents", max_results=3)
+    assert key != make_cache_key("wikipedia", "llm agents", max_results=5)
+
+
+def test_ttl_cache_expiry():
+    """测试条目过期后失效"""
+    cache = TTLCache(max_entries=10)
+
+    cache.set("a", 1, ttl=0.05)
+    assert cache.get("a") == 1
+    time.sleep(0.08)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_lru_eviction():
+    """测试超过容量时淘汰最久未使用的条目"""
+    cache = TTLCache(max_entries=2)
+
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_disk_tier_shared_between_instances(tmp_path):
+    """测试磁盘层在多个缓存实例（进程）之间共享"""
+    first = SearchCache(max_entries=10, cache_dir=str(tmp_path))
+    second = SearchCache(max_entries=10, cache_dir=str(tmp_path))
+
+    first.set("key", [{"title": "A"}], ttl=60)
+
+    assert second.get("key") == [{"title": "A"}]
+    # 磁盘命中会回填内存层
+    assert second.memory.get("key") == [{"title": "A"}]
+
+
+def test_disk_tier_sweeps_expired_entries(tmp_path):
+    """测试定期清理删除未再被读取的过期文件"""
+    disk = DiskCacheTier(str(tmp_path), max_bytes=10 * 1024 * 1024, sweep_interval=3600)
+    disk.set("a" * 64, "old", expires_at=time.time() - 1)
+    disk.set("b" * 64, "fresh", expires_at=time.time() + 60)
+
+    assert disk.sweep() == 1
+    assert len(disk._entries()) == 1
+    assert disk.get("b" * 64)[1] == "fresh"
+
+    # 写入时按 sweep_interval 自动清理
+    periodic = DiskCacheTier(str(tmp_path), max_bytes=10 * 1024 * 1024, sweep_interval=0)
+    periodic.set("c" * 64, "old", expires_at=time.time() - 1)
+    periodic.set("d" * 64, "fresh", expires_at=time.time() + 60)
+    assert len(periodic._entries()) == 2
+
+
+def test_disk_tier_evicts_when_over_size_limit(tmp_path):
+    """测试总大小超过上限时按过期时间从早到晚淘汰"""
+    disk = DiskCacheTier(str(tmp_path), max_bytes=1000, sweep_interval=3600)
+    now = time.time()
+    for i in range(10):
+        disk.set(f"{i:02d}" + "k" * 62, "x" * 200, expires_at=now + 100 + i)
+
+    assert disk.size() <= 1000
+    # 最晚过期的条目保留，最早过期的被淘汰
+    assert disk.get("09" + "k" * 62) is not None
+    assert disk.get("00" + "k" * 62) is None
+
+
+def test_get_or_fetch_caches_result(tmp_path):
+    """测试命中缓存时不再调用 fetch，且返回的是副本"""
+    cache = SearchCache(max_entries=10, cache_dir="")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"title": "A"}]
+
+    first = cache.get_or_fetch("key", fetch, ttl=60)
+    first[0]["title"] = "modified"
+    second = cache.get_or_fetch("key", fetch, ttl=60)
+
+    assert len(calls) == 1
+    assert second == [{"title": "A"}]
+
+
+def test_negative_cache():
+    """测试错误结果只缓存 negative_ttl 时间"""
+    cache = SearchCache(max_entries=10, cache_dir="")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"error": "rate limited"}]
+
+    def is_error(result):
+        return "error" in result[0]
+
+    cache.get_or_fetch("key", fetch, ttl=60, negative_ttl=0.05, is_error=is_error)
+    cache.get_or_fetch("key", fetch, ttl=60, negative_ttl=0.05, is_error=is_error)
+    assert len(calls) == 1
+
+    time.sleep(0.08)
+    cache.get_or_fetch("key", fetch, ttl=60, negative_ttl=0.05, is_error=is_error)
+    assert len(calls) == 2
+
+
+def test_exceptions_not_cached():
+    """测试 fetch 抛出的异常不缓存"""
+    cache = SearchCache(max_entries=10, cache_dir="")
+
+    def fail():
+        raise ValueError("missing api key")
+
+    with pytest.raises(ValueError):
+        cache.get_or_fetch("key", fail, ttl=60)
+    assert cache.get_or_fetch("key", lambda: [1], ttl=60) == [1]
+
+
+def test_concurrent_lookups_coalesced():
+    """测试并发的相同查询只执行一次 fetch"""
+    cache = SearchCache(max_entries=10, cache_dir="")
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return [{"title": "A"}]
+
+    def lookup():
+        results.append(cache.get_or_fetch("key", fetch, ttl=60))
+
+    threads = [threading.Thread(target=lookup) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [[{"title": "A"}]] * 5
+
+
+def test_cached_search_decorator(monkeypatch, tmp_path):
+    """测试装饰器按规范化查询和参数缓存，并保留函数签名"""
+    monkeypatch.setenv("SEARCH_CACHE_ENABLED", "true")
+    monkeypatch.setattr(
+        "src.search_cache._cache", SearchCache(max_entries=10, cache_dir=str(tmp_path))
+    )
+    calls = []
+
+    @cached_search("demo", "DEMO_CACHE_TTL", 60)
+    def demo_search_tool(query: str, max_results: int = 5) -> list:
+        """示例搜索工具"""
+        calls.append((query, max_results))
+        return [{"title": query, "n": max_results}]
+
+    demo_search_tool("LLM agents")
+    demo_search_tool("  llm   AGENTS ", max_results=5)
+    demo_search_tool("llm agents", 3)
+
+    assert calls == [("LLM agents", 5), ("llm agents", 3)]
+    assert demo_search_tool.__name__ == "demo_search_tool"
+    assert demo_search_tool.__doc__ == "示例搜索工具"
+
+
+def test_cached_search_disabled(monkeypatch):
+    """测试关闭缓存时每次都调用原函数"""
+    monkeypatch.setenv("SEARCH_CACHE_ENABLED", "false")
+    calls = []
+
+    @cached_search("demo", "DEMO_CACHE_TTL", 60)
+    def demo_search_tool(query: str) -> list:
+        calls.append(query)
+        return []
+
+    demo_search_tool("a")
+    demo_search_tool("a")
+
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,145 @@
+"""
+单元测试 - 分章节并行写作
+
+测试范围:
+- 大纲与引用表的解析（含回退）
+- 组装时引用重新编号、删除未知引用、生成唯一的 References 章节
+- 各章节并行撰写，按必备章节顺序组装
+"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from src.model_adapter import ModelAdapter
+from src.section_writer import (
+    REPORT_SECTIONS,
+    assemble_report,
+    plan_outline,
+    write_report_by_sections,
+)
+
+SOURCES = {
+    1: {"reference": "Smith (2020). Qubits.", "url": "https://example.com/qubits"},
+    2: {"reference": "Lee (2021). Shor at scale.", "url": "https://example.com/shor"},
+    3: {"reference": "Unused (2019).", "url": "https://example.com/unused"},
+}
+
+OUTLINE = {
+    "title": "Quantum Computing",
+    "sources": [
+        {"id": 1, "reference": SOURCES[1]["reference"], "url": SOURCES[1]["url"]},
+        {"id": 2, "reference": SOURCES[2]["reference"], "url": SOURCES[2]["url"]},
+    ],
+    "sections": [
+        {"heading": name, "points": [f"point for {name} [1]"]} for name, _ in REPORT_SECTIONS
+    ],
+}
+
+
+def _response(content):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_plan_outline_parses_citation_map(monkeypatch):
+    """测试大纲解析：引用表按编号索引，每个必备章节都有要点列表"""
+    raw = "```json\n" + json.dumps(OUTLINE) + "\n```"
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: _response(raw))
+    )
+
+    outline = plan_outline("materials", model="deepseek:deepseek-chat")
+
+    assert outline["title"] == "Quantum Computing"
+    assert outline["sources"][2]["url"] == "https://example.com/shor"
+    assert list(outline["points"]) == [name for name, _ in REPORT_SECTIONS]
+    assert outline["points"]["Discussion"] == ["point for Discussion [1]"]
+
+
+def test_plan_outline_invalid_returns_none(monkeypatch):
+    """测试大纲无法解析时返回 None（回退为一次性写作）"""
+    monkeypatch.setattr(
+        ModelAdapter, "safe_api_call", classmethod(lambda cls, **kwargs: _response("no json"))
+    )
+
+    assert plan_outline("materials", model="deepseek:deepseek-chat") is None
+
+
+def test_assemble_report_renumbers_citations():
+    """测试引用按首次出现重新编号，未知编号被删除，References 只有一个"""
+    sections = [
+        "## Introduction\n\nLater work [2] builds on [1, 2].",
+        "## Discussion\n\nSee [1-2] and an unknown source [9].",
+    ]
+
+    report = assemble_report("Quantum Computing", sections, SOURCES)
+
+    assert report.startswith("# Quantum Computing\n\n## Introduction")
+    assert "Later work [1] builds on [2, 1]." in report
+    assert "See [2, 1] and an unknown source." in report
+    assert report.count("## References") == 1
+    refs = report.split("## References")[1]
+    assert refs.index("[1] Lee (2021)") < refs.index("[2] Smith (2020)")
+    assert "Unused" not in refs
+    assert '<a href="https://example.com/shor" target="_blank">' in refs
+
+
+def test_sections_written_in_parallel_and_assembled_in_order(monkeypatch):
+    """测试各章节并行撰写，组装顺序与必备章节顺序一致"""
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def fake_call(cls, **kwargs):
+        content = kwargs["messages"][-1]["content"]
+        if "several writers" in content:
+            return _response(json.dumps(OUTLINE))
+        heading = content.split('writing ONLY the "')[1].split('"')[0]
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.1)
+        with lock:
+            state["active"] -= 1
+        return _response(f"## {heading}\n\nText about {heading} [2].\n\n## References\n\n[2] x")
+
+    monkeypatch.setattr(ModelAdapter, "safe_api_call", classmethod(fake_call))
+
+    start = time.monotonic()
+    report = write_report_by_sections(
+        "materials", model="deepseek:deepseek-chat", system_message="sys"
+    )
+
+    assert time.monotonic() - start < 0.5  # 串行需要 0.7s
+    assert state["peak"] == len(REPORT_SECTIONS)
+    positions = [report.index(f"## {name}") for name, _ in REPORT_SECTIONS]
+    assert positions == sorted(positions)
+    assert report.count("## References") == 1
+    assert "Text about Abstract [1]." in report
+
+
+def test_max_tokens_split_across_sections(monkeypatch):
+    """测试整篇报告的 max_tokens 平均分配给每个章节调用"""
+    section_tokens = []
+
+    def fake_call(cls, **kwargs):
+        content = kwargs["messages"][-1]["content"]
+        if "several writers" in content:
+            return _response(json.dumps(OUTLINE))
+        heading = content.split('writing ONLY the "')[1].split('"')[0]
+        section_tokens.append(kwargs.get("max_tokens"))
+        return _response(f"## {heading}\n\nText about {heading}.")
+
+    monkeypatch.setattr(ModelAdapter, "safe_api_call", classmethod(fake_call))
+
+    write_report_by_sections(
+        "materials", model="deepseek:deepseek-chat", system_message="sys", max_tokens=7000
+    )
+
+    assert section_tokens == [7000 // len(REPORT_SECTIONS)] * len(REPORT_SECTIONS)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,94 @@
+"""
+单元测试 - 任务步骤检查点
+
+测试范围:
+- 保存与读取检查点
+- 覆盖同一步骤的检查点
+- 读取全部与计划一致的检查点（不要求连续）
+- 清除检查点
+（使用 SQLite 内存数据库，不依赖 Postgres）
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.task_checkpoints import (
+    CheckpointBase,
+    clear_checkpoints,
+    load_checkpoint_map,
+    save_checkpoint,
+)
+
+PLAN = ["Research agent: 搜索资料", "Writer agent: 撰写草稿", "Editor agent: 修订报告"]
+
+
+@pytest.fixture
+def session():
+    """SQLite 内存数据库会话"""
+    engine = create_engine("sqlite://", future=True)
+    CheckpointBase.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_save_and_load_checkpoints(session):
+    """测试检查点按步骤位置读取"""
+    save_checkpoint(session, "task-1", 1, PLAN[1], "写草稿", "draft")
+    save_checkpoint(session, "task-1", 0, PLAN[0], "搜索", "sources")
+    session.commit()
+
+    assert load_checkpoint_map(session, "task-1", PLAN) == {
+        0: [PLAN[0], "搜索", "sources"],
+        1: [PLAN[1], "写草稿", "draft"],
+    }
+
+
+def test_save_checkpoint_overwrites_same_step(session):
+    """测试重新执行的步骤覆盖旧检查点"""
+    save_checkpoint(session, "task-1", 0, PLAN[0], "搜索", "old")
+    session.commit()
+    save_checkpoint(session, "task-1", 0, PLAN[0], "搜索", "new")
+    session.commit()
+
+    assert load_checkpoint_map(session, "task-1", PLAN) == {0: [PLAN[0], "搜索", "new"]}
+
+
+def test_load_checkpoint_map_skips_plan_mismatch(session):
+    """测试步骤标题与计划不一致或超出计划的检查点不会被复用"""
+    save_checkpoint(session, "task-1", 0, PLAN[0], "搜索", "sources")
+    save_checkpoint(session, "task-1", 1, "Writer agent: 旧计划", "写草稿", "draft")
+    session.commit()
+
+    assert load_checkpoint_map(session, "task-1", PLAN) == {0: [PLAN[0], "搜索", "sources"]}
+    assert load_checkpoint_map(session, "task-1", PLAN[:0]) == {}
+
+
+def test_load_checkpoint_map_keeps_steps_after_gap(session):
+    """测试按依赖执行的计划读取缺口之后、与计划一致的检查点"""
+    save_checkpoint(session, "task-1", 0, PLAN[0], "搜索", "sources")
+    save_checkpoint(session, "task-1", 2, PLAN[2], "修订", "final")
+    save_checkpoint(session, "task-1", 1, "Writer agent: 旧计划", "写草稿", "draft")
+    session.commit()
+
+    assert load_checkpoint_map(session, "task-1", PLAN) == {
+        0: [PLAN[0], "搜索", "sources"],
+        2: [PLAN[2], "修订", "final"],
+    }
+
+
+def test_clear_checkpoints_only_affects_task(session):
+    """测试清除检查点只影响指定任务"""
+    save_checkpoint(session, "task-1", 0, PLAN[0], "搜索", "a")
+    save_checkpoint(session, "task-2", 0, PLAN[0], "搜索", "b")
+    session.commit()
+
+    assert clear_checkpoints(session, "task-1") == 1
+    session.commit()
+
+    assert load_checkpoint_map(session, "task-1", PLAN) == {}
+    assert load_checkpoint_map(session, "task-2", PLAN) == {0: [PLAN[0], "搜索", "b"]}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
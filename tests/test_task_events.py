@@ -0,0 +1,86 @@
+"""
+单元测试 - 任务事件表
+
+测试范围:
+- 追加事件与序号分配
+- 按游标读取
+- 清除事件
+（使用 SQLite 内存数据库，不依赖 Postgres）
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.task_events import EventBase, append_event, clear_events, fetch_events
+
+
+@pytest.fixture
+def session():
+    """SQLite 内存数据库会话"""
+    engine = create_engine("sqlite://", future=True)
+    EventBase.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_append_event_assigns_monotonic_seq(session):
+    """测试序号从 1 开始单调递增，并记录在 progress 中"""
+    progress = {"completedSteps": 0}
+
+    first = append_event(session, "task-1", progress, "start", "Research started", {"prompt": "AI"})
+    second = append_event(session, "task-1", progress, "plan", "Plan generated", {"steps": ["a", "b"]})
+    session.commit()
+
+    assert first["seq"] == 1
+    assert second["seq"] == 2
+    assert progress["lastEventSeq"] == 2
+    assert first["type"] == "start"
+    assert first["prompt"] == "AI"
+    assert first["timestamp"].endswith("Z")
+
+
+def test_fetch_events_by_cursor(session):
+    """测试按游标增量读取事件"""
+    progress = {}
+    for i in range(5):
+        append_event(session, "task-1", progress, "progress", f"step {i + 1}", {"step": i + 1})
+    append_event(session, "task-2", {}, "start", "other task")
+    session.commit()
+
+    all_events = fetch_events(session, "task-1")
+    newer = fetch_events(session, "task-1", after_seq=3)
+    limited = fetch_events(session, "task-1", after_seq=0, limit=2)
+
+    assert [e["seq"] for e in all_events] == [1, 2, 3, 4, 5]
+    assert [e["step"] for e in newer] == [4, 5]
+    assert [e["seq"] for e in limited] == [1, 2]
+
+
+def test_rollback_discards_events(session):
+    """测试事件与任务更新在同一事务中，回滚后一并丢弃"""
+    progress = {}
+    append_event(session, "task-1", progress, "start", "Research started")
+    session.commit()
+    append_event(session, "task-1", dict(progress), "plan", "Plan generated")
+    session.rollback()
+
+    assert [e["type"] for e in fetch_events(session, "task-1")] == ["start"]
+
+
+def test_clear_events(session):
+    """测试重新排队时清除事件"""
+    append_event(session, "task-1", {}, "start", "Research started")
+    append_event(session, "task-2", {}, "start", "Research started")
+    session.commit()
+
+    removed = clear_events(session, "task-1")
+    session.commit()
+
+    assert removed == 1
+    assert fetch_events(session, "task-1") == []
+    assert len(fetch_events(session, "task-2")) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
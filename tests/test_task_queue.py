@@ -0,0 +1,411 @@
+"""
+单元测试 - 研究任务队列
+
+测试范围:
+- 进程内队列的入队和认领
+- 认领超时
+- 租约持有（心跳线程）
+- 取消：移除排队任务、租约丢失时发出取消信号
+- 租约归属判断（丢失租约的 worker 不再写入任务）
+- 队列后端选择
+- Postgres 队列（需要 TEST_DATABASE_URL，未配置时跳过）:
+  并发认领（SKIP LOCKED）、租约超时重新排队、非持有者的心跳、租约丢失时取消执行、
+  被重新认领的任务不被原 worker 覆盖
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, text
+from src.cancellation import register_task, unregister_task
+from src.task_queue import (
+    LEASE_LOST,
+    MemoryTaskQueue,
+    PostgresTaskQueue,
+    create_task_queue,
+    holds_lease,
+)
+
+
+def test_memory_queue_claim_in_order():
+    """测试按入队顺序认领任务"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+
+    queue.enqueue("task-1", prompt="topic 1")
+    queue.enqueue("task-2", prompt="topic 2", model="deepseek:deepseek-chat")
+
+    first = queue.claim("worker-a")
+    second = queue.claim("worker-b")
+
+    assert first["task_id"] == "task-1"
+    assert first["worker_id"] == "worker-a"
+    assert second["task_id"] == "task-2"
+    assert second["model"] == "deepseek:deepseek-chat"
+    assert len(queue) == 0
+
+
+def test_memory_queue_claim_timeout():
+    """测试空队列认领超时返回 None"""
+    queue = MemoryTaskQueue()
+
+    start = time.monotonic()
+    item = queue.claim("worker-a", timeout=0.05)
+
+    assert item is None
+    assert time.monotonic() - start < 1
+
+
+def test_memory_queue_enqueue_wakes_waiting_worker():
+    """测试入队会唤醒阻塞中的 worker"""
+    queue = MemoryTaskQueue()
+    claimed = []
+
+    def _worker():
+        claimed.append(queue.claim("worker-a", timeout=5))
+
+    thread = threading.Thread(target=_worker)
+    thread.start()
+    time.sleep(0.05)
+    queue.enqueue("task-1")
+    thread.join(timeout=2)
+
+    assert claimed and claimed[0]["task_id"] == "task-1"
+
+
+def test_hold_sends_heartbeats():
+    """测试持有租约期间定期续约"""
+    beats = []
+
+    class _Queue(MemoryTaskQueue):
+        def heartbeat(self, task_id, worker_id):
+            beats.append((task_id, worker_id))
+            return True
+
+    queue = _Queue(heartbeat_interval=0.01)
+
+    with queue.hold({"task_id": "task-1", "worker_id": "worker-a"}):
+        time.sleep(0.1)
+
+    count = len(beats)
+    assert count >= 2
+    assert beats[0] == ("task-1", "worker-a")
+
+    # 退出后不再续约
+    time.sleep(0.05)
+    assert len(beats) == count
+
+
+def test_memory_queue_remove():
+    """测试取消时移除尚未认领的任务"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+    queue.enqueue("task-1")
+    queue.enqueue("task-2")
+
+    assert queue.remove("task-1") is True
+    assert queue.remove("task-1") is False
+    assert len(queue) == 1
+    assert queue.claim("worker-a")["task_id"] == "task-2"
+
+
+def test_hold_cancels_task_when_lease_lost():
+    """测试心跳失败（任务被取消或重新认领）时向本地执行发出取消信号"""
+
+    class _Queue(MemoryTaskQueue):
+        def heartbeat(self, task_id, worker_id):
+            return False
+
+    queue = _Queue(heartbeat_interval=0.01)
+    token = register_task("task-lost")
+    try:
+        with queue.hold({"task_id": "task-lost", "worker_id": "worker-a"}):
+            deadline = time.monotonic() + 1
+            while not token.cancelled and time.monotonic() < deadline:
+                time.sleep(0.01)
+    finally:
+        unregister_task("task-lost", token)
+
+    assert token.cancelled
+    assert token.reason == LEASE_LOST
+
+
+def test_create_task_queue_memory():
+    """测试创建进程内队列"""
+    queue = create_task_queue(backend="memory")
+
+    assert isinstance(queue, MemoryTaskQueue)
+
+
+def test_create_task_queue_postgres_requires_engine():
+    """测试 Postgres 队列必须提供 engine"""
+    with pytest.raises(ValueError):
+        create_task_queue(engine=None, backend="postgres")
+
+
+def test_create_task_queue_postgres():
+    """测试创建 Postgres 队列（不连接数据库）"""
+    engine = object()
+
+    queue = create_task_queue(engine=engine, backend="postgres")
+
+    assert isinstance(queue, PostgresTaskQueue)
+    assert queue.engine is engine
+
+
+def test_create_task_queue_unknown_backend():
+    """测试未知后端抛出异常"""
+    with pytest.raises(ValueError):
+        create_task_queue(backend="redis")
+
+
+def test_queue_config_from_env(monkeypatch):
+    """测试从环境变量读取队列配置"""
+    monkeypatch.setenv("TASK_VISIBILITY_TIMEOUT", "90")
+    monkeypatch.setenv("TASK_MAX_ATTEMPTS", "5")
+
+    queue = MemoryTaskQueue()
+
+    assert queue.visibility_timeout == 90
+    assert queue.heartbeat_interval == 30
+    assert queue.max_attempts == 5
+
+
+# ---------------------------------------------------------------------------
+# Postgres 队列（真实数据库）
+# ---------------------------------------------------------------------------
+
+_RESEARCH_TASKS_DDL = """
+CREATE TABLE research_tasks (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    task_id varchar UNIQUE NOT NULL,
+    topic text,
+    status varchar NOT NULL DEFAULT 'queued',
+    progress jsonb,
+    report text,
+    queue_info jsonb,
+    started_at timestamp,
+    completed_at timestamp,
+    failed_at timestamp,
+    created_at timestamp DEFAULT timezone('utc', now()),
+    updated_at timestamp DEFAULT timezone('utc', now())
+)
+"""
+
+
+@pytest.fixture
+def pg_engine():
+    """在独立 schema 中创建 research_tasks 表（测试结束后删除）"""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("未配置 TEST_DATABASE_URL")
+    pytest.importorskip("psycopg2")
+    schema = f"test_queue_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(
+        url, connect_args={"options": f"-csearch_path={schema}"}, pool_size=10
+    )
+    with engine.begin() as conn:
+        conn.execute(text(_RESEARCH_TASKS_DDL))
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+def _insert_tasks(engine, queue, count):
+    """插入并入队 count 个任务"""
+    task_ids = [f"task-{i}" for i in range(count)]
+    with engine.begin() as conn:
+        for task_id in task_ids:
+            conn.execute(
+                text("INSERT INTO research_tasks (task_id, status) VALUES (:task_id, 'pending')"),
+                {"task_id": task_id},
+            )
+    for task_id in task_ids:
+        queue.enqueue(task_id, prompt=f"topic {task_id}")
+    return task_ids
+
+
+def test_holds_lease():
+    """测试只有记录在 queue_info 中且任务仍在执行（或已取消）时才持有租约"""
+    queue_info = {"workerId": "worker-a"}
+
+    assert holds_lease("running", queue_info, "worker-a") is True
+    # 被取消的任务仍属于原 worker（写入取消事件）
+    assert holds_lease("cancelled", queue_info, "worker-a") is True
+    # 租约超时后重新排队，或尝试次数耗尽被标记为失败
+    assert holds_lease("queued", queue_info, "worker-a") is False
+    assert holds_lease("failed", queue_info, "worker-a") is False
+    # 由其他 worker 重新认领
+    assert holds_lease("running", {"workerId": "worker-b"}, "worker-a") is False
+    assert holds_lease("running", None, "worker-a") is False
+
+
+def _task_row(engine, task_id):
+    with engine.begin() as conn:
+        return conn.execute(
+            text("SELECT status, queue_info FROM research_tasks WHERE task_id = :task_id"),
+            {"task_id": task_id},
+        ).one()
+
+
+def _expire_lease(engine, task_id):
+    """把租约的最后续期时间改到一小时前（模拟 worker 崩溃）"""
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE research_tasks SET updated_at = timezone('utc', now()) - interval '1 hour' "
+                "WHERE task_id = :task_id"
+            ),
+            {"task_id": task_id},
+        )
+
+
+def test_postgres_concurrent_claims_are_exclusive(pg_engine):
+    """测试多个 worker 同时认领：每个任务只被认领一次，全部任务都被认领"""
+    queue = PostgresTaskQueue(pg_engine, poll_interval=0, visibility_timeout=3600)
+    task_ids = _insert_tasks(pg_engine, queue, 20)
+    barrier = threading.Barrier(6)
+
+    def _worker(index):
+        barrier.wait()
+        claimed = []
+        while True:
+            item = queue.claim(f"worker-{index}", timeout=0)
+            if item is None:
+                return claimed
+            claimed.append(item["task_id"])
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(_worker, range(6)))
+
+    claimed = [task_id for worker_claims in results for task_id in worker_claims]
+    assert sorted(claimed) == sorted(task_ids)
+    status, queue_info = _task_row(pg_engine, task_ids[0])
+    assert status == "running"
+    assert queue_info["attempts"] == 1
+    assert queue_info["workerId"].startswith("worker-")
+
+
+def test_postgres_expired_lease_is_requeued(pg_engine):
+    """测试租约超时的任务重新排队，由其他 worker 认领；尝试次数耗尽时标记为失败"""
+    queue = PostgresTaskQueue(
+        pg_engine, poll_interval=0, visibility_timeout=60, max_attempts=2
+    )
+    (task_id,) = _insert_tasks(pg_engine, queue, 1)
+    assert queue.claim("worker-a", timeout=0)["task_id"] == task_id
+
+    # 租约未超时时不重新排队
+    assert queue.requeue_expired() == []
+
+    _expire_lease(pg_engine, task_id)
+    assert queue.requeue_expired() == [task_id]
+    status, queue_info = _task_row(pg_engine, task_id)
+    assert status == "queued"
+    assert queue_info["lastError"] == "visibility timeout expired"
+
+    item = queue.claim("worker-b", timeout=0)
+    assert item["task_id"] == task_id
+    assert item["attempt"] == 2
+    # 原 worker 已失去租约
+    assert queue.heartbeat(task_id, "worker-a") is False
+    assert queue.heartbeat(task_id, "worker-b") is True
+
+    _expire_lease(pg_engine, task_id)
+    assert queue.requeue_expired() == [task_id]
+    assert _task_row(pg_engine, task_id).status == "failed"
+    assert queue.claim("worker-c", timeout=0) is None
+
+
+def test_postgres_heartbeat_requires_ownership(pg_engine):
+    """测试只有持有任务的 worker 能续约，任务被取消后续约失败"""
+    queue = PostgresTaskQueue(pg_engine, poll_interval=0, visibility_timeout=3600)
+    (task_id,) = _insert_tasks(pg_engine, queue, 1)
+    queue.claim("worker-a", timeout=0)
+
+    assert queue.heartbeat(task_id, "worker-a") is True
+    assert queue.heartbeat(task_id, "worker-b") is False
+
+    with pg_engine.begin() as conn:
+        conn.execute(
+            text("UPDATE research_tasks SET status = 'cancelled' WHERE task_id = :task_id"),
+            {"task_id": task_id},
+        )
+    assert queue.heartbeat(task_id, "worker-a") is False
+
+
+def test_postgres_hold_cancels_when_lease_taken_over(pg_engine):
+    """测试租约被其他 worker 接管后，原 worker 的心跳线程取消本地执行"""
+    queue = PostgresTaskQueue(
+        pg_engine, poll_interval=0, visibility_timeout=60, heartbeat_interval=0.05
+    )
+    (task_id,) = _insert_tasks(pg_engine, queue, 1)
+    item = queue.claim("worker-a", timeout=0)
+    # worker-a 停顿超过可见性超时，任务被重新排队并由 worker-b 认领
+    _expire_lease(pg_engine, task_id)
+    queue.requeue_expired()
+    assert queue.claim("worker-b", timeout=0)["task_id"] == task_id
+    token = register_task(task_id)
+    try:
+        with queue.hold(item):
+            deadline = time.monotonic() + 5
+            while not token.cancelled and time.monotonic() < deadline:
+                time.sleep(0.01)
+    finally:
+        unregister_task(task_id, token)
+
+    assert token.cancelled
+    assert token.reason == LEASE_LOST
+    assert _task_row(pg_engine, task_id).queue_info["workerId"] == "worker-b"
+
+
+def test_postgres_reclaimed_task_not_overwritten_by_lost_worker(pg_engine):
+    """测试丢失租约的 worker 在锁定的行上检查归属后放弃写入，新 worker 的状态保持不变"""
+    queue = PostgresTaskQueue(pg_engine, poll_interval=0, visibility_timeout=60)
+    (task_id,) = _insert_tasks(pg_engine, queue, 1)
+    queue.claim("worker-a", timeout=0)
+
+    def _flush_terminal(worker_id, status):
+        """按 flush_task_update 的方式写入终态：锁定行，只有持有租约时才写入"""
+        with pg_engine.begin() as conn:
+            row = conn.execute(
+                text(
+                    "SELECT status, queue_info FROM research_tasks "
+                    "WHERE task_id = :task_id FOR UPDATE"
+                ),
+                {"task_id": task_id},
+            ).one()
+            if not holds_lease(row.status, row.queue_info, worker_id):
+                return False
+            conn.execute(
+                text("UPDATE research_tasks SET status = :status WHERE task_id = :task_id"),
+                {"status": status, "task_id": task_id},
+            )
+            return True
+
+    # 重新排队后、被认领前，原 worker 同样不能写入
+    _expire_lease(pg_engine, task_id)
+    queue.requeue_expired()
+    assert _flush_terminal("worker-a", "cancelled") is False
+    assert _task_row(pg_engine, task_id).status == "queued"
+
+    assert queue.claim("worker-b", timeout=0)["task_id"] == task_id
+    assert _flush_terminal("worker-a", "failed") is False
+    status, queue_info = _task_row(pg_engine, task_id)
+    assert status == "running"
+    assert queue_info["workerId"] == "worker-b"
+
+    assert _flush_terminal("worker-b", "completed") is True
+    assert _task_row(pg_engine, task_id).status == "completed"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
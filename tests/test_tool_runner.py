@@ -0,0 +1,201 @@
+"""
+单元测试 - 工具执行循环
+
+测试范围:
+- 工具定义生成
+- 同一轮工具调用并发执行并保持顺序
+- 单个工具超时和错误
+- 多轮工具调用循环
+- 任务取消时停止等待工具和后续轮次
+"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from src.cancellation import CancellationToken, TaskCancelledError, cancellation_scope
+from src.tool_runner import build_tool_specs, execute_tool_calls, run_tool_loop
+
+
+def slow_echo(text: str, delay: float = 0.0) -> dict:
+    """
+    返回输入文本
+
+    Args:
+        text: 输入文本
+        delay: 延迟秒数
+    """
+    time.sleep(delay)
+    return {"echo": text}
+
+
+def _tool_call(call_id, name, args):
+    return SimpleNamespace(
+        id=call_id,
+        function=SimpleNamespace(name=name, arguments=json.dumps(args)),
+    )
+
+
+def _response(content=None, tool_calls=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_build_tool_specs():
+    """测试生成 OpenAI 格式的工具定义"""
+    specs = build_tool_specs([slow_echo])
+
+    assert specs[0]["type"] == "function"
+    assert specs[0]["function"]["name"] == "slow_echo"
+    assert "text" in specs[0]["function"]["parameters"]["properties"]
+
+
+def test_execute_tool_calls_concurrently_in_order():
+    """测试工具调用并发执行且结果保持原始顺序"""
+    calls = [
+        _tool_call("a", "slow_echo", {"text": "first", "delay": 0.2}),
+        _tool_call("b", "slow_echo", {"text": "second", "delay": 0.1}),
+        _tool_call("c", "slow_echo", {"text": "third", "delay": 0.2}),
+    ]
+
+    start = time.monotonic()
+    messages = execute_tool_calls(calls, {"slow_echo": slow_echo}, timeout=5)
+    elapsed = time.monotonic() - start
+
+    # 并发执行：总耗时约等于最慢的工具
+    assert elapsed < 0.45
+    assert [m["tool_call_id"] for m in messages] == ["a", "b", "c"]
+    assert [json.loads(m["content"])["echo"] for m in messages] == ["first", "second", "third"]
+    assert all(m["role"] == "tool" for m in messages)
+
+
+def test_execute_tool_calls_timeout():
+    """测试单个工具超时不影响其他工具"""
+    calls = [
+        _tool_call("a", "slow_echo", {"text": "slow", "delay": 1.0}),
+        _tool_call("b", "slow_echo", {"text": "fast"}),
+    ]
+
+    start = time.monotonic()
+    messages = execute_tool_calls(calls, {"slow_echo": slow_echo}, timeout=0.1)
+
+    assert time.monotonic() - start < 0.5
+    assert "超时" in json.loads(messages[0]["content"])["error"]
+    assert json.loads(messages[1]["content"]) == {"echo": "fast"}
+
+
+def test_execute_tool_calls_errors():
+    """测试未知工具和工具异常以错误结果返回"""
+    def broken(**kwargs):
+        raise RuntimeError("boom")
+
+    calls = [
+        _tool_call("a", "missing_tool", {}),
+        _tool_call("b", "broken", {}),
+    ]
+
+    messages = execute_tool_calls(calls, {"broken": broken}, timeout=1)
+
+    assert "missing_tool" in json.loads(messages[0]["content"])["error"]
+    assert json.loads(messages[1]["content"]) == {"error": "boom"}
+
+
+def test_run_tool_loop_multiple_turns():
+    """测试多轮工具调用直到模型给出最终回答"""
+    responses = [
+        _response(tool_calls=[
+            _tool_call("a", "slow_echo", {"text": "x"}),
+            _tool_call("b", "slow_echo", {"text": "y"}),
+        ]),
+        _response(content="final answer"),
+    ]
+    sent = []
+
+    def create(model, messages, **kwargs):
+        sent.append((list(messages), kwargs))
+        return responses.pop(0)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    messages = [{"role": "user", "content": "hi"}]
+
+    resp = run_tool_loop(
+        client, "deepseek:deepseek-chat", messages, [slow_echo], max_turns=5, temperature=0
+    )
+
+    assert resp.choices[0].message.content == "final answer"
+    assert len(resp.intermediate_responses) == 1
+    # 助手消息 + 2 条工具消息 + 最终助手消息
+    assert len(resp.choices[0].intermediate_messages) == 4
+    # 第二次调用包含工具结果
+    assert [m["tool_call_id"] for m in sent[1][0][2:]] == ["a", "b"]
+    assert sent[0][1]["tools"][0]["function"]["name"] == "slow_echo"
+    assert "max_turns" not in sent[0][1]
+
+
+def test_run_tool_loop_stops_at_max_turns():
+    """测试达到 max_turns 后返回最后一次响应"""
+    def create(model, messages, **kwargs):
+        return _response(tool_calls=[_tool_call("a", "slow_echo", {"text": "x"})])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    resp = run_tool_loop(client, "deepseek:deepseek-chat", [], [slow_echo], max_turns=2)
+
+    assert len(resp.intermediate_responses) == 1
+    assert resp.choices[0].message.tool_calls
+
+
+def test_execute_tool_calls_stops_waiting_when_cancelled(monkeypatch):
+    """测试任务取消后不再等待执行中的工具"""
+    monkeypatch.setenv("CANCEL_POLL_INTERVAL", "0.01")
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+
+    start = time.monotonic()
+    with cancellation_scope(token):
+        with pytest.raises(TaskCancelledError):
+            execute_tool_calls(
+                [_tool_call("a", "slow_echo", {"text": "x", "delay": 0.5})],
+                {"slow_echo": slow_echo},
+                timeout=5,
+            )
+    assert time.monotonic() - start < 0.4
+
+
+def test_run_tool_loop_checks_cancel_between_turns():
+    """测试工具调用之后取消，不再发起下一轮模型调用"""
+    token = CancellationToken()
+    calls = []
+
+    def cancelling_echo(text: str) -> dict:
+        """
+        返回输入文本并取消任务
+
+        Args:
+            text: 输入文本
+        """
+        token.cancel("user")
+        return {"echo": text}
+
+    def create(model, messages, **kwargs):
+        calls.append(kwargs)
+        return _response(tool_calls=[_tool_call("a", "cancelling_echo", {"text": "x"})])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    with cancellation_scope(token):
+        with pytest.raises(TaskCancelledError):
+            run_tool_loop(
+                client,
+                "deepseek:deepseek-chat",
+                [{"role": "user", "content": "hi"}],
+                [cancelling_echo],
+                max_turns=5,
+            )
+    assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
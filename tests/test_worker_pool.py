@@ -0,0 +1,141 @@
+"""
+单元测试 - ResearchWorkerPool worker 池
+
+测试范围:
+- 并发执行任务
+- worker ID 记录
+- 停止时等待执行中的任务
+"""
+
+import threading
+import time
+
+import pytest
+from src.task_queue import MemoryTaskQueue
+from src.worker_pool import ResearchWorkerPool
+
+
+def test_pool_runs_tasks_concurrently():
+    """测试多个 worker 同时执行任务"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+    barrier = threading.Barrier(3, timeout=2)
+    done = []
+
+    def handler(item):
+        # 只有 3 个任务同时在执行时 barrier 才会放行
+        barrier.wait()
+        done.append(item["task_id"])
+
+    pool = ResearchWorkerPool(queue, handler, size=3)
+    for i in range(3):
+        queue.enqueue(f"task-{i}")
+    pool.start()
+
+    deadline = time.monotonic() + 2
+    while len(done) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert pool.stop(drain_timeout=1)
+    assert sorted(done) == ["task-0", "task-1", "task-2"]
+
+
+def test_pool_records_worker_id():
+    """测试队列项携带唯一的 worker ID"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+    seen = []
+
+    pool = ResearchWorkerPool(queue, lambda item: seen.append(item["worker_id"]), size=2)
+    queue.enqueue("task-1")
+    pool.start()
+
+    deadline = time.monotonic() + 2
+    while not seen and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.stop(drain_timeout=1)
+
+    assert len(seen) == 1
+    assert "ResearchWorker-" in seen[0]
+    assert seen[0].count(":") == 2
+
+
+def test_pool_stop_drains_running_task():
+    """测试停止时等待执行中的任务完成"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+    started = threading.Event()
+    finished = []
+
+    def handler(item):
+        started.set()
+        time.sleep(0.1)
+        finished.append(item["task_id"])
+
+    pool = ResearchWorkerPool(queue, handler, size=1)
+    queue.enqueue("task-1")
+    pool.start()
+    assert started.wait(timeout=2)
+
+    assert pool.stop(drain_timeout=2)
+    assert finished == ["task-1"]
+    assert not pool.is_running()
+
+
+def test_pool_stop_timeout_reports_unfinished():
+    """测试排空超时返回 False"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(item):
+        started.set()
+        release.wait(timeout=2)
+
+    pool = ResearchWorkerPool(queue, handler, size=1)
+    queue.enqueue("task-1")
+    pool.start()
+    assert started.wait(timeout=2)
+
+    assert pool.stop(drain_timeout=0.05) is False
+    assert list(pool.active_tasks().values()) == ["task-1"]
+    release.set()
+
+
+def test_pool_survives_handler_error():
+    """测试处理函数异常不会导致 worker 退出"""
+    queue = MemoryTaskQueue(poll_interval=0.01)
+    done = []
+
+    def handler(item):
+        if item["task_id"] == "bad":
+            raise RuntimeError("boom")
+        done.append(item["task_id"])
+
+    pool = ResearchWorkerPool(queue, handler, size=1)
+    queue.enqueue("bad")
+    queue.enqueue("good")
+    pool.start()
+
+    deadline = time.monotonic() + 2
+    while not done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.stop(drain_timeout=1)
+
+    assert done == ["good"]
+
+
+def test_pool_size_from_env(monkeypatch):
+    """测试从环境变量读取 worker 数量"""
+    monkeypatch.setenv("RESEARCH_WORKER_CONCURRENCY", "5")
+
+    pool = ResearchWorkerPool(MemoryTaskQueue(), lambda item: None)
+
+    assert pool.size == 5
+
+
+def test_pool_invalid_size():
+    """测试非法的 worker 数量"""
+    with pytest.raises(ValueError):
+        ResearchWorkerPool(MemoryTaskQueue(), lambda item: None, size=0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])